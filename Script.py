@@ -80,6 +80,8 @@ class script(object):
 ├⋟ ᴜᴘᴛɪᴍᴇ ⋟ {}
 ├⋟ ʀᴀᴍ ⋟ <code>{}%</code>
 ├⋟ ᴄᴘᴜ ⋟ <code>{}%</code>   
+├⋟ sᴇᴀʀᴄʜ ᴄᴀᴄʜᴇ ⋟ <code>{}</code>
+├⋟ ᴄʜᴜɴᴋ ᴄᴀᴄʜᴇ ⋟ <code>{}</code>
 │
 ├⋟ ʙᴏᴛʜ ᴅʙ ꜰɪʟᴇ'ꜱ: <code>{}</code>
 │
@@ -99,6 +101,8 @@ class script(object):
 ├⋟ ᴜᴘᴛɪᴍᴇ ⋟ {}
 ├⋟ ʀᴀᴍ ⋟ <code>{}%</code>
 ├⋟ ᴄᴘᴜ ⋟ <code>{}%</code>   
+├⋟ sᴇᴀʀᴄʜ ᴄᴀᴄʜᴇ ⋟ <code>{}</code>
+├⋟ ᴄʜᴜɴᴋ ᴄᴀᴄʜᴇ ⋟ <code>{}</code>
 │
 <b>╰─────────────────────⍟</b>"""
 
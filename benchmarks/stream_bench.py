@@ -0,0 +1,190 @@
+"""Streaming benchmark against a fake Telegram upstream.
+
+Serves an in-memory file through plugins/route.media_streamer on aiohttp's test
+server. upload.GetFile is answered by a fake media session with configurable
+latency, so no account or network is needed. Reports MB/s, time to first
+byte and chunk latency percentiles as seen by the HTTP clients.
+
+    python benchmarks/stream_bench.py --viewers 32 --latency-ms 80 --prefetch 1
+    python benchmarks/stream_bench.py --viewers 32 --latency-ms 80 --prefetch 4 --chunk-cache-mb 256
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# info.py resolves DATABASE_URI at import; nothing here talks to MongoDB.
+os.environ.setdefault("DATABASE_URI", "mongodb://localhost:27017")
+
+from types import SimpleNamespace
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from pyrogram import raw
+
+import plugins.route as route
+import dreamxbotz.util.custom_dl as custom_dl
+from dreamxbotz.Bot import work_loads
+from dreamxbotz.util.chunk_cache import ChunkCache
+from dreamxbotz.util.rate_limit import StreamLimits
+
+MB = 1024 * 1024
+MSG_ID = 1
+UNIQUE_ID = "AgADbench"
+
+
+class FakeMediaSession:
+    """Answers upload.GetFile from memory after latency +- jitter seconds."""
+
+    def __init__(self, data: bytes, latency: float, jitter: float):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+
+    async def send(self, query, *args, **kwargs):
+        self.requests += 1
+        await asyncio.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+        chunk = self.data[query.offset:query.offset + query.limit]
+        return raw.types.upload.File(type=raw.types.storage.FileUnknown(), mtime=0, bytes=chunk)
+
+
+def fake_streamer(session: FakeMediaSession, file_id) -> custom_dl.ByteStreamer:
+    streamer = custom_dl.ByteStreamer(object())
+
+    async def get_file_properties(msg_id):
+        return file_id
+
+    async def generate_media_session(client, file_id):
+        return session
+
+    async def get_location(file_id):
+        return None
+
+    streamer.get_file_properties = get_file_properties
+    streamer.generate_media_session = generate_media_session
+    streamer.get_location = get_location
+    return streamer
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def viewer(client: TestClient, size: int, range_bytes: int, requests: int, ttfb: list, gaps: list) -> int:
+    """Issues ranged GETs at random offsets, like a seeking player, and times every chunk."""
+    received = 0
+    for _ in range(requests):
+        start = random.randrange(0, max(1, size - range_bytes))
+        end = min(size, start + range_bytes) - 1
+        sent_at = time.perf_counter()
+        async with client.get(f"/{UNIQUE_ID[:6]}{MSG_ID}", headers={"Range": f"bytes={start}-{end}"}) as response:
+            if response.status not in (200, 206):
+                raise RuntimeError(f"HTTP {response.status}: {await response.text()}")
+            last = None
+            async for chunk in response.content.iter_chunked(MB):
+                now = time.perf_counter()
+                if last is None:
+                    ttfb.append(now - sent_at)
+                else:
+                    gaps.append(now - last)
+                last = now
+                received += len(chunk)
+            if last is None:
+                raise RuntimeError("empty response body")
+    return received
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    size = args.file_mb * MB
+    data = os.urandom(size)
+    file_id = SimpleNamespace(
+        unique_id=UNIQUE_ID, dc_id=2, media_id=1, file_size=size,
+        mime_type="video/mp4", file_name="bench.mp4", date=None,
+    )
+
+    custom_dl.STREAM_PREFETCH = args.prefetch
+    cache_dir = None
+    if args.chunk_cache_mb:
+        cache_dir = tempfile.TemporaryDirectory()
+        custom_dl.chunk_cache = ChunkCache(cache_dir.name, args.chunk_cache_mb * MB)
+    else:
+        custom_dl.chunk_cache = None
+
+    sessions = [FakeMediaSession(data, args.latency_ms / 1000, args.jitter_ms / 1000) for _ in range(args.bots)]
+    streamers = {index: fake_streamer(session, file_id) for index, session in enumerate(sessions)}
+    work_loads.clear()
+    work_loads.update({index: 0 for index in streamers})
+    route.get_streamer = streamers.__getitem__
+    route.PARALLEL_STREAM_CLIENTS = args.parallel
+    route.PARALLEL_STREAM_MIN_MB = 0
+    # The benchmark is one address opening many streams; keep the limiter out of it.
+    route.stream_limiter.limits = route.stream_limiter.premium_limits = StreamLimits()
+
+    app = web.Application()
+    app.add_routes(route.routes)
+    ttfb, gaps = [], []
+    async with TestClient(TestServer(app)) as client:
+        started = time.perf_counter()
+        received = await asyncio.gather(*[
+            viewer(client, size, args.range_mb * MB, args.requests, ttfb, gaps) for _ in range(args.viewers)
+        ])
+        elapsed = time.perf_counter() - started
+
+    if cache_dir is not None:
+        cache_dir.cleanup()
+    total = sum(received)
+    return {
+        "viewers": args.viewers,
+        "bots": args.bots,
+        "prefetch": args.prefetch,
+        "parallel": args.parallel,
+        "chunk_cache_mb": args.chunk_cache_mb,
+        "latency_ms": args.latency_ms,
+        "seconds": round(elapsed, 3),
+        "mb": round(total / MB, 1),
+        "mb_per_s": round(total / MB / elapsed, 2),
+        "ttfb_p50_ms": round(statistics.median(ttfb) * 1000, 1) if ttfb else 0.0,
+        "ttfb_p99_ms": round(percentile(ttfb, 99) * 1000, 1),
+        "chunk_p50_ms": round(statistics.median(gaps) * 1000, 2) if gaps else 0.0,
+        "chunk_p99_ms": round(percentile(gaps, 99) * 1000, 2),
+        "getfile_requests": sum(session.requests for session in sessions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, default=16, help="concurrent HTTP clients")
+    parser.add_argument("--requests", type=int, default=4, help="range requests per viewer")
+    parser.add_argument("--range-mb", type=int, default=8, help="size of each range request")
+    parser.add_argument("--file-mb", type=int, default=64, help="size of the served file")
+    parser.add_argument("--bots", type=int, default=1, help="fake clients (MULTI_TOKEN bots)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="GetFile latency")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="GetFile latency jitter")
+    parser.add_argument("--prefetch", type=int, default=custom_dl.STREAM_PREFETCH, help="STREAM_PREFETCH")
+    parser.add_argument("--parallel", type=int, default=1, help="PARALLEL_STREAM_CLIENTS")
+    parser.add_argument("--chunk-cache-mb", type=int, default=0, help="CHUNK_CACHE_SIZE_MB (0 = off)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the result as one JSON line")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        width = max(map(len, result))
+        for key, value in result.items():
+            print(f"{key.ljust(width)}  {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,15 +10,16 @@ import asyncio
 from datetime import date, datetime
 import pytz
 from aiohttp import web
-from database.ia_filterdb import Media, Media2
+from database.ia_filterdb import ensure_media_indexes, backfill_all_media_info, router
 from database.users_chats_db import db
 from info import *
 from utils import temp
 from Script import script
 from plugins import web_server, check_expired_premium, keep_alive
-from dreamxbotz.Bot import dreamxbotz
+from dreamxbotz.Bot import dreamxbotz, multi_clients
 from dreamxbotz.util.keepalive import ping_server
 from dreamxbotz.Bot.clients import initialize_clients
+from dreamxbotz.util.media_sessions import keep_media_sessions
 from PIL import Image
 Image.MAX_IMAGE_PIXELS = 500_000_000
 
@@ -43,6 +44,7 @@ async def dreamxbotz_start():
     bot_info = await dreamxbotz.get_me()
     dreamxbotz.username = bot_info.username
     await initialize_clients()
+    asyncio.create_task(keep_media_sessions(list(multi_clients.values()), MEDIA_SESSION_DCS, MEDIA_SESSION_HEALTH_INTERVAL))
     for name in files:
         with open(name) as a:
             patt = Path(a.name)
@@ -59,10 +61,11 @@ async def dreamxbotz_start():
     b_users, b_chats = await db.get_banned()
     temp.BANNED_USERS = b_users
     temp.BANNED_CHATS = b_chats
-    await Media.ensure_indexes()
+    await ensure_media_indexes()
+    # Files saved before the structured fields existed, in the background.
+    asyncio.create_task(backfill_all_media_info())
     if MULTIPLE_DB:
-        await Media2.ensure_indexes()
-        print("Multiple Database Mode On. Now Files Will Be Save In Second DB If First DB Is Full")
+        print(f"Multiple Database Mode On. Files Are Spread Over {len(router.shards)} Databases ({SHARD_PLACEMENT} placement)")
     else:
         print("Single DB Mode On ! Files Will Be Save In First Database")
     me = await dreamxbotz.get_me()
@@ -1,16 +1,22 @@
 import logging
-from struct import pack
+from struct import pack, unpack
 import re
 import base64
+import heapq
 from pyrogram.file_id import FileId
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from collections import defaultdict
-from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from umongo import Instance, Document, fields
 from motor.motor_asyncio import AsyncIOMotorClient
 from marshmallow import ValidationError
 from info import *
 from utils import get_settings, save_group_settings
+from dreamxbotz.util.ttl_cache import TTLCache
+from dreamxbotz.util.media_info import MEDIA_INFO_VERSION, media_facets
+from database.media_router import MediaRouter, Shard
 from datetime import datetime, timedelta
 import logging
 import asyncio
@@ -19,8 +25,16 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 # ---------------------------------------------------------
 
-# Global cache for DB size
-_db_stats_cache = {"timestamp": None, "primary_size": 0.0}
+# Search results cache. Writes clear it and bump the version, so a search
+# that was already running during a write does not store a stale page.
+# Both are process-local: other replicas sharing the state backend keep their
+# pages until SEARCH_CACHE_TTL runs out.
+search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+# Per-query counts for the quality/language/season menus, cleared with search_cache.
+facet_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+# Totals reused by the "cached" count mode. Deliberately not cleared on writes.
+count_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_COUNT_TTL)
+_search_cache_version = 0
 
 # Primary DB
 client = AsyncIOMotorClient(DATABASE_URI)
@@ -33,17 +47,32 @@ db2 = client2[DATABASE_NAME]
 instance2 = Instance.from_db(db2)
 
 
-# Regex to flexibly extract Series Name, Season (SXX), and Episode (EYY)
-# This handles variations like S01E01, S1.EP01, Season 1 Episode 1, etc.
-EPISODE_REGEX = re.compile(
-    r'(.+?)[.\s\-_]?S(\d+)[.\s\-_]?(?:E|EP|Episode)[.\s\-_]?(\d+)',
-    re.IGNORECASE
+# Word tokens stored per document for the multikey `tokens` index.
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+# "s01e05" is also stored as "s01" and "e05" so season searches hit the index.
+EPISODE_TOKEN_PATTERN = re.compile(r"^(s\d{1,2})(ep?\d{1,3})$")
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# Structured fields parsed from the file name at index time (see media_facets).
+# Quality, language and season filters and episode grouping are equality
+# lookups on these instead of regex passes over every result.
+FACET_FIELDS = ("quality", "languages", "season")
+# Result filters also narrow down to one episode, from an episode group's header.
+FILTER_FIELDS = FACET_FIELDS + ("episode",)
+# file_id is unique per collection, so a racing insert_many reports the
+# repeat as a duplicate (code 11000) instead of storing it twice. Sparse so
+# documents saved without a file_id do not collide on null.
+FILE_ID_INDEX = {"key": ["file_id"], "unique": True, "sparse": True}
+MEDIA_INDEXES = (
+    "$file_name", "tokens",
+    ("series_key", "season", "episode"), "season", "quality", "languages", "media_info_v",
+    FILE_ID_INDEX,
 )
 
 # --- UMONGO Document Definitions ---
 
-@instance.register
-class Media(Document):
+class MediaTemplate(Document):
+    """Schema of an indexed file, registered once per backing database below."""
     file_id = fields.StrField(attribute="file_id")
     file_ref = fields.StrField(allow_none=True)
     file_name = fields.StrField(required=True)
@@ -51,152 +80,442 @@ class Media(Document):
     file_type = fields.StrField(allow_none=True)
     mime_type = fields.StrField(allow_none=True)
     caption = fields.StrField(allow_none=True)
+    tokens = fields.ListField(fields.StrField(), allow_none=True)
+    series_key = fields.StrField(allow_none=True)
+    season = fields.IntField(allow_none=True)
+    episode = fields.IntField(allow_none=True)
+    quality = fields.StrField(allow_none=True)
+    languages = fields.ListField(fields.StrField(), allow_none=True)
+    year = fields.IntField(allow_none=True)
+    media_info_v = fields.IntField(allow_none=True)
 
     class Meta:
-        indexes = ("$file_name",)
+        indexes = MEDIA_INDEXES
         collection_name = COLLECTION_NAME
 
 
-@instance2.register
-class Media2(Document):
-    file_id = fields.StrField(attribute="file_id")
-    file_ref = fields.StrField(allow_none=True)
-    file_name = fields.StrField(required=True)
-    file_size = fields.IntField(required=True)
-    file_type = fields.StrField(allow_none=True)
-    mime_type = fields.StrField(allow_none=True)
-    caption = fields.StrField(allow_none=True)
+Media = instance.register(MediaTemplate)
+Media2 = instance2.register(MediaTemplate)
+
+
+def build_router() -> MediaRouter:
+    """
+    The file databases: DATABASE_URI, then with MULTIPLE_DB DATABASE_URI2 and
+    every EXTRA_DATABASE_URIS entry. Media and Media2 stay the first two.
+    """
+    shards = [Shard("Primary", db, Media)]
+    if MULTIPLE_DB:
+        shards.append(Shard("Secondary", db2, Media2))
+        for number, uri in enumerate(EXTRA_DATABASE_URIS, start=3):
+            extra_db = AsyncIOMotorClient(uri)[DATABASE_NAME]
+            shards.append(Shard(f"Database {number}", extra_db, Instance.from_db(extra_db).register(MediaTemplate)))
+    return MediaRouter(shards, SHARD_PLACEMENT, SHARD_SIZE_LIMIT_MB)
 
-    class Meta:
-        indexes = ("$file_name",)
-        collection_name = COLLECTION_NAME
 
-# --- Helper Functions for Series Grouping ---
+router = build_router()
 
-def extract_series_episode(filename: str) -> Optional[Dict[str, str]]:
+
+async def count_file_id_duplicates(collection) -> int:
+    """Number of file_ids stored more than once in a collection."""
+    rows = await collection.aggregate([
+        {"$match": {"file_id": {"$exists": True}}},
+        {"$group": {"_id": "$file_id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$count": "duplicates"},
+    ], allowDiskUse=True).to_list(length=1)
+    return rows[0]["duplicates"] if rows else 0
+
+
+async def ensure_media_indexes():
     """
-    Extracts Series Name, Season (SXX), and Episode (EYY) from a filename.
-    Returns: {'name': str, 'season': str, 'episode': str, 'id_key': str} or None
+    Creates the Media indexes on every shard. Collections filled before
+    file_id was unique may hold duplicates; such a shard keeps (or gets) a
+    plain file_id index, so lookups stay indexed, until /dedupe_files has
+    removed them. A plain index is only replaced once the unique one can build.
     """
-    match = EPISODE_REGEX.search(filename)
-    if match:
-        # Group 1: Series Name, clean up trailing separators
-        name = match.group(1).replace('.', ' ').replace('_', ' ').replace('-', ' ').strip()
-        
-        # Group 2: Season number (pad to 2 digits)
-        season = match.group(2).zfill(2)
-        
-        # Group 3: Episode number (pad to 2 digits)
-        episode = match.group(3).zfill(2)
-        
-        # The unique identifier key for grouping: NAME_SXXEYY
-        id_key = f"{name.upper().replace(' ', '_')}_S{season}E{episode}"
-        
-        return {
-            'name': name,
-            'season': season,
-            'episode': episode,
-            'id_key': id_key
-        }
-    return None
-
-
-async def group_media_by_episode(files: List[Media]) -> Dict[str, List[Media]]:
-    """
-    Groups a list of Media documents by their SXXEYY identifier.
-    Files with different resolutions (e.g., 720P, 1080P) but the same SXXEYY
-    will be in the same list. This fulfills the requirement to show all qualities.
-    
-    Returns: A dictionary where keys are 'SXX EYY' (e.g., 'S01 E01') 
-             and values are a list of Media objects for that episode.
-    """
-    grouped_results = defaultdict(list)
-    for file in files:
-        # NOTE: File name attribute is accessed directly on the umongo document
-        info = extract_series_episode(file.file_name) 
-        if info:
-            # Group by SXX EYY for user-friendly display (e.g., 'S01 E01')
-            group_key = f"S{info['season']} E{info['episode']}"
-            grouped_results[group_key].append(file)
+    for shard in router.shards:
+        collection = shard.model.collection
+        try:
+            index = (await collection.index_information()).get("file_id_1")
+            if index and not index.get("unique"):
+                duplicates = await count_file_id_duplicates(collection)
+                if duplicates:
+                    logger.warning(f"{duplicates} file_ids are stored more than once on the {shard.name} DB, "
+                                   f"file_id stays a plain index until /dedupe_files is run.")
+                    await collection.create_indexes([
+                        index for index in shard.model.indexes if not index.document.get("unique")
+                    ])
+                    continue
+                await collection.drop_index("file_id_1")
+            await shard.model.ensure_indexes()
+        except OperationFailure as e:
+            logger.error(f"Could not create the Media indexes on the {shard.name} DB: {e}")
+            try:
+                # Duplicates kept the unique index from building.
+                await collection.create_index("file_id")
+                duplicates = await count_file_id_duplicates(collection)
+                if duplicates:
+                    logger.warning(f"{duplicates} file_ids are stored more than once on the {shard.name} DB, "
+                                   f"file_id stays a plain index until /dedupe_files is run.")
+            except OperationFailure as e:
+                logger.error(f"Could not index file_id on the {shard.name} DB: {e}")
+
+
+async def dedupe_media_files() -> int:
+    """
+    Deletes all but the oldest document of every file_id stored more than
+    once on a shard, then creates the unique file_id index. Returns the
+    number of documents deleted.
+    """
+    deleted = 0
+    for model in media_models():
+        cursor = model.collection.aggregate([
+            {"$match": {"file_id": {"$exists": True}}},
+            {"$group": {"_id": "$file_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        async for group in cursor:
+            result = await model.collection.delete_many({"_id": {"$in": sorted(group["ids"])[1:]}})
+            deleted += result.deleted_count
+    if deleted:
+        invalidate_search_cache()
+    await ensure_media_indexes()
+    return deleted
+
+# --- Helper Functions for Token Search ---
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Splits text into normalized (lowercase, de-duplicated) word tokens.
+    Separators such as dots, dashes and underscores never end up in a token.
+    """
+    if not text:
+        return []
+    text = HTML_TAG_PATTERN.sub(" ", text)
+    tokens = set(TOKEN_PATTERN.findall(text.lower()))
+    for token in list(tokens):
+        match = EPISODE_TOKEN_PATTERN.match(token)
+        if match:
+            tokens.update(match.groups())
+    return sorted(tokens)
+
+
+def media_tokens(file_name: Optional[str], caption: Optional[str] = None) -> List[str]:
+    """Tokens stored on a Media document; captions only count when they are searched."""
+    if USE_CAPTION_FILTER and caption:
+        return sorted(set(tokenize(file_name)) | set(tokenize(caption)))
+    return tokenize(file_name)
+
+
+def build_token_filter(query) -> Optional[dict]:
+    """
+    Builds a filter on the `tokens` index. Every word of a phrase must be present,
+    so MongoDB resolves the query through the multikey index instead of a scan.
+    A list of phrases (season variations etc.) matches any one of them.
+    """
+    phrases = query if isinstance(query, list) else [query]
+    clauses = [{"tokens": {"$all": words}} for words in (tokenize(q) for q in phrases) if words]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def build_regex_filter(query) -> Optional[dict]:
+    """The original unanchored regex filter on file_name (and caption)."""
+    if isinstance(query, list):
+        # This part handles season searches etc., where you need to match any of the full phrases.
+        raw_pattern = '|'.join(re.escape(q.strip()) for q in query if q.strip())
+        if not raw_pattern:
+            return None
+        regex = re.compile(raw_pattern, re.IGNORECASE)
+    else:
+        query = query.strip()
+        if not query:
+            return None
+        # This is the key change for balancing speed and flexibility
+        if ' ' in query:
+            # For multi-word queries, allow spaces, dots, or hyphens between words.
+            # Use '.*?' to allow other characters in between
+            words = [re.escape(word) for word in query.split()]
+            raw_pattern = r'.*'.join(words)
         else:
-            # Group files that don't match the series/episode pattern separately
-            grouped_results['Other'].append(file)
-            
-    # Sort the episode keys numerically
-    sorted_groups = {}
-    
-    # Sort keys for SXX EYY (e.g., S01 E01, S01 E02, S02 E01...)
-    # The 'SXX EYY' format allows for lexicographical sorting which mostly works for standard series
-    episode_keys = sorted([k for k in grouped_results.keys() if k != 'Other'])
-    
-    for key in episode_keys:
-        sorted_groups[key] = grouped_results[key]
-        
-    if 'Other' in grouped_results and grouped_results['Other']:
-        sorted_groups['Other'] = grouped_results['Other']
-        
-    return sorted_groups
+            # For single-word queries, use word boundaries for accuracy.
+            raw_pattern = r"\b" + re.escape(query) + r"\b"
+        try:
+            # Compile the single, main regex pattern
+            regex = re.compile(raw_pattern, flags=re.IGNORECASE)
+        except re.error:
+            return None
+
+    if USE_CAPTION_FILTER:
+        return {"$or": [{"file_name": regex}, {"caption": regex}]}
+    return {"file_name": regex}
 
-# --- Database Operations ---
 
-async def check_db_size(db):
+def build_search_filter(query) -> Optional[dict]:
+    """
+    Search filter used by get_search_results. With TOKEN_SEARCH the token index
+    selects the candidates and the regex optionally runs as a post-filter on them.
+    """
+    regex_filter = build_regex_filter(query)
+    if not TOKEN_SEARCH:
+        return regex_filter
+    token_filter = build_token_filter(query)
+    if token_filter is None:
+        return regex_filter
+    if TOKEN_REGEX_FILTER and regex_filter is not None:
+        return {"$and": [token_filter, regex_filter]}
+    return token_filter
+
+# --- Helper Functions for Keyset Pagination ---
+
+def media_models() -> list:
+    """Backing Media collections, in the order results are merged."""
+    return router.models
+
+
+def encode_cursor(page: int, last_id, page_size: int) -> str:
+    """
+    Opaque continuation token for the next page: the page number and the last
+    `_id` shown. Results from every collection are merged in `_id` order, so a
+    single `_id` marks the position in all of them. Fits in callback data.
+    """
+    if not isinstance(last_id, ObjectId):
+        # Documents with non-ObjectId keys fall back to a plain skip offset.
+        return str(page * page_size)
+    raw = pack(">H", page) + last_id.binary
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(offset, page_size: int) -> Tuple[int, int, Optional[ObjectId]]:
+    """
+    Returns (page, skip, last_id) for an offset from callback data.
+    Plain integers are the legacy skip offsets of older result messages.
+    """
+    if isinstance(offset, int) or str(offset).isdigit():
+        offset = int(offset)
+        return offset // page_size, offset, None
     try:
-        now = datetime.utcnow()
-        cache_stale_by_time = _db_stats_cache["timestamp"] is None or (
-            now - _db_stats_cache["timestamp"] > timedelta(minutes=10)
-        )
-        refresh_if_size_threshold = _db_stats_cache["primary_size"] >= 10.0
-        if not cache_stale_by_time and not refresh_if_size_threshold:
-            return _db_stats_cache["primary_size"]
-        stats = await db.command("dbstats")
-        db_logical_size = stats["dataSize"]
-        db_index_size = stats["indexSize"]
-        db_logical_size_mb = db_logical_size / (1024 * 1024)
-        db_index_size_mb = db_index_size / (1024 * 1024)
-        db_size_mb = db_logical_size_mb + db_index_size_mb
-        _db_stats_cache["primary_size"] = db_size_mb
-        _db_stats_cache["timestamp"] = now
-        return db_size_mb
-    except Exception as e:
-        print(f"Error Checking Database Size: {e}")
-        return 0
+        raw = base64.urlsafe_b64decode(offset + "=" * (-len(offset) % 4))
+        return unpack(">H", raw[:2])[0], 0, ObjectId(raw[2:])
+    except Exception:
+        return 0, 0, None
 
 
-async def save_file(media):
-    """Save file in database, with detailed logging."""
+def cursor_page(offset, page_size: int) -> int:
+    """Zero-based page number encoded in an offset/cursor."""
+    return decode_cursor(offset, page_size)[0]
+
+
+def _id_sort_key(file):
+    # ObjectIds sort above other key types, as in MongoDB's BSON order.
+    return (isinstance(file.pk, ObjectId), file.pk)
+
+
+def merge_by_id(results: List[list], limit: int) -> list:
+    """Merges per-collection result lists that are each sorted by `_id` descending."""
+    merged = heapq.merge(*results, key=_id_sort_key, reverse=True)
+    return [file for _, file in zip(range(limit), merged)]
+
+def build_facet_filter(facets: Optional[dict]) -> Optional[dict]:
+    """Equality filter on the structured fields, e.g. {"quality": "720p", "season": 2}."""
+    clauses = {field: facets[field] for field in FILTER_FIELDS if facets and facets.get(field) is not None}
+    return clauses or None
+
+
+def facet_pipeline(filter_mongo: dict) -> list:
+    """One aggregation returning the match count and the count of every facet value."""
+    return [
+        {"$match": filter_mongo},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "quality": [{"$match": {"quality": {"$ne": None}}}, {"$sortByCount": "$quality"}],
+            "languages": [{"$unwind": "$languages"}, {"$sortByCount": "$languages"}],
+            "season": [{"$match": {"season": {"$ne": None}}}, {"$sortByCount": "$season"}],
+        }},
+    ]
+
+
+def merge_facet_counts(results: List[dict]) -> dict:
+    """
+    Adds up $facet results from several collections into
+    {"total": n, "quality": {"720p": n}, "languages": {...}, "season": {"1": n}}.
+    Values are str keys so the counts can be kept in any state backend.
+    """
+    counts = {"total": 0, **{field: defaultdict(int) for field in FACET_FIELDS}}
+    for result in results:
+        counts["total"] += sum(row["count"] for row in result.get("total", []))
+        for field in FACET_FIELDS:
+            for row in result.get(field, []):
+                counts[field][str(row["_id"])] += row["count"]
+    return {key: dict(value) if isinstance(value, defaultdict) else value for key, value in counts.items()}
+
+
+def is_series_search(counts: Optional[dict]) -> bool:
+    """Whether most matches carry a season, so the results are shown grouped by episode."""
+    if not counts or not counts.get("total"):
+        return False
+    return sum(counts.get("season", {}).values()) * 2 > counts["total"]
+
+
+def facet_total(counts: Optional[dict], facets: Optional[dict]) -> Optional[int]:
+    """Number of results for the selected facet, or None when the counts cannot tell."""
+    if not counts:
+        return None
+    selected = build_facet_filter(facets)
+    if selected is None:
+        return counts.get("total")
+    if len(selected) != 1:
+        return None
+    field, value = next(iter(selected.items()))
+    return counts.get(field, {}).get(str(value), 0)
+
+
+# Only what a result button needs; captions and tokens stay in the database.
+EPISODE_GROUP_PROJECTION = {"file_id": 1, "file_name": 1, "file_size": 1, "file_type": 1, "season": 1, "episode": 1}
+# Files of no episode, the "Other" group. Missing and null both count.
+OTHER_GROUP_FILTER = {"$or": [{"season": None}, {"episode": None}]}
+
+
+class EpisodeGroup(NamedTuple):
+    """One episode of a grouped series search; key is (season, episode), None for "Other"."""
+    key: Optional[Tuple[int, int]]
+    count: int
+    files: tuple
+
+    @property
+    def label(self) -> str:
+        return "Other" if self.key is None else f"S{self.key[0]:02} E{self.key[1]:02}"
+
+
+def episode_group_pipeline(filter_mongo: dict, skip: int, limit: int) -> list:
+    """
+    Counts matches per (season, episode), ordered by episode with the files
+    without one ("Other", _id None) last. Only a key and a count are held per
+    group, so memory and payload do not grow with the files per episode.
+    `total` is the number of groups, `page` the requested ones.
+    """
+    # Missing and null both compare below numbers.
+    is_episode = {"$and": [{"$gt": ["$season", None]}, {"$gt": ["$episode", None]}]}
+    return [
+        {"$match": filter_mongo},
+        {"$group": {
+            "_id": {"$cond": [is_episode, {"season": "$season", "episode": "$episode"}, None]},
+            "count": {"$sum": 1},
+        }},
+        {"$addFields": {"other": {"$eq": ["$_id", None]}}},
+        {"$sort": {"other": 1, "_id.season": 1, "_id.episode": 1}},
+        {"$facet": {
+            "total": [{"$count": "groups"}],
+            "page": [{"$skip": skip}, {"$limit": limit}],
+        }},
+    ]
+
+
+def episode_group_key(group_id) -> Optional[Tuple[int, int]]:
+    """(season, episode) of an aggregated group, None for "Other"."""
+    if not group_id:
+        return None
+    return group_id["season"], group_id["episode"]
+
+
+def episode_group_filter(filter_mongo: dict, key: Optional[Tuple[int, int]]) -> dict:
+    """The files of one episode group among the matches."""
+    group = OTHER_GROUP_FILTER if key is None else {"season": key[0], "episode": key[1]}
+    return {"$and": [filter_mongo, group]}
+
+
+class CappedCount(int):
+    """A total that stopped counting at the cap: it shows as "1000+" but still does arithmetic as 1000."""
+
+    def __str__(self):
+        return f"{int(self)}+"
+
+    def __format__(self, spec):
+        return str(self) if not spec else int.__format__(self, spec)
+
+
+async def count_search_results(filter_mongo: dict, count_key: tuple, mode: str = SEARCH_COUNT_MODE) -> int:
+    """
+    Total for a search in standard mode, see SEARCH_COUNT_MODE:
+    exact counts every match, capped stops at SEARCH_COUNT_CAP and returns a
+    CappedCount, cached reuses an earlier total or the facet aggregation's
+    before counting exactly once per SEARCH_COUNT_TTL.
+    count_key is (normalized query, file_type, facet filter items).
+    """
+    if mode == "cached":
+        cached = count_cache.get(count_key)
+        if cached is None:
+            cached = facet_total(facet_cache.get(count_key[:2]), dict(count_key[2]))
+        if cached is not None:
+            return cached
+    if mode == "capped":
+        counts = await asyncio.gather(*[
+            model.count_documents(filter_mongo, limit=SEARCH_COUNT_CAP + 1) for model in media_models()
+        ])
+        total = sum(counts)
+        return CappedCount(SEARCH_COUNT_CAP) if total > SEARCH_COUNT_CAP else total
+    total = sum(await asyncio.gather(*[model.count_documents(filter_mongo) for model in media_models()]))
+    if mode == "cached":
+        count_cache.set(count_key, total)
+    return total
+
+
+def invalidate_search_cache():
+    """Drops every cached search page; call after any write to the Media collections."""
+    global _search_cache_version
+    _search_cache_version += 1
+    search_cache.clear()
+    facet_cache.clear()
+
+
+def normalize_query(query):
+    """Cache key form of a query: lowercase with collapsed whitespace."""
+    if isinstance(query, list):
+        return tuple(" ".join(q.lower().split()) for q in query)
+    return " ".join(query.lower().split())
+
+# --- Database Operations ---
+
+def media_fields(media):
+    """Field values for a Media document built from a pyrogram media object."""
     file_id, file_ref = unpack_new_file_id(media.file_id)
     file_name = re.sub(
         r"[_\-\.#+$%^&*()!~`,;:\"'?/<>\[\]{}=|\\]", " ", str(media.file_name)
     )
     file_name = re.sub(r"\s+", " ", file_name).strip()
-    saveMedia = Media
-    target_db = "Primary"
-    if MULTIPLE_DB:
+    caption = media.caption.html if media.caption and INDEX_CAPTION else None
+    return dict(
+        file_id=file_id,
+        file_ref=file_ref,
+        file_name=file_name,
+        file_size=media.file_size,
+        file_type=media.file_type,
+        mime_type=media.mime_type,
+        caption=caption,
+        tokens=media_tokens(file_name, caption),
+        **media_facets(file_name, caption),
+    )
+
+
+async def save_file(media):
+    """Save file in database, with detailed logging."""
+    data = media_fields(media)
+    file_id, file_name = data["file_id"], data["file_name"]
+    shard = router.shards[0]
+    if len(router.shards) > 1:
         try:
-            # NOTE: count_documents is a method on the collection/model instance provided by motor/umongo
-            exists = await Media.count_documents({"file_id": file_id}, limit=1)
-            if exists:
-                logger.info(f"[SKIP] '{file_name}' already in Primary DB.")
+            if await router.existing([file_id]):
+                logger.info(f"[SKIP] '{file_name}' already in the database.")
                 return False, 0
-            primary_db_size = await check_db_size(db)
-            if primary_db_size >= 407:
-                saveMedia = Media2
-                target_db = "Secondary"
-                logger.warning("Switching to Secondary DB due to size threshold.")
+            shard = await router.place(file_id)
         except Exception as e:
             logger.error(
                 "Error during MULTIPLE_DB check; defaulting to primary DB.", exc_info=e
             )
+    target_db = shard.name
     try:
-        record = saveMedia(
-            file_id=file_id,
-            file_ref=file_ref,
-            file_name=file_name,
-            file_size=media.file_size,
-            file_type=media.file_type,
-            mime_type=media.mime_type,
-            caption=(media.caption.html if media.caption and INDEX_CAPTION else None),
-        )
+        record = shard.model(**data)
     except ValidationError as e:
         logger.exception(f"[VALIDATION ERROR] '{file_name}' → {e}")
         return False, 2
@@ -212,11 +531,98 @@ async def save_file(media):
             f"[ERROR] Failed commit of '{file_name}' to {target_db} DB.", exc_info=e
         )
         return False, 3
+    router.remember(file_id, shard)
+    invalidate_search_cache()
     logger.info(f"[SUCCESS] '{file_name}' saved to {target_db} DB.")
     return True, 1
 
 
-async def get_search_results(chat_id, query, file_type=None, max_results=None, filter=False, offset=0):
+async def save_files(medias, invalidate=True):
+    """Save a batch of files with one duplicate lookup and one unordered insert_many per shard.
+
+    Returns (saved, duplicates, errors), the same counters save_file reports
+    one file at a time. Callers saving many batches in a row pass
+    invalidate=False and call invalidate_search_cache themselves.
+    """
+    saved = duplicates = errors = 0
+    docs = {}
+    for media in medias:
+        try:
+            data = media_fields(media)
+            # Validated through the model exactly like save_file does.
+            doc = Media(**data).to_mongo()
+        except ValidationError as e:
+            logger.error(f"[VALIDATION ERROR] '{getattr(media, 'file_name', None)}' → {e}")
+            errors += 1
+            continue
+        except Exception as e:
+            logger.exception("[ERROR] Could not read media for indexing.", exc_info=e)
+            errors += 1
+            continue
+        if data["file_id"] in docs:
+            duplicates += 1
+            continue
+        docs[data["file_id"]] = doc
+    if not docs:
+        return saved, duplicates, errors
+
+    for file_id in await router.existing(list(docs)):
+        docs.pop(file_id)
+        duplicates += 1
+    if not docs:
+        return saved, duplicates, errors
+
+    batches = defaultdict(list)
+    for file_id, doc in docs.items():
+        try:
+            shard = await router.place(file_id)
+        except Exception as e:
+            logger.error(
+                "Error during MULTIPLE_DB check; defaulting to primary DB.", exc_info=e
+            )
+            shard = router.shards[0]
+        batches[shard.name].append((shard, doc))
+    # Every shard's batch is one unordered insert_many, all of them in parallel.
+    results = await asyncio.gather(*[
+        insert_batch(batch[0][0], [doc for _, doc in batch]) for batch in batches.values()
+    ])
+    for shard_saved, shard_duplicates, shard_errors in results:
+        saved += shard_saved
+        duplicates += shard_duplicates
+        errors += shard_errors
+    if saved and invalidate:
+        invalidate_search_cache()
+    return saved, duplicates, errors
+
+
+async def insert_batch(shard: Shard, docs: List[dict]) -> Tuple[int, int, int]:
+    """insert_many into one shard; returns (saved, duplicates, errors)."""
+    saved = duplicates = errors = 0
+    failed = set()
+    try:
+        result = await shard.model.collection.insert_many(docs, ordered=False)
+        saved = len(result.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details or {}
+        saved = details.get("nInserted", 0)
+        for error in details.get("writeErrors", []):
+            failed.add(error.get("index"))
+            if error.get("code") == 11000:
+                duplicates += 1
+            else:
+                errors += 1
+    except Exception as e:
+        logger.exception(f"[ERROR] Failed bulk insert to {shard.name} DB.", exc_info=e)
+        return 0, 0, len(docs)
+    for index, doc in enumerate(docs):
+        if index not in failed:
+            router.remember(doc["file_id"], shard)
+    logger.info(f"[SUCCESS] {saved} files saved to {shard.name} DB in one batch.")
+    return saved, duplicates, errors
+
+
+async def resolve_max_results(chat_id, max_results=None) -> int:
+    """Page size from the group's max_btn setting unless one is given."""
     if chat_id is not None:
         settings = await get_settings(int(chat_id))
         if max_results is None:
@@ -227,119 +633,187 @@ async def get_search_results(chat_id, query, file_type=None, max_results=None, f
                 await save_group_settings(int(chat_id), "max_btn", True)
                 settings = await get_settings(int(chat_id))
                 max_results = 10 if settings.get("max_btn") else int(MAX_B_TN)
+    if max_results is None:
+        max_results = 10
+    return max_results
+
+
+async def get_search_results(chat_id, query, file_type=None, max_results=None, filter=False, offset=0, facets=None, total=None):
+    max_results = await resolve_max_results(chat_id, max_results)
 
     # --- Search Query Construction ---
-    if isinstance(query, list):
-        # This part handles season searches etc., where you need to match any of the full phrases.
-        raw_pattern = '|'.join(re.escape(q.strip()) for q in query if q.strip())
-        regex_list = [re.compile(raw_pattern, re.IGNORECASE)] if raw_pattern else []
-        
-        if USE_CAPTION_FILTER:
-            # Using $or with multiple regexes for file_name and caption
-            filter_mongo = {"$or": [{"file_name": r} for r in regex_list] + [{"caption": r} for r in regex_list]}
-        else:
-            filter_mongo = {"$or": [{"file_name": r} for r in regex_list]}
-    else:
+    if not isinstance(query, list):
         query = query.strip()
         if not query:
             return [], None, 0
-            
-        # This is the key change for balancing speed and flexibility
-        if ' ' in query:
-            # For multi-word queries, allow spaces, dots, or hyphens between words.
-            # Use '.*?' to allow other characters in between
-            words = [re.escape(word) for word in query.split()]
-            raw_pattern = r'.*'.join(words)
-        else:
-            # For single-word queries, use word boundaries for accuracy.
-            raw_pattern = r"\b" + re.escape(query) + r"\b"
 
-        try:
-            # Compile the single, main regex pattern
-            regex = re.compile(raw_pattern, flags=re.IGNORECASE)
-        except re.error:
-            return [], None, 0
-
-        if USE_CAPTION_FILTER:
-            filter_mongo = {"$or": [{"file_name": regex}, {"caption": regex}]}
-        else:
-            filter_mongo = {"file_name": regex}
+    filter_mongo = build_search_filter(query)
+    if filter_mongo is None:
+        return [], None, 0
 
     if file_type:
         filter_mongo["file_type"] = file_type
-    
+
+    facet_filter = build_facet_filter(facets)
+    if facet_filter is not None:
+        filter_mongo = {"$and": [filter_mongo, facet_filter]}
+
+    count_key = (normalize_query(query), file_type, tuple(sorted((facet_filter or {}).items())))
+    cache_key = count_key[:2] + (str(offset), max_results) + count_key[2:]
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        files, next_offset, total_results = cached
+        return list(files), next_offset, total_results
+    cache_version = _search_cache_version
+
     # --- Fetching Results ---
-    if ULTRA_FAST_MODE:
-        limit = max_results + 1
-        find_tasks = [Media.find(filter_mongo).sort("$natural", -1).skip(offset).limit(limit).to_list(length=limit)]
-        if MULTIPLE_DB:
-            find_tasks.append(Media2.find(filter_mongo).sort("$natural", -1).skip(offset).limit(limit).to_list(length=limit))
-        
+    # Keyset pagination: every page is an indexed range scan below the last `_id`
+    # of the previous page, so deep pages cost the same as the first one.
+    page, skip, last_id = decode_cursor(offset, max_results)
+    page_filter = filter_mongo
+    if last_id is not None:
+        page_filter = {"$and": [filter_mongo, {"_id": {"$lt": last_id}}]}
+
+    limit = max_results + 1
+    find_tasks = [
+        model.find(page_filter).sort("_id", -1).skip(skip).limit(limit).to_list(length=limit)
+        for model in media_models()
+    ]
+    if ULTRA_FAST_MODE or total is not None:
+        # A total already known from the facet counts saves the count_documents round.
         results = await asyncio.gather(*find_tasks)
-        files = results[0]
-        if MULTIPLE_DB and len(results) > 1:
-            files.extend(results[1])
-            
-        files = files[:limit]
-
-        has_next_page = len(files) > max_results
-        if has_next_page:
-            files = files[:-1]
-
-        next_offset = offset + len(files) if has_next_page else ""
-        total_results = offset + len(files) + (1 if has_next_page else 0)
     else:
-        # Standard mode: Count documents first
-        count_tasks = [Media.count_documents(filter_mongo)]
-        find_tasks = [Media.find(filter_mongo).sort("$natural", -1).skip(offset).limit(max_results).to_list(length=max_results)]
-
-        if MULTIPLE_DB:
-            count_tasks.append(Media2.count_documents(filter_mongo))
-            find_tasks.append(Media2.find(filter_mongo).sort("$natural", -1).skip(offset).limit(max_results).to_list(length=max_results))
-        
-        count_results, find_results = await asyncio.gather(
-            asyncio.gather(*count_tasks),
+        # Standard mode: Count documents alongside the page
+        total_results, results = await asyncio.gather(
+            count_search_results(filter_mongo, count_key),
             asyncio.gather(*find_tasks)
         )
-        
-        total_results = sum(count_results)
-        files = find_results[0]
-        if MULTIPLE_DB and len(find_results) > 1:
-            files.extend(find_results[1])
-        
+
+    files = merge_by_id(results, limit)
+    has_next_page = len(files) > max_results
+    if has_next_page:
         files = files[:max_results]
-        
-        next_offset = offset + len(files)
-        if next_offset >= total_results:
-            next_offset = ""
 
+    next_offset = encode_cursor(page + 1, files[-1].pk, max_results) if has_next_page else ""
+    if total is not None:
+        total_results = total
+    elif ULTRA_FAST_MODE:
+        total_results = page * max_results + len(files) + (1 if has_next_page else 0)
+
+    if cache_version == _search_cache_version:
+        search_cache.set(cache_key, (tuple(files), next_offset, total_results))
     return files, next_offset, total_results
 
-async def get_series_episode_groups(chat_id, query, offset=0, file_type=None, max_results=None, filter=False) -> Dict[str, List[Media]]:
-    """
-    Retrieves all search results matching the query and groups them by episode (SXX EYY).
-    
-    This function is designed to support the user's request for showing all versions 
-    (e.g., 720p, 1080p) of a single episode under one episode key.
-    
-    Note: offset and max_results are ignored here as we need all results to group correctly.
-    """
-    
-    # 1. Fetch all matching files (no limit/offset)
-    # Reusing the search results logic but without pagination limits for full grouping
-    files, next_offset, total_results = await get_search_results(
-        chat_id=chat_id, 
-        query=query, 
-        file_type=file_type, 
-        max_results=200, # Use a reasonable cap to prevent massive queries, but large enough for most seasons
-        offset=0, 
-        filter=filter
-    )
-    
-    # 2. Group the retrieved files by their episode identifier
-    grouped_media = await group_media_by_episode(files)
-    
-    return grouped_media, next_offset, total_results
+async def get_facet_counts(query, file_type=None) -> Optional[dict]:
+    """
+    Counts per quality, language and season for everything matching the query,
+    in one $facet aggregation per collection. See merge_facet_counts for the shape.
+    """
+    if not isinstance(query, list):
+        query = query.strip()
+        if not query:
+            return None
+    filter_mongo = build_search_filter(query)
+    if filter_mongo is None:
+        return None
+    if file_type:
+        filter_mongo["file_type"] = file_type
+
+    cache_key = (normalize_query(query), file_type)
+    cached = facet_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    cache_version = _search_cache_version
+
+    pipeline = facet_pipeline(filter_mongo)
+    results = await asyncio.gather(*[
+        model.collection.aggregate(pipeline).to_list(length=1) for model in media_models()
+    ])
+    counts = merge_facet_counts([rows[0] for rows in results if rows])
+    if cache_version == _search_cache_version:
+        facet_cache.set(cache_key, counts)
+    return counts
+
+async def get_series_episode_groups(chat_id, query, offset=0, file_type=None, max_results=None, filter=False, facets=None):
+    """
+    One page of search results grouped by episode (SXX EYY), for showing all
+    versions (720p, 1080p, ...) of an episode under one key.
+
+    Pages hold max_results episode groups. The groups and their counts come
+    from episode_group_pipeline, then each group on the page loads its newest
+    EPISODE_GROUP_FILES files with a limited find, so a page costs the same
+    however many files an episode has.
+    Returns ([EpisodeGroup, ...], next_offset, total_groups). total_groups is
+    None when the databases' groups overlap beyond what was fetched.
+    """
+    max_results = await resolve_max_results(chat_id, max_results)
+    if not isinstance(query, list):
+        query = query.strip()
+        if not query:
+            return [], "", 0
+    filter_mongo = build_search_filter(query)
+    if filter_mongo is None:
+        return [], "", 0
+    if file_type:
+        filter_mongo["file_type"] = file_type
+    facet_filter = build_facet_filter(facets)
+    if facet_filter is not None:
+        filter_mongo = {"$and": [filter_mongo, facet_filter]}
+
+    skip = int(offset) if str(offset).isdigit() else 0
+    cache_key = ("episodes", normalize_query(query), file_type, skip, max_results, tuple(sorted((facet_filter or {}).items())))
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        groups, next_offset, total_groups = cached
+        return list(groups), next_offset, total_groups
+    cache_version = _search_cache_version
+
+    models = media_models()
+    if len(models) == 1:
+        pipeline = episode_group_pipeline(filter_mongo, skip, max_results + 1)
+    else:
+        # A group's rank in one collection is never worse than its merged rank,
+        # so the first skip + page groups of each collection are enough to merge.
+        pipeline = episode_group_pipeline(filter_mongo, 0, skip + max_results + 1)
+    results = await asyncio.gather(*[
+        model.collection.aggregate(pipeline, allowDiskUse=True).to_list(length=1) for model in models
+    ])
+
+    counts = defaultdict(int)
+    totals = []
+    complete = True
+    for rows in results:
+        if not rows:
+            continue
+        totals.append(sum(row["groups"] for row in rows[0]["total"]))
+        complete = complete and len(rows[0]["page"]) >= totals[-1]
+        for group in rows[0]["page"]:
+            counts[episode_group_key(group["_id"])] += group["count"]
+
+    ordered = sorted(counts, key=lambda key: (key is None, key or (0, 0)))
+    if len(models) > 1:
+        ordered = ordered[skip:]
+        # Exact only when every collection returned all of its groups.
+        total_groups = skip + len(ordered) if complete else None
+    else:
+        total_groups = totals[0] if totals else 0
+    has_next_page = len(ordered) > max_results
+    page_keys = ordered[:max_results]
+
+    async def newest_files(model, key):
+        cursor = model.find(episode_group_filter(filter_mongo, key), EPISODE_GROUP_PROJECTION)
+        return await cursor.sort("_id", -1).limit(EPISODE_GROUP_FILES).to_list(length=EPISODE_GROUP_FILES)
+
+    files = await asyncio.gather(*[newest_files(model, key) for key in page_keys for model in models])
+    groups = []
+    for number, key in enumerate(page_keys):
+        group_files = merge_by_id(files[number * len(models):(number + 1) * len(models)], EPISODE_GROUP_FILES)
+        groups.append(EpisodeGroup(key, counts[key], tuple(group_files)))
+    next_offset = str(skip + max_results) if has_next_page else ""
+
+    if cache_version == _search_cache_version:
+        search_cache.set(cache_key, (tuple(groups), next_offset, total_groups))
+    return groups, next_offset, total_groups
 
 
 async def get_bad_files(query, file_type=None):
@@ -368,33 +842,86 @@ async def get_bad_files(query, file_type=None):
     if file_type:
         filter['file_type'] = file_type
         
-    # Find all documents in both dbs for bad file check
-    files1 = await Media.find(filter).sort('$natural', -1).to_list()
-    
-    if MULTIPLE_DB:
-        files2 = await Media2.find(filter).sort('$natural', -1).to_list()
-        files = files1 + files2
-    else:
-        files = files1
-        
+    # Find all documents in every db for bad file check
+    results = await router.fan_out(lambda model: model.find(filter).sort('$natural', -1).to_list())
+    files = [file for shard_files in results for file in shard_files]
+
     total_results = len(files)
     return files, total_results
 
 
+async def backfill_tokens(model, batch_size: int = 500) -> int:
+    """
+    Populates `tokens` for documents saved before the token index existed.
+    Returns the number of documents updated.
+    """
+    updated = 0
+    operations = []
+    cursor = model.collection.find(
+        {"tokens": {"$exists": False}}, {"file_name": 1, "caption": 1}
+    ).sort("_id", 1)
+    async for doc in cursor:
+        operations.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"tokens": media_tokens(doc.get("file_name"), doc.get("caption"))}},
+        ))
+        if len(operations) >= batch_size:
+            result = await model.collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+    if operations:
+        result = await model.collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+    return updated
+
+
+async def backfill_media_info(model, batch_size: int = 500) -> int:
+    """
+    Populates the structured fields (media_facets) for documents saved before
+    they existed or parsed by an older MEDIA_INFO_VERSION. Every document it
+    writes gets the current version, so a second run reads nothing.
+    Returns the number of documents updated.
+    """
+    updated = 0
+    operations = []
+    cursor = model.collection.find(
+        {"$or": [{"media_info_v": None}, {"media_info_v": {"$lt": MEDIA_INFO_VERSION}}]},
+        {"file_name": 1, "caption": 1}
+    ).sort("_id", 1)
+    async for doc in cursor:
+        operations.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": media_facets(doc.get("file_name"), doc.get("caption"))},
+        ))
+        if len(operations) >= batch_size:
+            result = await model.collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+    if operations:
+        result = await model.collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+    return updated
+
+
+async def backfill_all_media_info() -> int:
+    """
+    backfill_media_info on every shard. Also run at startup, so facet filters
+    and counts cover old documents without waiting for /migrate_media_info.
+    """
+    updated = 0
+    try:
+        for model in media_models():
+            updated += await backfill_media_info(model)
+    finally:
+        if updated:
+            invalidate_search_cache()
+    logger.info(f"Media info backfill updated {updated} files.")
+    return updated
+
+
 async def get_file_details(query):
-    filter = {"file_id": query}
-    
-    tasks = [Media.find(filter).to_list(length=1)]
-    if MULTIPLE_DB:
-        tasks.append(Media2.find(filter).to_list(length=1))
-        
-    results = await asyncio.gather(*tasks)
-    
-    for filedetails in results:
-        if filedetails:
-            return filedetails
-            
-    return []
+    shard, file = await router.find_file(query)
+    return [file] if file is not None else []
 
 
 def encode_file_id(s: bytes) -> str:
@@ -433,15 +960,9 @@ def unpack_new_file_id(new_file_id):
 
 async def dreamxbotz_fetch_media(limit: int) -> List[dict]:
     try:
-        if MULTIPLE_DB:
-            db_size = await check_db_size(Media)
-            if db_size > 407:
-                cursor = Media2.find().sort("$natural", -1).limit(limit)
-                files = await cursor.to_list(length=limit)
-                return files
-        cursor = Media.find().sort("$natural", -1).limit(limit)
-        files = await cursor.to_list(length=limit)
-        return files
+        # Newest files of every db, merged like search pages.
+        results = await router.fan_out(lambda model: model.find().sort("_id", -1).limit(limit).to_list(length=limit))
+        return merge_by_id(results, limit)
     except Exception as e:
         logger.error(f"Error in dreamxbotz_fetch_media: {e}")
         return []
@@ -0,0 +1,145 @@
+import time
+import zlib
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from dreamxbotz.util.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Shard:
+    """One backing database and the Media model registered on it."""
+    name: str
+    db: Any
+    model: Any
+    size_mb: float = 0.0
+    size_at: float = 0.0
+
+
+class MediaRouter:
+    """Spreads indexed files over several MongoDB databases.
+
+    attributes:
+        shards: the databases, in the order results are merged and filled.
+        placement: "size" fills each shard up to size_limit_mb before moving
+            to the next one (the old two-database behaviour). "hash" picks a
+            shard from the file_id, so point reads usually need one query.
+        lookup: file_id -> shard index for files seen recently, so point reads
+            and deletes go to one shard instead of all of them.
+
+    Reads that cannot be routed (searches, regex deletes) fan out to every
+    shard in parallel with a per-shard limit and are merged by the caller.
+    """
+
+    def __init__(self, shards: List[Shard], placement: str = "size", size_limit_mb: float = 407,
+                 stats_ttl: float = 600, lookup_size: int = 8192, lookup_ttl: float = 3600):
+        if not shards:
+            raise ValueError("MediaRouter needs at least one shard")
+        self.shards = shards
+        self.placement = placement
+        self.size_limit_mb = size_limit_mb
+        self.stats_ttl = stats_ttl
+        self.lookup = TTLCache(lookup_size, lookup_ttl)
+
+    @property
+    def models(self) -> list:
+        return [shard.model for shard in self.shards]
+
+    async def size_mb(self, shard: Shard) -> float:
+        """Data plus index size of a shard from dbstats, refreshed every stats_ttl
+        seconds, and every 30 seconds once it is within 10% of the limit."""
+        ttl = self.stats_ttl if shard.size_mb < self.size_limit_mb * 0.9 else min(self.stats_ttl, 30)
+        if shard.size_at and time.monotonic() - shard.size_at < ttl:
+            return shard.size_mb
+        try:
+            stats = await shard.db.command("dbstats")
+            shard.size_mb = (stats["dataSize"] + stats["indexSize"]) / (1024 * 1024)
+            shard.size_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Could not read the size of the {shard.name} database: {e}")
+        return shard.size_mb
+
+    def hashed(self, file_id: str) -> Shard:
+        return self.shards[zlib.crc32(file_id.encode()) % len(self.shards)]
+
+    async def place(self, file_id: str) -> Shard:
+        """The shard a new file is written to."""
+        if len(self.shards) == 1:
+            return self.shards[0]
+        if self.placement == "hash":
+            return self.hashed(file_id)
+        for shard in self.shards[:-1]:
+            if await self.size_mb(shard) < self.size_limit_mb:
+                return shard
+        # Everything before it is full; the last shard takes the overflow.
+        return self.shards[-1]
+
+    def remember(self, file_id: str, shard: Shard) -> None:
+        self.lookup.set(file_id, self.shards.index(shard))
+
+    def forget(self, file_id: str) -> None:
+        self.lookup.pop(file_id)
+
+    def candidates(self, file_id: str) -> List[Shard]:
+        """Shards to try first for a file: the cached one, else the hashed one."""
+        index = self.lookup.get(file_id)
+        if index is not None and index < len(self.shards):
+            return [self.shards[index]]
+        if self.placement == "hash" and len(self.shards) > 1:
+            return [self.hashed(file_id)]
+        return []
+
+    async def fan_out(self, query: Callable[[Any], Awaitable], shards: Optional[Iterable[Shard]] = None) -> list:
+        """Runs query(model) on every shard (or the given ones) in parallel, results in shard order."""
+        return await asyncio.gather(*[query(shard.model) for shard in (shards or self.shards)])
+
+    async def find_file(self, file_id: str) -> Tuple[Optional[Shard], Optional[Any]]:
+        """(shard, document) of a file_id, or (None, None)."""
+        first = self.candidates(file_id)
+        for shard in first:
+            doc = await shard.model.find_one({"file_id": file_id})
+            if doc is not None:
+                return shard, doc
+        rest = [shard for shard in self.shards if shard not in first]
+        docs = await self.fan_out(lambda model: model.find_one({"file_id": file_id}), rest)
+        for shard, doc in zip(rest, docs):
+            if doc is not None:
+                self.remember(file_id, shard)
+                return shard, doc
+        return None, None
+
+    async def existing(self, file_ids: List[str]) -> Set[str]:
+        """The file_ids among file_ids that are stored on any shard."""
+        async def query(model):
+            return [doc["file_id"] async for doc in model.collection.find({"file_id": {"$in": file_ids}}, {"file_id": 1})]
+        found = set()
+        for shard, ids in zip(self.shards, await self.fan_out(query)):
+            for file_id in ids:
+                self.remember(file_id, shard)
+                found.add(file_id)
+        return found
+
+    async def delete_file(self, file_id: str) -> int:
+        """Deletes one file wherever it is stored."""
+        flt = {"file_id": file_id}
+        for shard in self.candidates(file_id):
+            result = await shard.model.collection.delete_one(flt)
+            if result.deleted_count:
+                self.forget(file_id)
+                return result.deleted_count
+        deleted = await self.delete_many(flt)
+        self.forget(file_id)
+        return deleted
+
+    async def delete_many(self, flt: dict) -> int:
+        """Deletes matching documents on all shards in parallel, returns the total deleted."""
+        results = await self.fan_out(lambda model: model.collection.delete_many(flt))
+        return sum(result.deleted_count for result in results)
+
+    async def count(self, flt: Optional[dict] = None) -> Dict[str, int]:
+        """Document count per shard name."""
+        counts = await self.fan_out(lambda model: model.count_documents(flt or {}))
+        return {shard.name: count for shard, count in zip(self.shards, counts)}
@@ -0,0 +1,138 @@
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from info import STATE_BACKEND, STATE_DB_URI, STATE_DB_NAME, SESSION_MAX_ENTRIES, SESSION_MAX_BYTES, SESSION_TTL
+from dreamxbotz.util.session_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend(ABC):
+    """Where short lived bot state lives (search sessions, settings cache, verifications).
+
+    Every value belongs to a namespace ("fresh", "settings", ...). Backends only
+    need get/set/delete; callers normally go through namespace() instead.
+    Values must be plain data (str, int, list, dict with str keys) so that any
+    backend can store them.
+    """
+
+    @abstractmethod
+    async def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: Hashable) -> None:
+        ...
+
+    def namespace(self, name: str, ttl: Optional[float] = None) -> "StateNamespace":
+        return StateNamespace(self, name, ttl)
+
+
+class StateNamespace:
+    """One named slice of a backend, used like an async dict."""
+
+    def __init__(self, backend: StateBackend, name: str, ttl: Optional[float] = None):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+
+    async def get(self, key: Hashable, default: Any = None) -> Any:
+        return await self.backend.get(self.name, key, default)
+
+    async def set(self, key: Hashable, value: Any) -> None:
+        await self.backend.set(self.name, key, value, self.ttl)
+
+    async def pop(self, key: Hashable) -> None:
+        await self.backend.delete(self.name, key)
+
+
+class MemoryStateBackend(StateBackend):
+    """Keeps state in this process, one bounded SessionStore per namespace.
+
+    Two backends built on the same `stores` dict see each other's writes, which
+    is how tests stand in for several replicas sharing a networked backend.
+    """
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, max_bytes: int = SESSION_MAX_BYTES,
+                 ttl: float = SESSION_TTL, stores: Optional[Dict[str, SessionStore]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stores = {} if stores is None else stores
+
+    def _store(self, namespace: str) -> SessionStore:
+        store = self.stores.get(namespace)
+        if store is None:
+            store = self.stores[namespace] = SessionStore(self.max_entries, self.max_bytes, self.ttl)
+        return store
+
+    async def get(self, namespace, key, default=None):
+        return self._store(namespace).get(key, default)
+
+    async def set(self, namespace, key, value, ttl=None):
+        self._store(namespace).set(key, value, ttl)
+
+    async def delete(self, namespace, key):
+        self._store(namespace).pop(key)
+
+
+class MongoStateBackend(StateBackend):
+    """Keeps state in a MongoDB collection so every bot/web replica sees the same sessions.
+
+    Documents are {_id: "<namespace>:<key>", value, expires_at}; a TTL index
+    removes expired ones and reads ignore anything past expires_at meanwhile.
+    """
+
+    def __init__(self, uri: str, db_name: str, collection: str = "state", ttl: float = SESSION_TTL):
+        self.col = AsyncIOMotorClient(uri)[db_name][collection]
+        self.ttl = ttl
+        self._indexed = False
+
+    async def _ensure_index(self):
+        if self._indexed:
+            return
+        self._indexed = True
+        try:
+            await self.col.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Could not create state TTL index: {e}")
+
+    @staticmethod
+    def _id(namespace, key):
+        return f"{namespace}:{key}"
+
+    async def get(self, namespace, key, default=None):
+        doc = await self.col.find_one({"_id": self._id(namespace, key)})
+        if not doc or doc["expires_at"] < datetime.utcnow():
+            return default
+        return doc["value"]
+
+    async def set(self, namespace, key, value, ttl=None):
+        await self._ensure_index()
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl if ttl is None else ttl)
+        await self.col.update_one(
+            {"_id": self._id(namespace, key)},
+            {"$set": {"value": value, "expires_at": expires_at}},
+            upsert=True,
+        )
+
+    async def delete(self, namespace, key):
+        await self.col.delete_one({"_id": self._id(namespace, key)})
+
+
+def build_state_backend(name: str = STATE_BACKEND) -> StateBackend:
+    if name == "mongo":
+        return MongoStateBackend(STATE_DB_URI, STATE_DB_NAME)
+    if name != "memory":
+        logger.warning(f"Unknown STATE_BACKEND {name!r}, using memory")
+    return MemoryStateBackend()
+
+
+state = build_state_backend()
@@ -20,6 +20,7 @@ class Database:
         self.filename_col = self.db.filename
         self.movie_updates = self.db.movie_updates
         self.connection = self.db.connections
+        self.index_progress = self.db.index_progress
 
     async def add_name(self, filename):
         if await self.movie_updates.find_one({'_id': filename}):
@@ -419,6 +420,16 @@ class Database:
 
     async def update_movie_update_status(self, bot_id, enable):
         await self.update_bot_setting(bot_id, 'MOVIE_UPDATE_NOTIFICATION', enable)
+
+    async def save_index_checkpoint(self, chat, checkpoint: dict):
+        checkpoint['updated_at'] = datetime.datetime.utcnow()
+        await self.index_progress.update_one({'_id': str(chat)}, {'$set': checkpoint}, upsert=True)
+
+    async def get_index_checkpoint(self, chat):
+        return await self.index_progress.find_one({'_id': str(chat)})
+
+    async def delete_index_checkpoint(self, chat):
+        await self.index_progress.delete_one({'_id': str(chat)})
      
 db = Database(DATABASE_URI, DATABASE_NAME)    
 db2 = Database(DATABASE_URI2, DATABASE_NAME)
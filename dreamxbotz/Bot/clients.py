@@ -35,7 +35,7 @@ async def initialize_clients():
             logging.error(f"Failed starting Client - {client_id} Error:", exc_info=True)
     
     clients = await asyncio.gather(*[start_client(i, token) for i, token in all_tokens.items()])
-    multi_clients.update(dict(clients))
+    multi_clients.update(dict(client for client in clients if client))
     if len(multi_clients) != 1:
         MULTI_CLIENT = True
         print("Multi-Client Mode Enabled")
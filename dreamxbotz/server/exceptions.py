@@ -3,3 +3,6 @@ class InvalidHash(Exception):
 
 class FIleNotFound(Exception):
     message = "File not found"
+
+class NoClientAvailable(Exception):
+    message = "No client is ready to serve files yet, try again shortly"
@@ -0,0 +1,133 @@
+import os
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+class ChunkCache:
+    """An on-disk LRU cache of streamed file chunks keyed by (media_id, offset).
+
+    attributes:
+        directory: where chunk files are kept, one file per chunk.
+        max_bytes: total size cap, least recently used chunks are deleted first.
+        hits / misses / coalesced: lookup counters, see stats().
+
+    Writes go to a temporary file that is renamed into place, so readers never
+    see a partial chunk. Concurrent misses for one chunk share a single fetch.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._index: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, int], asyncio.Future] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, key: Tuple[int, int]) -> str:
+        return os.path.join(self.directory, f"{key[0]}_{key[1]}")
+
+    def _load(self) -> None:
+        """Picks up chunks left by a previous run, oldest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            try:
+                media_id, offset = map(int, name.split("_"))
+                stat = os.stat(path)
+            except (ValueError, OSError):
+                continue
+            entries.append((stat.st_mtime, (media_id, offset), stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self.bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _write(self, key: Tuple[int, int], data: bytes) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read(self, key: Tuple[int, int]) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    async def get_or_fetch(self, media_id: int, offset: int, fetch: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        """Returns the chunk from disk, or fetches it once and stores it."""
+        key = (media_id, offset)
+        if key in self._index:
+            try:
+                data = await asyncio.to_thread(self._read, key)
+                self._index.move_to_end(key)
+                self.hits += 1
+                return data
+            except OSError:
+                self.bytes -= self._index.pop(key, 0)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Only fetch ourselves if the leading fetch was dropped, not us.
+                if not inflight.cancelled():
+                    raise
+            if key in self._inflight:
+                return await self.get_or_fetch(media_id, offset, fetch)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await fetch()
+            if data and len(data) <= self.max_bytes:
+                try:
+                    await asyncio.to_thread(self._write, key, data)
+                    self.bytes += len(data) - self._index.get(key, 0)
+                    self._index[key] = len(data)
+                    self._evict()
+                except OSError as e:
+                    logging.warning(f"Could not write chunk {key} to cache: {e}")
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; mark it retrieved when nobody is waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(data)
+        finally:
+            self._inflight.pop(key, None)
+        return data
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._index),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -1,25 +1,59 @@
 #Thanks @dreamxbotz for helping in this journey 
 import math
+import time
 import asyncio
 import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
 from info import *
-from typing import Dict, Union
+from typing import AsyncGenerator, List, Optional, Tuple, Union
 from dreamxbotz.Bot import work_loads
 from pyrogram import Client, utils, raw
 from .file_properties import get_file_ids
-from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid
+from .chunk_cache import ChunkCache
+from .ttl_cache import TTLCache
+from .metrics import bytes_served, getfile_latency
+from .media_sessions import get_media_pool
+from .scheduler import scheduler
+from .rate_limit import StreamTicket
+from pyrogram.session import Session
 from dreamxbotz.server.exceptions import FIleNotFound
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 
 
+
+@dataclass(frozen=True)
+class FileInfo:
+    """The properties of a stored file that every bot sees the same."""
+    file_size: int
+    mime_type: str
+    file_name: str
+    unique_id: str
+    date: Optional[datetime]
+    dc_id: int
+
+    @classmethod
+    def from_file_id(cls, file_id: FileId) -> "FileInfo":
+        return cls(file_id.file_size, file_id.mime_type, file_id.file_name,
+                   file_id.unique_id, file_id.date, file_id.dc_id)
+
+
+chunk_cache = ChunkCache(CHUNK_CACHE_DIR, CHUNK_CACHE_SIZE_MB * 1024 * 1024) if CHUNK_CACHE_SIZE_MB > 0 else None
+# Shared by every ByteStreamer and keyed by message id alone: whichever client
+# looks a file up first fills it for all of them.
+file_info_cache = TTLCache(FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL)
+# The FileId itself holds the access hash and file reference of the bot that
+# fetched it, so only the location is cached per (client, message id).
+file_id_cache = TTLCache(FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL)
+
+
 class ByteStreamer:
     def __init__(self, client: Client):
         """A custom class that holds the cache of a specific client and class functions.
         attributes:
             client: the client that the cache is for.
-            cached_file_ids: a dict of cached file IDs.
-            cached_file_properties: a dict of cached file properties.
+            cached_file_ids: the size-bounded TTL cache of file IDs, one entry per client.
         
         functions:
             generate_file_properties: returns the properties for a media of a specific message contained in Tuple.
@@ -29,21 +63,30 @@ class ByteStreamer:
         This is a modified version of the <https://github.com/eyaadh/megadlbot_oss/blob/master/mega/telegram/utils/custom_download.py>
         Thanks to Eyaadh <https://github.com/eyaadh>
         """
-        self.clean_timer = 30 * 60
         self.client: Client = client
-        self.cached_file_ids: Dict[int, FileId] = {}
-        asyncio.create_task(self.clean_cache())
+        self.cached_file_ids: TTLCache = file_id_cache
 
-    async def get_file_properties(self, id: int) -> FileId:
+    async def get_file_properties(self, msg_id: int) -> FileId:
         """
         Returns the properties of a media of a specific message in a FIleId class.
         if the properties are cached, then it'll return the cached results.
         or it'll generate the properties from the Message ID and cache them.
+        Concurrent requests for an uncached ID share a single lookup.
         """
-        if id not in self.cached_file_ids:
-            await self.generate_file_properties(id)
-            logging.debug(f"Cached file properties for message with ID {id}")
-        return self.cached_file_ids[id]
+        return await self.cached_file_ids.get_or_load(
+            (id(self.client), msg_id), lambda: self.generate_file_properties(msg_id)
+        )
+
+    async def get_file_info(self, msg_id: int) -> FileInfo:
+        """
+        Returns the bot independent properties of a file (size, mime type,
+        name, unique id, date, DC). Fetched through this client only when no
+        client has looked the file up yet.
+        """
+        info = file_info_cache.get(msg_id)
+        if info is None:
+            info = FileInfo.from_file_id(await self.get_file_properties(msg_id))
+        return info
     
     async def generate_file_properties(self, id: int) -> FileId:
         """
@@ -55,66 +98,16 @@ class ByteStreamer:
         if not file_id:
             logging.debug(f"Message with ID {id} not found")
             raise FIleNotFound
-        self.cached_file_ids[id] = file_id
-        logging.debug(f"Cached media message with ID {id}")
-        return self.cached_file_ids[id]
+        file_info_cache.set(id, FileInfo.from_file_id(file_id))
+        return file_id
 
     async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
         """
-        Generates the media session for the DC that contains the media file.
+        Returns a media session for the DC that contains the media file.
         This is required for getting the bytes from Telegram servers.
+        Sessions come from the client's pool, see media_sessions.py.
         """
-
-        media_session = client.media_sessions.get(file_id.dc_id, None)
-
-        if media_session is None:
-            if file_id.dc_id != await client.storage.dc_id():
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await Auth(
-                        client, file_id.dc_id, await client.storage.test_mode()
-                    ).create(),
-                    await client.storage.test_mode(),
-                    is_media=True,
-                )
-                await media_session.start()
-
-                for _ in range(6):
-                    exported_auth = await client.invoke(
-                        raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
-                    )
-
-                    try:
-                        await media_session.send(
-                            raw.functions.auth.ImportAuthorization(
-                                id=exported_auth.id, bytes=exported_auth.bytes
-                            )
-                        )
-                        break
-                    except AuthBytesInvalid:
-                        logging.debug(
-                            f"Invalid authorization bytes for DC {file_id.dc_id}"
-                        )
-                        continue
-                else:
-                    await media_session.stop()
-                    raise AuthBytesInvalid
-            else:
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await client.storage.auth_key(),
-                    await client.storage.test_mode(),
-                    is_media=True,
-                )
-                await media_session.start()
-            logging.debug(f"Created media session for DC {file_id.dc_id}")
-            client.media_sessions[file_id.dc_id] = media_session
-        else:
-            logging.debug(f"Using cached media session for DC {file_id.dc_id}")
-        return media_session
-
+        return await get_media_pool(client).get(file_id.dc_id)
 
     @staticmethod
     async def get_location(file_id: FileId) -> Union[raw.types.InputPhotoFileLocation,
@@ -161,7 +154,39 @@ class ByteStreamer:
             )
         return location
 
-    async def yield_file(
+    async def part_reader(self, file_id: FileId, chunk_size: int):
+        """
+        Returns a function that reads one part of the file at a given offset
+        through this client, from the chunk cache when it is enabled.
+        """
+        location = await self.get_location(file_id)
+
+        async def fetch_part(part_offset: int, retry: bool = True) -> Union[bytes, None]:
+            media_session = await self.generate_media_session(self.client, file_id)
+            started = time.monotonic()
+            try:
+                r = await media_session.send(
+                    raw.functions.upload.GetFile(
+                        location=location, offset=part_offset, limit=chunk_size
+                    ),
+                )
+            except (OSError, TimeoutError):
+                # A dead connection; swap the session out and try the part once more.
+                get_media_pool(self.client).discard(file_id.dc_id, media_session)
+                if not retry:
+                    raise
+                return await fetch_part(part_offset, retry=False)
+            getfile_latency.observe(time.monotonic() - started, file_id.dc_id)
+            return r.bytes if isinstance(r, raw.types.upload.File) else None
+
+        def read_part(part_offset: int):
+            if chunk_cache is None:
+                return fetch_part(part_offset)
+            return chunk_cache.get_or_fetch(file_id.media_id, part_offset, lambda: fetch_part(part_offset))
+
+        return read_part
+
+    def yield_file(
         self,
         file_id: FileId,
         index: int,
@@ -170,61 +195,99 @@ class ByteStreamer:
         last_part_cut: int,
         part_count: int,
         chunk_size: int,
-    ) -> Union[str, None]:
+        ticket: Optional[StreamTicket] = None,
+    ) -> AsyncGenerator[bytes, None]:
         """
-        Custom generator that yields the bytes of the media file.
+        Custom generator that yields the bytes of the media file through this client.
         """
-        client = self.client
+        return stream_parts(
+            [(self, file_id, index)], offset, first_part_cut, last_part_cut, part_count, chunk_size, ticket
+        )
+
+
+
+async def timed_read(read_part, index: int, part_offset: int) -> Union[bytes, None]:
+    """Reads one part and reports how fast it came back to the scheduler."""
+    started = time.monotonic()
+    chunk = await read_part(part_offset)
+    if chunk:
+        scheduler.observe(index, len(chunk), time.monotonic() - started)
+    return chunk
+
+
+async def stream_parts(
+    sources: List[Tuple[ByteStreamer, FileId, int]],
+    offset: int,
+    first_part_cut: int,
+    last_part_cut: int,
+    part_count: int,
+    chunk_size: int,
+    ticket: Optional[StreamTicket] = None,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Yields the parts of a byte range in order. sources holds (streamer, file_id,
+    client index) per client; part n is fetched by sources[n % len(sources)], so
+    several clients can serve one download. Up to STREAM_PREFETCH GetFile requests
+    per client are kept in flight ahead of the reader, which also bounds how many
+    parts are buffered at a time. A rate limiter ticket, when given, paces every
+    part and is released when the stream ends.
+    """
+    # Bytes each source still owes, so the scheduler sees what is left per client.
+    owed = [math.ceil((part_count - i) / len(sources)) * chunk_size for i in range(len(sources))]
+    for (_, _, index), size in zip(sources, owed):
         work_loads[index] += 1
-        logging.debug(f"Starting to yielding file with client {index}.")
-        media_session = await self.generate_media_session(client, file_id)
+        scheduler.started(index, size)
+    logging.debug(f"Starting to yielding file with clients {[index for _, _, index in sources]}.")
 
-        current_part = 1
-        location = await self.get_location(file_id)
+    current_part = 1
+    next_part = 1
+    pending = deque()
 
-        try:
-            r = await media_session.send(
-                raw.functions.upload.GetFile(
-                    location=location, offset=offset, limit=chunk_size
-                ),
-            )
-            if isinstance(r, raw.types.upload.File):
-                while True:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    elif part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
-
-                    current_part += 1
-                    offset += chunk_size
-
-                    if current_part > part_count:
-                        break
-
-                    r = await media_session.send(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
-                    )
-        except (TimeoutError, AttributeError):
-            pass
-        finally:
-            logging.debug("Finished yielding file with {current_part} parts.")
-            work_loads[index] -= 1
+    try:
+        readers = [await streamer.part_reader(file_id, chunk_size) for streamer, file_id, _ in sources]
+        window = max(1, STREAM_PREFETCH) * len(readers)
+        while current_part <= part_count:
+            while len(pending) < window and next_part <= part_count:
+                source = (next_part - 1) % len(readers)
+                pending.append(asyncio.ensure_future(
+                    timed_read(readers[source], sources[source][2], offset + (next_part - 1) * chunk_size)
+                ))
+                next_part += 1
+            source = (current_part - 1) % len(sources)
+            try:
+                chunk = await pending.popleft()
+            except Exception as e:
+                scheduler.failed(sources[source][2], e)
+                raise
+            if not chunk:
+                break
+            elif part_count == 1:
+                chunk = chunk[first_part_cut:last_part_cut]
+            elif current_part == 1:
+                chunk = chunk[first_part_cut:]
+            elif current_part == part_count:
+                chunk = chunk[:last_part_cut]
+            bytes_served.inc(sources[source][2], value=len(chunk))
+            scheduler.sent(sources[source][2], min(chunk_size, owed[source]))
+            owed[source] = max(0, owed[source] - chunk_size)
+            if ticket is not None:
+                await ticket.throttle(len(chunk))
+            yield chunk
 
-    
-    async def clean_cache(self) -> None:
-        """
-        function to clean the cache to reduce memory usage
-        """
-        while True:
-            await asyncio.sleep(self.clean_timer)
-            self.cached_file_ids.clear()
-            logging.debug("Cleaned the cache")
+            current_part += 1
+    except (TimeoutError, AttributeError):
+        pass
+    finally:
+        # The client may have gone away mid-stream; drop the read-ahead requests.
+        for task in pending:
+            if task.done():
+                if not task.cancelled():
+                    task.exception()
+            else:
+                task.cancel()
+        logging.debug(f"Finished yielding file with {current_part} parts.")
+        for (_, _, index), unsent in zip(sources, owed):
+            work_loads[index] -= 1
+            scheduler.finished(index, unsent)
+        if ticket is not None:
+            ticket.release()
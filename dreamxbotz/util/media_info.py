@@ -0,0 +1,214 @@
+"""Filename parsing shared by the channel update posts and the indexer."""
+import re
+from typing import List, Optional, Tuple
+from info import BAD_WORDS
+
+# Precomputed sets for faster lookups
+IGNORE_WORDS = {
+    "rarbg", "dub", "sub", "sample", "mkv", "aac", "combined",
+    "action", "adventure", "animation", "biography", "comedy", "crime", 
+    "documentary", "drama", "fantasy", "film-noir", "history", 
+    "horror", "music", "musical", "mystery", "romance", "sci-fi", "sport", 
+    "thriller", "war", "western", "hdcam", "hdtc", "camrip", "ts", "tc", 
+    "telesync", "dvdscr", "dvdrip", "predvd", "webrip", "web-dl", "tvrip", 
+    "hdtv", "web dl", "webdl", "bluray", "brrip", "bdrip", "360p", "480p", 
+    "720p", "1080p", "2160p", "4k", "1440p", "540p", "240p", "140p", "hevc", 
+    "hdrip", "hin", "hindi", "tam", "tamil", "kan", "kannada", "tel", "telugu", 
+    "mal", "malayalam", "eng", "english", "pun", "punjabi", "ben", "bengali", 
+    "mar", "marathi", "guj", "gujarati", "urd", "urdu", "kor", "korean", "jpn", 
+    "japanese", "nf", "netflix", "sonyliv", "sony", "sliv", "amzn", "prime", 
+    "primevideo", "hotstar", "zee5", "jio", "jhs", "aha", "hbo", "paramount", 
+    "apple", "hoichoi", "sunnxt", "viki"
+}|BAD_WORDS
+
+# Constants
+CAPTION_LANGUAGES = {
+    "hin": "Hindi", "hindi": "Hindi",
+    "tam": "Tamil", "tamil": "Tamil",
+    "kan": "Kannada", "kannada": "Kannada",
+    "tel": "Telugu", "telugu": "Telugu",
+    "mal": "Malayalam", "malayalam": "Malayalam",
+    "eng": "English", "english": "English",
+    "pun": "Punjabi", "punjabi": "Punjabi",
+    "ben": "Bengali", "bengali": "Bengali",
+    "mar": "Marathi", "marathi": "Marathi",
+    "guj": "Gujarati", "gujarati": "Gujarati",
+    "urd": "Urdu", "urdu": "Urdu",
+    "kor": "Korean", "korean": "Korean",
+    "jpn": "Japanese", "japanese": "Japanese",
+}
+
+OTT_PLATFORMS = {
+    "nf": "Netflix", "netflix": "Netflix",
+    "sonyliv": "SonyLiv", "sony": "SonyLiv", "sliv": "SonyLiv",
+    "amzn": "Amazon Prime Video", "prime": "Amazon Prime Video", "primevideo": "Amazon Prime Video",
+    "hotstar": "Disney+ Hotstar", "zee5": "Zee5",
+    "jio": "JioHotstar", "jhs": "JioHotstar",
+    "aha": "Aha", "hbo": "HBO Max", "paramount": "Paramount+",
+    "apple": "Apple TV+", "hoichoi": "Hoichoi", "sunnxt": "Sun NXT", "viki": "Viki"
+}
+
+# Precompiled regex patterns
+CLEAN_PATTERN = re.compile(r'@[^ \n\r\t\.,:;!?()\[\]{}<>\\/"\'=_%]+|\bwww\.[^\s\]\)]+|\([\@^]+\)|\[[\@^]+\]')
+NORMALIZE_PATTERN = re.compile(r"[._]+|[()\[\]{}:;'–!,.?_]")
+QUALITY_PATTERN = re.compile(
+    r"\b(?:HDCam|HDTC|CamRip|TS|TC|TeleSync|DVDScr|DVDRip|PreDVD|"
+    r"WEBRip|WEB-DL|TVRip|HDTV|WEB DL|WebDl|BluRay|BRRip|BDRip|"
+    r"360p|480p|720p|1080p|2160p|4K|1440p|540p|240p|140p|HEVC|HDRip)\b", 
+    re.IGNORECASE
+)
+YEAR_PATTERN = re.compile(r"(?<![A-Za-z0-9])(?:19|20)\d{2}(?![A-Za-z0-9])")
+RANGE_REGEX = re.compile(r'\bS(\d{1,2})[^\w\n\r]*E(?:p(?:isode)?)?0*(\d{1,2})\s*(?:to|-)\s*(?:E(?:p(?:isode)?)?)?0*(\d{1,2})',re.IGNORECASE)
+SINGLE_REGEX = re.compile(r'\bS(\d{1,2})[^\w\n\r]*E(?:p(?:isode)?)?0*(\d{1,3})', re.IGNORECASE)
+NAMED_REGEX = re.compile(r'Season\s*0*(\d{1,2})[\s\-,:]*Ep(?:isode)?\s*0*(\d{1,3})', re.IGNORECASE)
+EP_ONLY_RANGE = re.compile(r'\b(?:EP|Episode)0*(\d{1,3})\s*-\s*0*(\d{1,3})\b',re.IGNORECASE)
+# A season tag without an episode, as on season packs ("S02", "Season 1 Combined").
+SEASON_ONLY_REGEX = re.compile(r'\b(?:S|Season[\s.\-_]*)0*(\d{1,2})\b', re.IGNORECASE)
+
+
+def clean_mentions_links(text: str) -> str:
+    return CLEAN_PATTERN.sub("", text or "").strip()
+
+def normalize(s: str) -> str:
+    s = NORMALIZE_PATTERN.sub(" ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+def remove_ignored_words(text: str) -> str:
+    IGNORE_WORDS_LOWER = {w.lower() for w in IGNORE_WORDS}
+    return " ".join(word for word in text.split() if word.lower() not in IGNORE_WORDS_LOWER)
+
+def get_qualities(text: str) -> str:
+    qualities = QUALITY_PATTERN.findall(text)
+    return ", ".join(qualities) if qualities else "N/A"
+
+def extract_ott_platform(text: str) -> str:
+    text = text.lower()
+    platforms = {plat for key, plat in OTT_PLATFORMS.items() if key in text}
+    return " | ".join(platforms) if platforms else "N/A"
+
+def extract_season_episode(filename: str) -> Tuple[Optional[int], Optional[str]]:
+    if m := EP_ONLY_RANGE.search(filename):
+        return 1, f"{int(m.group(1))}-{int(m.group(2))}"
+    for pattern in (RANGE_REGEX, SINGLE_REGEX, NAMED_REGEX):
+        if m := pattern.search(filename):
+            season = int(m.group(1))
+            if pattern == RANGE_REGEX:
+                ep = f"{m.group(2)}-{m.group(3)}"
+            else:
+                ep = m.group(2)
+            return season, ep
+    return None, None
+
+def extract_media_info(filename: str, caption: str):
+    filename = normalize(clean_mentions_links(filename).title())
+    caption_clean = clean_mentions_links(caption).lower() if caption else ""
+    unified = f"{caption_clean} {filename.lower()}".strip()
+
+    season = episode = year = None
+    tag = "#MOVIE"
+    processed_raw = base_raw = filename
+    quality = get_qualities(caption_clean) or get_qualities(filename.lower()) or "N/A"
+    ott_platform = extract_ott_platform(f"{filename} {caption_clean}")
+
+    lang_keys = {k for k in CAPTION_LANGUAGES if k in caption_clean or k in filename.lower()}
+    language = ", ".join(sorted({CAPTION_LANGUAGES[k] for k in lang_keys})) if lang_keys else "N/A"
+
+    season, episode = extract_season_episode(filename)
+    if season is not None:
+        tag = "#SERIES"
+        if m := (RANGE_REGEX.search(filename) or SINGLE_REGEX.search(filename) or NAMED_REGEX.search(filename) or EP_ONLY_RANGE.search(filename)):
+            match_str = m.group(0)
+            start_idx = filename.lower().find(match_str.lower())
+            end_idx = start_idx + len(match_str)
+            processed_raw = filename[:end_idx]
+            base_raw = filename[:start_idx]
+            if year_match := YEAR_PATTERN.search(filename.lower()[end_idx:]):
+                y = year_match.group(0)
+                yi = filename.lower().find(y, end_idx)
+                if yi != -1:
+                    processed_raw = filename[:yi+4]
+                    base_raw += f" {y}"
+    else:
+        if year_match := YEAR_PATTERN.search(unified):
+            year = year_match.group(0)
+            year_idx = filename.lower().find(year.lower())
+            if year_idx != -1:
+                processed_raw = filename[:year_idx + 4]
+                base_raw = processed_raw
+        else:
+            if qual_match := QUALITY_PATTERN.search(unified):
+                qual_str = qual_match.group(0)
+                qual_idx = filename.lower().find(qual_str.lower())
+                if qual_idx != -1:
+                    processed_raw = filename[:qual_idx]
+                    base_raw = processed_raw
+
+    base_name = normalize(remove_ignored_words(normalize(base_raw)))
+    if year and year not in base_name:
+        base_name += f" {year}"
+
+    if base_name.endswith(")"):
+        base_name = re.sub(r"\s+\(\d{4}\)$", "", base_name)
+        if year:
+            base_name += f" ({year})"
+
+    return {
+        "processed": normalize(processed_raw),
+        "base_name": base_name,
+        "tag": tag,
+        "season": season,
+        "episode": episode,
+        "year": year,
+        "quality": quality,
+        "ott_platform": ott_platform,
+        "language": language
+    }
+
+
+# Resolutions offered by the quality filter (info.QUALITIES), stored lowercase.
+RESOLUTIONS = ("360p", "480p", "540p", "720p", "1080p", "1440p", "2160p", "4k")
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+def language_codes() -> dict:
+    """Maps every language word to its short code, e.g. "hindi" and "hin" to "hin"."""
+    codes = {}
+    for word, name in CAPTION_LANGUAGES.items():
+        codes[word] = next(code for code, other in CAPTION_LANGUAGES.items() if other == name)
+    return codes
+
+LANGUAGE_CODES = language_codes()
+
+# Stored as media_info_v. Bump it when parsing changes, and the startup
+# backfill parses the documents of older versions again (2: season packs).
+MEDIA_INFO_VERSION = 2
+
+def media_facets(file_name: Optional[str], caption: Optional[str] = None) -> dict:
+    """Structured fields stored with every indexed file.
+
+    Quality and languages are matched on whole words, like the search tokens,
+    and series_key is the lowercase title of files that carry a season tag.
+    Season packs have a season but no episode.
+    """
+    file_name = file_name or ""
+    info = extract_media_info(file_name, caption)
+    text = f"{file_name} {caption or ''}"
+    words = WORD_PATTERN.findall(text.lower())
+    season, title = info["season"], info["base_name"]
+    if season is None and (m := SEASON_ONLY_REGEX.search(file_name)):
+        season = int(m.group(1))
+        title = normalize(remove_ignored_words(normalize(clean_mentions_links(file_name[:m.start()]))))
+    series_key = None
+    if season is not None:
+        series_key = " ".join(YEAR_PATTERN.sub(" ", title.lower()).strip("() ").split()) or None
+    episode = info["episode"]
+    year = YEAR_PATTERN.search(text)
+    return {
+        "series_key": series_key,
+        "season": season,
+        # Ranges such as "1-5" are stored under their first episode.
+        "episode": int(episode.split("-")[0]) if episode else None,
+        "quality": next((word for word in words if word in RESOLUTIONS), None),
+        "languages": sorted({LANGUAGE_CODES[word] for word in words if word in LANGUAGE_CODES}),
+        "year": int(year.group(0)) if year else None,
+        "media_info_v": MEDIA_INFO_VERSION,
+    }
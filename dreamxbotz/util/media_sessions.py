@@ -0,0 +1,155 @@
+import random
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from info import MEDIA_SESSIONS_PER_DC, MEDIA_SESSION_PING_TIMEOUT
+from pyrogram import Client, raw
+from pyrogram.session import Session, Auth
+from pyrogram.errors import AuthBytesInvalid
+from .metrics import media_session_replacements
+
+
+class MediaSessionPool:
+    """The media sessions of one client, up to per_dc of them for each DC.
+
+    attributes:
+        client: the client the sessions belong to.
+        per_dc: how many sessions are kept per DC, parts are spread over them.
+        sessions: the open sessions by DC id.
+
+    Sessions are normally created by warm_up() before the first viewer asks for
+    them; get() creates one on demand otherwise. Sessions that fail a request or
+    a health check are dropped and replaced in the background.
+    """
+
+    def __init__(self, client: Client, per_dc: int = MEDIA_SESSIONS_PER_DC):
+        self.client = client
+        self.per_dc = max(1, per_dc)
+        self.sessions: Dict[int, List[Session]] = {}
+        self._auth_keys: Dict[int, bytes] = {}
+        self._next: Dict[int, int] = defaultdict(int)
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def _authorize(self, session: Session, dc_id: int) -> None:
+        for _ in range(6):
+            exported_auth = await self.client.invoke(
+                raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+            )
+            try:
+                await session.send(
+                    raw.functions.auth.ImportAuthorization(
+                        id=exported_auth.id, bytes=exported_auth.bytes
+                    )
+                )
+                return
+            except AuthBytesInvalid:
+                logging.debug(f"Invalid authorization bytes for DC {dc_id}")
+                continue
+        raise AuthBytesInvalid
+
+    async def create(self, dc_id: int) -> Session:
+        """Opens a media session on dc_id. Sessions of one DC share an auth key,
+        so only the first one pays for the key exchange and ExportAuthorization."""
+        test_mode = await self.client.storage.test_mode()
+        if dc_id == await self.client.storage.dc_id():
+            auth_key, authorized = await self.client.storage.auth_key(), True
+        elif dc_id in self._auth_keys:
+            auth_key, authorized = self._auth_keys[dc_id], True
+        else:
+            auth_key, authorized = await Auth(self.client, dc_id, test_mode).create(), False
+        session = Session(self.client, dc_id, auth_key, test_mode, is_media=True)
+        await session.start()
+        if not authorized:
+            try:
+                await self._authorize(session, dc_id)
+            except BaseException:
+                await session.stop()
+                raise
+            self._auth_keys[dc_id] = auth_key
+        logging.debug(f"Created media session for DC {dc_id}")
+        return session
+
+    async def fill(self, dc_id: int) -> List[Session]:
+        """Opens sessions for dc_id until there are per_dc of them."""
+        async with self._locks[dc_id]:
+            sessions = self.sessions.setdefault(dc_id, [])
+            while len(sessions) < self.per_dc:
+                sessions.append(await self.create(dc_id))
+                # Kept in step so pyrogram closes a session for us on terminate().
+                self.client.media_sessions[dc_id] = sessions[0]
+        return sessions
+
+    async def get(self, dc_id: int) -> Session:
+        """Returns the next session for dc_id, round robin over the pool."""
+        sessions = self.sessions.get(dc_id)
+        if not sessions:
+            sessions = await self.fill(dc_id)
+        self._next[dc_id] = (self._next[dc_id] + 1) % len(sessions)
+        return sessions[self._next[dc_id]]
+
+    def discard(self, dc_id: int, session: Session) -> None:
+        """Drops a failed session and opens a replacement in the background."""
+        sessions = self.sessions.get(dc_id, [])
+        if session not in sessions:
+            return
+        sessions.remove(session)
+        if self.client.media_sessions.get(dc_id) is session:
+            self.client.media_sessions.pop(dc_id)
+        media_session_replacements.inc(dc_id)
+        logging.warning(f"Replacing media session for DC {dc_id}")
+        asyncio.create_task(self._replace(dc_id, session))
+
+    async def _replace(self, dc_id: int, session: Session) -> None:
+        try:
+            await session.stop()
+        except Exception:
+            pass
+        try:
+            await self.fill(dc_id)
+        except Exception as e:
+            logging.error(f"Could not reopen media session for DC {dc_id}: {e}")
+
+    async def warm_up(self, dc_ids: Iterable[int]) -> None:
+        async def open_dc(dc_id):
+            try:
+                await self.fill(dc_id)
+            except Exception as e:
+                logging.warning(f"Media session warm-up failed for DC {dc_id}: {e}")
+        await asyncio.gather(*[open_dc(dc_id) for dc_id in dc_ids])
+
+    async def health_check(self) -> None:
+        """Pings every session and replaces the ones that do not answer."""
+        for dc_id, sessions in list(self.sessions.items()):
+            for session in list(sessions):
+                try:
+                    if not session.is_started.is_set():
+                        raise ConnectionError("session is not running")
+                    await session.send(
+                        raw.functions.Ping(ping_id=random.getrandbits(63)),
+                        timeout=MEDIA_SESSION_PING_TIMEOUT,
+                    )
+                except Exception as e:
+                    logging.debug(f"Media session for DC {dc_id} failed health check: {e}")
+                    self.discard(dc_id, session)
+
+
+media_pools: Dict[Client, MediaSessionPool] = {}
+
+
+def get_media_pool(client: Client) -> MediaSessionPool:
+    pool = media_pools.get(client)
+    if pool is None:
+        pool = media_pools[client] = MediaSessionPool(client)
+    return pool
+
+
+async def keep_media_sessions(clients: Iterable[Client], dc_ids: Optional[Iterable[int]], interval: float) -> None:
+    """Warms up the pools of the given clients, then health-checks them every interval seconds."""
+    pools = [get_media_pool(client) for client in clients]
+    if dc_ids:
+        await asyncio.gather(*[pool.warm_up(dc_ids) for pool in pools])
+    while interval > 0:
+        await asyncio.sleep(interval)
+        for pool in pools:
+            await pool.health_check()
@@ -0,0 +1,85 @@
+import bisect
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing value per label set, e.g. bytes served per client."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple, float] = defaultdict(int)
+
+    def inc(self, *labels, value: float = 1) -> None:
+        self.values[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Observations bucketed by upper bound, e.g. GetFile latency per DC."""
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float], labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = sorted(buckets)
+        self.counts: Dict[Tuple, List[int]] = {}
+        self.sums: Dict[Tuple, float] = defaultdict(float)
+
+    def observe(self, value: float, *labels) -> None:
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for key, counts in sorted(self.counts.items()):
+            total = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                total += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(self.sums[key])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {total}")
+        return lines
+
+
+def gauge(name: str, help: str, samples: Dict[Tuple, float], labels: Sequence[str] = ()) -> List[str]:
+    """Renders a value read at scrape time, such as the live work_loads."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for key, value in sorted(samples.items()):
+        lines.append(f"{name}{_labels(labels, key)} {_number(value)}")
+    return lines
+
+
+bytes_served = Counter("dreamx_stream_bytes_total", "Bytes sent to stream clients.", ("client",))
+getfile_latency = Histogram(
+    "dreamx_getfile_seconds",
+    "Upstream upload.GetFile latency.",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ("dc",),
+)
+http_responses = Counter("dreamx_http_responses_total", "HTTP responses by status code.", ("status",))
+media_session_replacements = Counter("dreamx_media_session_replacements_total", "Media sessions replaced after a failure.", ("dc",))
@@ -0,0 +1,160 @@
+import hmac
+import time
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Set
+from info import (
+    STREAM_SECRET, STREAM_MAX_PER_IP, STREAM_MAX_PER_FILE, STREAM_RATE_KBPS, STREAM_FILE_RATE_KBPS,
+    PREMIUM_STREAM_MAX_PER_IP, PREMIUM_STREAM_MAX_PER_FILE, PREMIUM_STREAM_RATE_KBPS, PREMIUM_STREAM_FILE_RATE_KBPS,
+)
+from .ttl_cache import TTLCache
+
+
+class TokenBucket:
+    """Allows rate bytes per second on average, with bursts of up to burst bytes.
+
+    consume() takes the tokens right away and then sleeps off any debt, so
+    streams sharing a bucket split its rate between them.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def consume(self, amount: int) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+@dataclass
+class StreamLimits:
+    """Caps for one tier of users; 0 turns a cap off."""
+    per_remote: int = 0
+    per_file: int = 0
+    remote_rate: int = 0
+    file_rate: int = 0
+
+
+class StreamTicket:
+    """One admitted stream. throttle() is awaited for every chunk sent and
+    release() frees the concurrency slot when the stream ends."""
+
+    def __init__(self, limiter: "StreamLimiter", keys: List[Hashable], buckets: List[TokenBucket]):
+        self.limiter = limiter
+        self.keys = keys
+        self.buckets = buckets
+        self.last_seen = time.monotonic()
+        self.released = False
+
+    async def throttle(self, amount: int) -> None:
+        self.last_seen = time.monotonic()
+        for bucket in self.buckets:
+            await bucket.consume(amount)
+        self.last_seen = time.monotonic()
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.limiter._release(self)
+
+
+class StreamLimiter:
+    """Concurrency caps and token buckets per remote address and per file.
+
+    attributes:
+        limits / premium_limits: the StreamLimits for regular and premium users.
+        idle_timeout: a ticket that has not sent anything for this long no longer
+            counts against the caps, so a response that was never started
+            cannot hold its slot forever.
+    """
+
+    def __init__(self, limits: StreamLimits, premium_limits: StreamLimits, idle_timeout: float = 120):
+        self.limits = limits
+        self.premium_limits = premium_limits
+        self.idle_timeout = idle_timeout
+        self.active: Dict[Hashable, Set[StreamTicket]] = {}
+        self.buckets = TTLCache(8192, 3600)
+        self.rejected = 0
+
+    def _count(self, key: Hashable) -> int:
+        tickets = self.active.get(key)
+        if not tickets:
+            return 0
+        cutoff = time.monotonic() - self.idle_timeout
+        for ticket in [ticket for ticket in tickets if ticket.last_seen < cutoff]:
+            ticket.release()
+        return len(self.active.get(key, ()))
+
+    def _bucket(self, key: Hashable, rate: int) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, max(rate, 1024 * 1024))
+            self.buckets.set(key, bucket)
+        else:
+            # Picks up a tier change for this key (premium bought or expired).
+            bucket.rate, bucket.burst = rate, max(rate, 1024 * 1024)
+        return bucket
+
+    def acquire(self, remote: str, file_key: Hashable, premium: bool = False) -> Optional[StreamTicket]:
+        """Admits a stream, or returns None when a concurrency cap is reached."""
+        limits = self.premium_limits if premium else self.limits
+        remote_key, file_key = ("remote", remote), ("file", file_key)
+        if (limits.per_remote and self._count(remote_key) >= limits.per_remote) or (
+            limits.per_file and self._count(file_key) >= limits.per_file
+        ):
+            self.rejected += 1
+            return None
+        buckets = []
+        if limits.remote_rate:
+            buckets.append(self._bucket(remote_key, limits.remote_rate))
+        if limits.file_rate:
+            buckets.append(self._bucket(file_key, limits.file_rate))
+        ticket = StreamTicket(self, [remote_key, file_key], buckets)
+        for key in ticket.keys:
+            self.active.setdefault(key, set()).add(ticket)
+        return ticket
+
+    def _release(self, ticket: StreamTicket) -> None:
+        for key in ticket.keys:
+            tickets = self.active.get(key)
+            if tickets is not None:
+                tickets.discard(ticket)
+                if not tickets:
+                    del self.active[key]
+
+
+def _user_signature(user_id: int, msg_id: int) -> str:
+    return hmac.new(STREAM_SECRET.encode(), f"{user_id}:{msg_id}".encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def stream_user_token(user_id: int, msg_id: int) -> str:
+    """The u= value added to stream links so the server knows who asked for them."""
+    return f"{user_id}.{_user_signature(user_id, msg_id)}"
+
+
+def stream_user(token: Optional[str], msg_id: int) -> Optional[int]:
+    """The user id from a u= value, or None when it is missing or forged."""
+    if not token:
+        return None
+    user_id, _, signature = token.partition(".")
+    if not user_id.isdigit() or not hmac.compare_digest(signature, _user_signature(int(user_id), msg_id)):
+        return None
+    return int(user_id)
+
+
+stream_limiter = StreamLimiter(
+    StreamLimits(STREAM_MAX_PER_IP, STREAM_MAX_PER_FILE, STREAM_RATE_KBPS * 1024, STREAM_FILE_RATE_KBPS * 1024),
+    StreamLimits(
+        PREMIUM_STREAM_MAX_PER_IP,
+        PREMIUM_STREAM_MAX_PER_FILE,
+        PREMIUM_STREAM_RATE_KBPS * 1024,
+        PREMIUM_STREAM_FILE_RATE_KBPS * 1024,
+    ),
+)
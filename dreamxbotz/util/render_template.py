@@ -4,16 +4,21 @@ import jinja2
 from info import *
 from dreamxbotz.Bot import dreamxbotz
 from dreamxbotz.util.human_readable import humanbytes
-from dreamxbotz.util.file_properties import get_file_ids
+from dreamxbotz.util.custom_dl import ByteStreamer
 from dreamxbotz.server.exceptions import InvalidHash
 import urllib.parse
 import logging
-import aiohttp
 
+# Parsed once at import instead of on every /watch request.
+template_env = jinja2.Environment(loader=jinja2.FileSystemLoader("dreamxbotz/template"))
+stream_template = template_env.get_template("req.html")
+download_template = template_env.get_template("dl.html")
 
-async def render_page(id, secure_hash, src=None):
-    file = await dreamxbotz.get_messages(int(BIN_CHANNEL), int(id))
-    file_data = await get_file_ids(dreamxbotz, int(BIN_CHANNEL), int(id))
+
+async def render_page(id, secure_hash, src=None, user=None):
+    # Only needs what every bot sees the same, so a file any client already
+    # looked up (e.g. while streaming it) costs no get_messages call here.
+    file_data = await ByteStreamer(dreamxbotz).get_file_info(int(id))
     if file_data.unique_id[:6] != secure_hash:
         logging.debug(f"link hash: {secure_hash} - {file_data.unique_id[:6]}")
         logging.debug(f"Invalid hash for message with - ID {id}")
@@ -23,19 +28,16 @@ async def render_page(id, secure_hash, src=None):
         URL,
         f"{id}/{urllib.parse.quote_plus(file_data.file_name)}?hash={secure_hash}",
     )
+    if user:
+        # Keeps the signed user of the link, so the player gets their stream limits.
+        src += f"&u={urllib.parse.quote_plus(user)}"
 
-    tag = file_data.mime_type.split("/")[0].strip()
+    tag = (file_data.mime_type or "").split("/")[0].strip()
     file_size = humanbytes(file_data.file_size)
     if tag in ["video", "audio"]:
-        template_file = "dreamxbotz/template/req.html"
+        template = stream_template
     else:
-        template_file = "dreamxbotz/template/dl.html"
-        async with aiohttp.ClientSession() as s:
-            async with s.get(src) as u:
-                file_size = humanbytes(int(u.headers.get("Content-Length")))
-
-    with open(template_file) as f:
-        template = jinja2.Template(f.read())
+        template = download_template
 
     file_name = file_data.file_name.replace("_", " ")
 
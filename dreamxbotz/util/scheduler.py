@@ -0,0 +1,242 @@
+import time
+import heapq
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from info import STREAM_SCHEDULER
+from pyrogram.errors import FloodWait
+from dreamxbotz.Bot import multi_clients
+from .ttl_cache import TTLCache
+from .media_sessions import media_pools
+
+
+@dataclass
+class ClientStats:
+    """What the scheduler knows about one client."""
+    streams: int = 0
+    bytes_in_flight: int = 0
+    rate: float = 0.0
+    errors: float = 0.0
+    errors_at: float = 0.0
+    flood_until: float = 0.0
+
+
+@dataclass
+class StreamRequest:
+    size: int = 0
+    dc_id: Optional[int] = None
+
+
+class Policy(ABC):
+    """Scores a client for a new stream, the lowest score wins."""
+
+    @abstractmethod
+    def score(self, stats: ClientStats, request: StreamRequest, has_session: bool) -> float:
+        ...
+
+
+class LeastLoadedPolicy(Policy):
+    """The original behaviour: fewest active streams."""
+
+    def score(self, stats, request, has_session):
+        return stats.streams
+
+
+class WeightedPolicy(Policy):
+    """Estimated seconds until the client would have sent this stream as well.
+
+    Bytes still owed to earlier streams plus the new one are divided by the
+    client's observed GetFile rate. Recent errors and a missing media session
+    for the file's DC are charged as extra seconds.
+    """
+
+    def __init__(self, default_rate: float = 4 * 1024 * 1024, error_cost: float = 5.0, session_cost: float = 1.0):
+        self.default_rate = default_rate
+        self.error_cost = error_cost
+        self.session_cost = session_cost
+
+    def score(self, stats, request, has_session):
+        rate = stats.rate or self.default_rate
+        score = (stats.bytes_in_flight + request.size) / rate
+        score += stats.errors * self.error_cost
+        if request.dc_id is not None and not has_session:
+            score += self.session_cost
+        # Breaks ties between idle clients the old way.
+        return score + stats.streams * 1e-6
+
+
+POLICIES: Dict[str, Callable[[], Policy]] = {
+    "least_loaded": LeastLoadedPolicy,
+    "weighted": WeightedPolicy,
+}
+
+
+class Scheduler:
+    """Places new streams on clients and keeps the per-client numbers a policy needs.
+
+    attributes:
+        policy: decides between the eligible clients, see POLICIES.
+        has_session: has_session(index, dc_id), whether a client already has a
+            media session on that DC.
+        clock: time source, swapped out by the simulator.
+
+    Clients in FloodWait are skipped while any other client is available.
+    """
+
+    def __init__(self, policy: Policy, has_session: Optional[Callable[[int, int], bool]] = None,
+                 clock: Callable[[], float] = time.monotonic, rate_weight: float = 0.2, error_half_life: float = 60):
+        self.policy = policy
+        self.has_session = has_session or (lambda index, dc_id: True)
+        self.clock = clock
+        self.rate_weight = rate_weight
+        self.error_half_life = error_half_life
+        self.clients: Dict[int, ClientStats] = {}
+        # (dc_id, file_size) per message, so requests for a known file are placed with both.
+        self.files = TTLCache(4096, 86400)
+
+    def stats(self, index: int) -> ClientStats:
+        stats = self.clients.get(index)
+        if stats is None:
+            stats = self.clients[index] = ClientStats()
+        return stats
+
+    def _decay(self, stats: ClientStats) -> None:
+        now = self.clock()
+        if stats.errors:
+            stats.errors *= 0.5 ** ((now - stats.errors_at) / self.error_half_life)
+        stats.errors_at = now
+
+    def request_for(self, msg_id: int) -> StreamRequest:
+        dc_id, size = self.files.get(msg_id, (None, 0))
+        return StreamRequest(size, dc_id)
+
+    def remember(self, msg_id: int, dc_id: int, size: int) -> None:
+        self.files.set(msg_id, (dc_id, size))
+
+    def rank(self, clients: Iterable[int], request: StreamRequest) -> List[int]:
+        """Clients from best to worst for the request; flooded ones go last."""
+        now = self.clock()
+        scored = []
+        for index in clients:
+            stats = self.stats(index)
+            self._decay(stats)
+            has_session = request.dc_id is None or self.has_session(index, request.dc_id)
+            flooded = stats.flood_until > now
+            score = stats.flood_until if flooded else self.policy.score(stats, request, has_session)
+            scored.append((flooded, score, index))
+        return [index for _, _, index in sorted(scored)]
+
+    def pick(self, clients: Iterable[int], request: StreamRequest) -> int:
+        return self.rank(clients, request)[0]
+
+    def started(self, index: int, size: int) -> None:
+        stats = self.stats(index)
+        stats.streams += 1
+        stats.bytes_in_flight += size
+
+    def sent(self, index: int, nbytes: int) -> None:
+        stats = self.stats(index)
+        stats.bytes_in_flight = max(0, stats.bytes_in_flight - nbytes)
+
+    def finished(self, index: int, unsent: int) -> None:
+        stats = self.stats(index)
+        stats.streams = max(0, stats.streams - 1)
+        stats.bytes_in_flight = max(0, stats.bytes_in_flight - unsent)
+
+    def observe(self, index: int, nbytes: int, seconds: float) -> None:
+        """Feeds one GetFile result into the client's rate estimate."""
+        if nbytes <= 0 or seconds <= 0:
+            return
+        stats = self.stats(index)
+        rate = nbytes / seconds
+        stats.rate = rate if not stats.rate else stats.rate + self.rate_weight * (rate - stats.rate)
+
+    def failed(self, index: int, error: BaseException) -> None:
+        stats = self.stats(index)
+        self._decay(stats)
+        stats.errors += 1
+        if isinstance(error, FloodWait):
+            stats.flood_until = max(stats.flood_until, self.clock() + error.value)
+            logging.info(f"Client {index} is in FloodWait for {error.value}s")
+
+
+@dataclass
+class SimClient:
+    """A client in the simulator: its total bandwidth and the DCs it has sessions on."""
+    rate: float
+    dcs: Sequence[int] = ()
+    flood_until: float = 0.0
+
+
+@dataclass
+class SimResult:
+    finished: float
+    mean_completion: float
+    throughput: float
+    placements: List[int] = field(default_factory=list)
+
+
+def simulate(policy: Policy, clients: Sequence[SimClient], streams: Sequence[Tuple[float, int, int]],
+             step: float = 0.05, session_delay: float = 1.0) -> SimResult:
+    """Runs streams (arrival time, size, dc_id) against simulated clients.
+
+    A client's bandwidth is shared equally by its active streams, and a stream
+    on a DC the client has no session for waits session_delay first. Returns
+    when the last stream finished, the mean completion time and the aggregate
+    throughput, so policies can be compared without Telegram.
+    """
+    now = 0.0
+    sessions = {index: set(client.dcs) for index, client in enumerate(clients)}
+    scheduler = Scheduler(policy, lambda index, dc_id: dc_id in sessions[index], clock=lambda: now)
+    for index, client in enumerate(clients):
+        scheduler.stats(index).flood_until = client.flood_until
+    arrivals = sorted(streams)
+    active: List[list] = []  # [index, remaining, ready_at, arrived]
+    completions = []
+    placements = []
+    queue = list(arrivals)
+    heapq.heapify(queue)
+    total = sum(size for _, size, _ in arrivals)
+
+    while queue or active:
+        while queue and queue[0][0] <= now:
+            arrived, size, dc_id = heapq.heappop(queue)
+            index = scheduler.pick(range(len(clients)), StreamRequest(size, dc_id))
+            ready_at = now if dc_id in sessions[index] else now + session_delay
+            sessions[index].add(dc_id)
+            scheduler.started(index, size)
+            active.append([index, size, ready_at, arrived])
+            placements.append(index)
+        for index, client in enumerate(clients):
+            running = [stream for stream in active if stream[0] == index and stream[2] <= now]
+            if not running or scheduler.stats(index).flood_until > now:
+                continue
+            share = client.rate * step / len(running)
+            total_sent = 0
+            for stream in running:
+                sent = min(share, stream[1])
+                stream[1] -= sent
+                total_sent += sent
+                scheduler.sent(index, int(sent))
+            scheduler.observe(index, int(total_sent), step)
+        now += step
+        for stream in [stream for stream in active if stream[1] <= 0]:
+            active.remove(stream)
+            scheduler.finished(stream[0], 0)
+            completions.append(now - stream[3])
+
+    return SimResult(
+        finished=now,
+        mean_completion=sum(completions) / len(completions) if completions else 0.0,
+        throughput=total / now if now else 0.0,
+        placements=placements,
+    )
+
+
+def has_media_session(index: int, dc_id: int) -> bool:
+    pool = media_pools.get(multi_clients.get(index))
+    return bool(pool and pool.sessions.get(dc_id))
+
+
+scheduler = Scheduler(POLICIES.get(STREAM_SCHEDULER, WeightedPolicy)(), has_media_session)
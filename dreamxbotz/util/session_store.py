@@ -0,0 +1,74 @@
+import sys
+from typing import Any, Hashable, Iterable, Optional, Tuple
+
+from dreamxbotz.util.ttl_cache import TTLCache
+
+
+def approx_size(value: Any) -> int:
+    """Rough deep size in bytes of the plain values kept in a session."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item) for item in value)
+    return size
+
+
+def compact_files(files: Iterable) -> Tuple[str, ...]:
+    """Keeps only the file ids of a result page instead of the whole documents."""
+    return tuple(file.file_id for file in files)
+
+
+class SessionStore(TTLCache):
+    """Search session state with a TTL per entry and both an entry and a byte cap.
+
+    Behaves like the plain dicts it replaces (store[key] = value, store.get(key)),
+    but least recently used sessions are evicted once max_entries or max_bytes
+    is reached, so memory stays flat no matter how many searches come in.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 21600):
+        super().__init__(max_entries, ttl)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._sizes = {}
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        size = approx_size(key) + approx_size(value)
+        if self.max_bytes and size > self.max_bytes:
+            self.pop(key)
+            return
+        super().set(key, value, ttl)
+        if key not in self._data:
+            return
+        self._sizes[key] = size
+        self.bytes += size
+        while self.max_bytes and self.bytes > self.max_bytes:
+            self._drop(next(iter(self._data)))
+
+    def _drop(self, key: Hashable) -> tuple:
+        self.bytes -= self._sizes.pop(key, 0)
+        return super()._drop(key)
+
+    def clear(self) -> None:
+        super().clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def __getitem__(self, key: Hashable) -> Any:
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key: Hashable) -> None:
+        if key not in self._data:
+            raise KeyError(key)
+        self._drop(key)
+
+    def stats(self):
+        stats = super().stats()
+        stats["bytes"] = self.bytes
+        return stats
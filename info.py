@@ -84,6 +84,9 @@ COLLECTION_NAME = environ.get('COLLECTION_NAME', 'dreamcinezone_files') # Collec
 # If MULTIPLE_DB Is True Then Fill DATABASE_URI2 Value Else You Will Get Error.
 MULTIPLE_DB = is_enabled(os.environ.get('MULTIPLE_DB', "False"), False) # Type True For Turn On MULTIPLE DB FUNTION 
 DATABASE_URI2 = environ.get('DATABASE_URI2', "")  # MongoDB URI for the second database (if MULTIPLE_DB is True)
+EXTRA_DATABASE_URIS = environ.get('EXTRA_DATABASE_URIS', "").split()  # More MongoDB URIs for files after DATABASE_URI2, space separated (if MULTIPLE_DB is True)
+SHARD_PLACEMENT = environ.get('SHARD_PLACEMENT', "size").lower()  # size: fill each file database up to SHARD_SIZE_LIMIT_MB before the next, hash: spread files by file_id
+SHARD_SIZE_LIMIT_MB = int(environ.get('SHARD_SIZE_LIMIT_MB', "407"))  # Size in MB at which size placement moves on to the next database
 # ============================
 # Movie Notification & Update Settings
 # ============================
@@ -139,6 +142,20 @@ PREMIUM_USER = [int(user) if id_pattern.search(user) else user for user in envir
 # Miscellaneous Configuration
 # ============================
 ULTRA_FAST_MODE = is_enabled(environ.get('ULTRA_FAST_MODE', "False"), True) # Set to True for fast search, False for original search
+TOKEN_SEARCH = is_enabled(environ.get('TOKEN_SEARCH', "False"), False) # Search through the word token index instead of regex scans (run /migrate_tokens once before enabling)
+TOKEN_REGEX_FILTER = is_enabled(environ.get('TOKEN_REGEX_FILTER', "False"), False) # Also apply the old regex to token matches (keeps word order, costs some speed)
+SEARCH_CACHE_SIZE = int(environ.get('SEARCH_CACHE_SIZE', "1024")) # Number of search result pages kept in memory (0 disables the cache)
+SEARCH_CACHE_TTL = int(environ.get('SEARCH_CACHE_TTL', "300")) # Seconds a cached search result page stays valid. The cache is per process: with several replicas, files saved through one show up on the others only after this many seconds
+SEARCH_COUNT_MODE = environ.get('SEARCH_COUNT_MODE', "exact").lower() # How standard mode counts results: exact, capped (stop at SEARCH_COUNT_CAP and show "N+") or cached (reuse earlier counts and facet totals)
+SEARCH_COUNT_CAP = int(environ.get('SEARCH_COUNT_CAP', "1000")) # Highest total counted in capped mode
+SEARCH_COUNT_TTL = int(environ.get('SEARCH_COUNT_TTL', "3600")) # Seconds a total is reused in cached mode, new files do not reset it
+EPISODE_GROUP_FILES = int(environ.get('EPISODE_GROUP_FILES', "5")) # Files kept per episode when series results are grouped by episode
+SESSION_TTL = int(environ.get('SESSION_TTL', "21600")) # Seconds a search's buttons keep working after the last use
+SESSION_MAX_ENTRIES = int(environ.get('SESSION_MAX_ENTRIES', "10000")) # Max searches kept per session store, least recently used are dropped first
+SESSION_MAX_BYTES = int(environ.get('SESSION_MAX_BYTES', str(32 * 1024 * 1024))) # Approx memory cap in bytes per session store
+STATE_BACKEND = environ.get('STATE_BACKEND', "memory").lower() # memory keeps sessions/settings cache in this process, mongo shares them between replicas
+STATE_DB_URI = environ.get('STATE_DB_URI', DATABASE_URI) # MongoDB URI for the shared state when STATE_BACKEND is mongo
+STATE_DB_NAME = environ.get('STATE_DB_NAME', DATABASE_NAME) # Database name for the shared state
 
 MAX_B_TN = environ.get("MAX_B_TN", "5") # Maximum number of buttons in a row (default: 5)
 PORT = int(environ.get("PORT", "8080"))  # Port for the web server (default: 8080)
@@ -218,6 +235,31 @@ BIND_ADRESS = str(getenv('WEB_SERVER_BIND_ADDRESS', '0.0.0.0'))
 FQDN = str(getenv('FQDN', BIND_ADRESS)) if not ON_HEROKU or getenv('FQDN') else APP_NAME+'.herokuapp.com'
 URL = "https://{}/".format(FQDN) if ON_HEROKU or NO_PORT else "https://{}/".format(FQDN, PORT)
 SLEEP_THRESHOLD = int(environ.get('SLEEP_THRESHOLD', '60'))
+FILE_ID_CACHE_SIZE = int(environ.get('FILE_ID_CACHE_SIZE', '4096')) # File properties kept in memory for the stream routes
+FILE_ID_CACHE_TTL = int(environ.get('FILE_ID_CACHE_TTL', '1800')) # Seconds before cached file properties are fetched again
+STREAM_PREFETCH = int(environ.get('STREAM_PREFETCH', '4')) # GetFile requests kept in flight per stream (1 = no read-ahead)
+CHUNK_CACHE_SIZE_MB = int(environ.get('CHUNK_CACHE_SIZE_MB', '0')) # Disk space for cached stream chunks in MB (0 = disabled)
+CHUNK_CACHE_DIR = environ.get('CHUNK_CACHE_DIR', 'chunk_cache') # Directory for cached stream chunks
+PARALLEL_STREAM_CLIENTS = int(environ.get('PARALLEL_STREAM_CLIENTS', '1')) # Clients that fetch parts of one large download together (1 = off)
+PARALLEL_STREAM_MIN_MB = int(environ.get('PARALLEL_STREAM_MIN_MB', '64')) # Smaller ranges are served by a single client
+MAX_CLIENT_LOAD = int(environ.get('MAX_CLIENT_LOAD', '0')) # Streams a client may serve before it is left out of parallel downloads (0 = no limit)
+MEDIA_SESSIONS_PER_DC = int(environ.get('MEDIA_SESSIONS_PER_DC', '1')) # Media sessions each client keeps per DC, parts are spread over them
+MEDIA_SESSION_DCS = [int(dc) for dc in environ.get('MEDIA_SESSION_DCS', '1 2 3 4 5').split()] # DCs to open media sessions for at startup (empty = open on first use)
+MEDIA_SESSION_HEALTH_INTERVAL = int(environ.get('MEDIA_SESSION_HEALTH_INTERVAL', '60')) # Seconds between media session health checks (0 = off)
+MEDIA_SESSION_PING_TIMEOUT = int(environ.get('MEDIA_SESSION_PING_TIMEOUT', '10')) # Seconds a media session may take to answer a health check ping
+SEGMENT_SIZE_MB = int(environ.get('SEGMENT_SIZE_MB', '0')) # Serve /segment/<id>/<n> URLs of this many MB with long cache headers (0 = off)
+STREAM_SCHEDULER = environ.get('STREAM_SCHEDULER', 'weighted') # How streams are placed on clients: weighted (bytes in flight, rate, errors, DC) or least_loaded
+STREAM_MAX_PER_IP = int(environ.get('STREAM_MAX_PER_IP', '0')) # Concurrent streams one address may open (0 = no limit). Behind nginx, Docker or any other reverse proxy also set STREAM_TRUST_PROXY, or every viewer shares the proxy's address
+STREAM_MAX_PER_FILE = int(environ.get('STREAM_MAX_PER_FILE', '0')) # Concurrent streams of one file across all viewers (0 = no limit)
+STREAM_RATE_KBPS = int(environ.get('STREAM_RATE_KBPS', '0')) # Bandwidth per address in KB/s (0 = no limit)
+STREAM_FILE_RATE_KBPS = int(environ.get('STREAM_FILE_RATE_KBPS', '0')) # Bandwidth per file in KB/s (0 = no limit)
+PREMIUM_STREAM_MAX_PER_IP = int(environ.get('PREMIUM_STREAM_MAX_PER_IP', '0')) # Same limits for premium users' links
+PREMIUM_STREAM_MAX_PER_FILE = int(environ.get('PREMIUM_STREAM_MAX_PER_FILE', '0'))
+PREMIUM_STREAM_RATE_KBPS = int(environ.get('PREMIUM_STREAM_RATE_KBPS', '0'))
+PREMIUM_STREAM_FILE_RATE_KBPS = int(environ.get('PREMIUM_STREAM_FILE_RATE_KBPS', '0'))
+STREAM_TRUST_PROXY = is_enabled(environ.get('STREAM_TRUST_PROXY', str(ON_HEROKU)), ON_HEROKU) # Take the viewer address from X-Forwarded-For (only behind a proxy you control, needed there for the per-address limits)
+STREAM_SECRET = environ.get('STREAM_SECRET', BOT_TOKEN) # Key used to sign the user id in stream links
+METRICS_TOKEN = environ.get('METRICS_TOKEN', '') # Required as ?token= on /metrics (empty = /metrics is off)
 WORKERS = int(environ.get('WORKERS', '4'))
 SESSION_NAME = str(environ.get('SESSION_NAME', 'dreamXBotz'))
 MULTI_CLIENT = False
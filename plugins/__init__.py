@@ -1,5 +1,6 @@
 from aiohttp import web
 from .route import routes
+from dreamxbotz.util.metrics import http_responses
 from asyncio import sleep 
 from datetime import datetime
 from database.users_chats_db import db
@@ -11,8 +12,21 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logging.getLogger("pyrogram").setLevel(logging.ERROR)
 
+@web.middleware
+async def count_responses(request, handler):
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        http_responses.inc(e.status)
+        raise
+    except Exception:
+        http_responses.inc(500)
+        raise
+    http_responses.inc(getattr(response, "status", 500))
+    return response
+
 async def web_server():
-    web_app = web.Application(client_max_size=30000000)
+    web_app = web.Application(client_max_size=30000000, middlewares=[count_responses])
     web_app.add_routes(routes)
     return web_app
 
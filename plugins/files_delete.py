@@ -2,7 +2,7 @@ import re
 import logging
 from pyrogram import Client, filters
 from info import DELETE_CHANNELS
-from database.ia_filterdb import Media, Media2, unpack_new_file_id
+from database.ia_filterdb import router, unpack_new_file_id, invalidate_search_cache
 logger = logging.getLogger(__name__)
 
 media_filter = filters.document | filters.video | filters.audio
@@ -20,48 +20,22 @@ async def deletemultiplemedia(bot, message):
         return
 
     file_id, file_ref = unpack_new_file_id(media.file_id)
-    if await Media.count_documents({'file_id': file_id}):
-        result = await Media.collection.delete_one({
-            '_id': file_id,
-        })
-    else:
-        result = await Media2.collection.delete_one({
-            '_id': file_id,
-        })
-    if result.deleted_count:
-        logger.info('File is successfully deleted from database.')
-    else:
+    deleted = await router.delete_file(file_id)
+    if not deleted:
         file_name = re.sub(r"(_|\-|\.|\+)", " ", str(media.file_name))
-        result = await Media.collection.delete_many({
+        deleted = await router.delete_many({
             'file_name': file_name,
             'file_size': media.file_size,
             'mime_type': media.mime_type
             })
-        if result.deleted_count:
-            logger.info('File is successfully deleted from database.')
-        else:
-            result = await Media2.collection.delete_many({
-                'file_name': file_name,
-                'file_size': media.file_size,
-                'mime_type': media.mime_type
-                })
-            if result.deleted_count:
-                logger.info('File is successfully deleted from database.')
-            else:
-                result = await Media.collection.delete_many({
-                    'file_name': media.file_name,
-                    'file_size': media.file_size,
-                    'mime_type': media.mime_type
-                })
-                if result.deleted_count:
-                    logger.info('File is successfully deleted from database.')
-                else:
-                    result = await Media2.collection.delete_many({
-                        'file_name': media.file_name,
-                        'file_size': media.file_size,
-                        'mime_type': media.mime_type
-                    })
-                    if result.deleted_count:
-                        logger.info('File is successfully deleted from database.')
-                    else:
-                        logger.info('File not found in database.')
\ No newline at end of file
+    if not deleted:
+        deleted = await router.delete_many({
+            'file_name': media.file_name,
+            'file_size': media.file_size,
+            'mime_type': media.mime_type
+        })
+    if deleted:
+        logger.info('File is successfully deleted from database.')
+    else:
+        logger.info('File not found in database.')
+    invalidate_search_cache()
@@ -6,8 +6,10 @@ from pyrogram import Client, filters, enums
 from pyrogram.errors import FloodWait
 from pyrogram.errors.exceptions.bad_request_400 import ChannelInvalid, ChatAdminRequired, UsernameInvalid, UsernameNotModified
 from info import ADMINS, INDEX_REQ_CHANNEL as LOG_CHANNEL
-from database.ia_filterdb import save_file
+from database.ia_filterdb import save_files, backfill_tokens, backfill_all_media_info, dedupe_media_files, invalidate_search_cache, media_models, unpack_new_file_id
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from database.users_chats_db import db
+from dreamxbotz.Bot import multi_clients
 from utils import temp, get_readable_time
 from math import ceil
 
@@ -15,11 +17,28 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 lock = asyncio.Lock()
+# Chats waiting for or holding the lock; asyncio.Lock wakes waiters in order.
+index_queue = []
+index_tasks = set()
+# chat -> cancelled, for every queued or running job.
+index_cancel = {}
+# Checkpoint keys counted per window; also what get_index_media returns for skipped messages.
+INDEX_COUNTERS = ('saved', 'duplicate', 'errors', 'deleted', 'no_media', 'unsupported')
+# Seconds between progress edits, the checkpoint is still saved after every window.
+PROGRESS_INTERVAL = 5
 
 @Client.on_callback_query(filters.regex(r'^index'))
 async def index_files(bot, query):
     if query.data.startswith('index_cancel'):
-        temp.CANCEL = True
+        _, _, chat = query.data.partition('#')
+        try:
+            chat = int(chat)
+        except:
+            # Buttons from before the chat was in the callback cancel the running job.
+            chat = chat or (index_queue[0] if index_queue else None)
+        if chat not in index_cancel:
+            return await query.answer("This indexing is no longer running.")
+        index_cancel[chat] = True
         return await query.answer("Cancelling Indexing")
     _, raju, chat, lst_msg_id, from_user = query.data.split("#")
     if raju == 'reject':
@@ -29,26 +48,30 @@ async def index_files(bot, query):
                                reply_to_message_id=int(lst_msg_id))
         return
 
-    if lock.locked():
-        return await query.answer('Wait until previous process complete.', show_alert=True)
+    try:
+        chat = int(chat)
+    except:
+        chat = chat
+    if chat in index_queue:
+        return await query.answer('This chat is already queued for indexing.', show_alert=True)
     msg = query.message
 
     await query.answer('Processing...⏳', show_alert=True)
-    if int(from_user) not in ADMINS:
+    if raju == 'accept' and int(from_user) not in ADMINS:
         await bot.send_message(int(from_user),
                                f'Your Submission for indexing {chat} has been accepted by our moderators and will be added soon.',
                                reply_to_message_id=int(lst_msg_id))
-    await msg.edit(
-        "Starting Indexing",
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton('Cancel', callback_data='index_cancel')]]
-        )
-    )
-    try:
-        chat = int(chat)
-    except:
-        chat = chat
-    await index_files_to_db(int(lst_msg_id), chat, msg, bot)
+    index_queue.append(chat)
+    index_cancel[chat] = False
+    cancel_markup = InlineKeyboardMarkup([[InlineKeyboardButton('Cancel', callback_data=f'index_cancel#{chat}')]])
+    if lock.locked():
+        await msg.edit(f"⏳ Queued For Indexing, Position: <code>{len(index_queue) - 1}</code>", reply_markup=cancel_markup)
+    else:
+        await msg.edit("Starting Indexing", reply_markup=cancel_markup)
+    # The skip is taken now, a later /setskip belongs to the next request.
+    task = asyncio.create_task(index_files_to_db(int(lst_msg_id), chat, msg, bot, skip=temp.CURRENT, resume=raju == 'resume'))
+    index_tasks.add(task)
+    task.add_done_callback(index_tasks.discard)
 
 
 @Client.on_message((filters.forwarded | (filters.regex(r"(https://)?(t\.me/|telegram\.me/|telegram\.dog/)(c/)?(\d+|[a-zA-Z_0-9]+)/(\d+)$")) & filters.text ) & filters.private & filters.incoming)
@@ -88,10 +111,13 @@ async def send_for_index(bot, message):
             [InlineKeyboardButton('Yes', callback_data=f'index#accept#{chat_id}#{last_msg_id}#{message.from_user.id}')],
             [InlineKeyboardButton('Close', callback_data='close_data')]
         ]
+        text = f'Do you Want To Index This Channel/ Group ?\n\nChat ID/ Username: <code>{chat_id}</code>\nLast Message ID: <code>{last_msg_id}</code>\n\nɴᴇᴇᴅ sᴇᴛsᴋɪᴘ 👉🏻 /setskip'
+        checkpoint = await db.get_index_checkpoint(chat_id)
+        if checkpoint and checkpoint['current'] < last_msg_id:
+            buttons.insert(1, [InlineKeyboardButton(f"Resume From {checkpoint['current']}", callback_data=f'index#resume#{chat_id}#{last_msg_id}#{message.from_user.id}')])
+            text += f"\n\nA previous run stopped at message <code>{checkpoint['current']}</code>."
         reply_markup = InlineKeyboardMarkup(buttons)
-        return await message.reply(
-            f'Do you Want To Index This Channel/ Group ?\n\nChat ID/ Username: <code>{chat_id}</code>\nLast Message ID: <code>{last_msg_id}</code>\n\nɴᴇᴇᴅ sᴇᴛsᴋɪᴘ 👉🏻 /setskip',
-            reply_markup=reply_markup)
+        return await message.reply(text, reply_markup=reply_markup)
 
     if type(chat_id) is int:
         try:
@@ -124,134 +150,318 @@ async def set_skip_number(bot, message):
     else:
         await message.reply("Give me a skip number")
 
+@Client.on_message(filters.command('migrate_tokens') & filters.user(ADMINS))
+async def migrate_tokens(bot, message):
+    """Backfill search tokens for files indexed before the token index existed."""
+    msg = await message.reply("Bᴀᴄᴋꜰɪʟʟɪɴɢ ꜱᴇᴀʀᴄʜ ᴛᴏᴋᴇɴꜱ...⏳", quote=True)
+    start_time = time.time()
+    try:
+        updated = 0
+        for model in media_models():
+            updated += await backfill_tokens(model)
+    except Exception as e:
+        logger.exception(e)
+        return await msg.edit(f"❌ Error: <code>{e}</code>")
+    finally:
+        invalidate_search_cache()
+    await msg.edit(
+        f"✅ Token backfill completed!\n"
+        f"Updated: <code>{updated}</code>\n"
+        f"⏱️ Elapsed: <code>{get_readable_time(time.time() - start_time)}</code>"
+    )
+
+@Client.on_message(filters.command('migrate_media_info') & filters.user(ADMINS))
+async def migrate_media_info(bot, message):
+    """Backfill series/season/episode/quality/language fields for files indexed before they existed."""
+    msg = await message.reply("Bᴀᴄᴋꜰɪʟʟɪɴɢ ᴍᴇᴅɪᴀ ɪɴꜰᴏ...⏳", quote=True)
+    start_time = time.time()
+    try:
+        updated = await backfill_all_media_info()
+    except Exception as e:
+        logger.exception(e)
+        return await msg.edit(f"❌ Error: <code>{e}</code>")
+    await msg.edit(
+        f"✅ Media info backfill completed!\n"
+        f"Updated: <code>{updated}</code>\n"
+        f"⏱️ Elapsed: <code>{get_readable_time(time.time() - start_time)}</code>"
+    )
+
+@Client.on_message(filters.command('dedupe_files') & filters.user(ADMINS))
+async def dedupe_files(bot, message):
+    """Delete files stored more than once, so the file_id index can be made unique."""
+    msg = await message.reply("Rᴇᴍᴏᴠɪɴɢ ᴅᴜᴘʟɪᴄᴀᴛᴇ ꜰɪʟᴇꜱ...⏳", quote=True)
+    start_time = time.time()
+    try:
+        deleted = await dedupe_media_files()
+    except Exception as e:
+        logger.exception(e)
+        return await msg.edit(f"❌ Error: <code>{e}</code>")
+    await msg.edit(
+        f"✅ Duplicate removal completed!\n"
+        f"Deleted: <code>{deleted}</code>\n"
+        f"⏱️ Elapsed: <code>{get_readable_time(time.time() - start_time)}</code>"
+    )
+
 def get_progress_bar(percent, length=10):
     """Creates an emoji-based progress bar."""
     filled = int(length * percent / 100)
     unfilled = length - filled
     return '🟩' * filled + '⬜️' * unfilled
 
-async def index_files_to_db(lst_msg_id, chat, msg, bot):
-    total_files = 0
-    duplicate = 0
-    errors = 0
-    deleted = 0
-    no_media = 0
-    unsupported = 0
+def get_index_media(message):
+    """The indexable media of a message, or the counter name it falls under."""
+    if message.empty:
+        return 'deleted'
+    if not message.media:
+        return 'no_media'
+    if message.media not in [enums.MessageMediaType.VIDEO, enums.MessageMediaType.AUDIO, enums.MessageMediaType.DOCUMENT]:
+        return 'unsupported'
+    media = getattr(message, message.media.value, None)
+    if not media:
+        return 'unsupported'
+    media.file_type = message.media.value
+    media.caption = message.caption
+    return media
+
+async def get_messages_with_backoff(client, chat, message_ids, retries=3):
+    """get_messages that sleeps out a FloodWait on this client only, other clients keep going."""
+    for attempt in range(retries):
+        try:
+            messages = await client.get_messages(chat, message_ids)
+            return messages if isinstance(messages, list) else [messages]
+        except FloodWait as e:
+            if attempt == retries - 1:
+                raise
+            logger.warning(f"FloodWait of {e.value}s on client {client.name} while indexing {chat}")
+            await asyncio.sleep(e.value)
+
+async def get_index_clients(bot, chat, probe_id):
+    """The main bot plus every extra client that can read the chat."""
+    clients = [bot]
+    for client in multi_clients.values():
+        if client is bot:
+            continue
+        try:
+            await client.get_messages(chat, probe_id)
+            clients.append(client)
+        except Exception as e:
+            logger.info(f"Client {client.name} can't read {chat}, not used for indexing: {e}")
+    return clients
+
+async def file_ids_portable(bot, client, chat, message, media, portable):
+    """
+    Whether client gets the same packed file_id for a message as the main bot,
+    which sends the files later. Checked once per client with one message and
+    kept in portable; when it holds, what the client fetched is saved as is
+    (with its file_ref), otherwise its media is fetched again through the bot.
+    """
+    if client not in portable:
+        try:
+            own = get_index_media((await get_messages_with_backoff(bot, chat, [message.id]))[0])
+        except Exception as e:
+            logger.warning(f"Could not compare file ids of client {client.name} on {chat}: {e}")
+            return False
+        portable[client] = not isinstance(own, str) and unpack_new_file_id(own.file_id)[0] == unpack_new_file_id(media.file_id)[0]
+        logger.info(f"File ids of client {client.name} {'match' if portable[client] else 'differ from'} the main bot's")
+    return portable[client]
+
+async def index_window(bot, client, chat, message_ids, portable):
+    """Fetches one window of messages through client and saves its media, returns its counters."""
+    counts = dict.fromkeys(INDEX_COUNTERS, 0)
+    try:
+        messages = await get_messages_with_backoff(client, chat, message_ids)
+    except Exception as e:
+        logger.error(f"Failed fetching {message_ids[0]}-{message_ids[-1]} of {chat}: {e}")
+        counts['errors'] += len(message_ids)
+        return counts
+    found = []
+    for message in messages:
+        try:
+            media = get_index_media(message)
+            if isinstance(media, str):
+                counts[media] += 1
+            else:
+                found.append((message, media))
+        except Exception:
+            counts['errors'] += 1
+    medias = [media for _, media in found]
+    if found and client is not bot and not await file_ids_portable(bot, client, chat, *found[0], portable):
+        medias = []
+        try:
+            for message in await get_messages_with_backoff(bot, chat, [message.id for message, _ in found]):
+                media = get_index_media(message)
+                if isinstance(media, str):
+                    counts['errors'] += 1
+                else:
+                    medias.append(media)
+        except Exception as e:
+            logger.exception(e)
+            counts['errors'] += len(found)
+    try:
+        # The job clears the search cache as its checkpoint moves, not per window.
+        saved, dup, errs = await save_files(medias, invalidate=False)
+        counts['saved'] += saved
+        counts['duplicate'] += dup
+        counts['errors'] += errs
+    except Exception as e:
+        logger.exception(e)
+        counts['errors'] += len(medias)
+    return counts
+
+async def index_files_to_db(lst_msg_id, chat, msg, bot, skip=0, resume=False):
+    stats = dict.fromkeys(INDEX_COUNTERS, 0)
     BATCH_SIZE = 200
     start_time = time.time()
+    resume_markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton('Resume', callback_data=f'index#resume#{chat}#{lst_msg_id}#0')],
+        [InlineKeyboardButton('Close', callback_data='close_data')]
+    ])
+    cancel_markup = InlineKeyboardMarkup([[InlineKeyboardButton('Cancel', callback_data=f'index_cancel#{chat}')]])
 
     async with lock:
         try:
-            current = temp.CURRENT
-            temp.CANCEL = False
+            if index_cancel.get(chat):
+                return await msg.edit("⛔ Indexing Cancelled Before It Started!", reply_markup=resume_markup)
+            start = current = skip
+            checkpoint = await db.get_index_checkpoint(chat) if resume else None
+            if checkpoint:
+                start = checkpoint['start']
+                current = checkpoint['current']
+                lst_msg_id = max(lst_msg_id, checkpoint['last_msg_id'])
+                for key in INDEX_COUNTERS:
+                    stats[key] = checkpoint[key]
             total_messages = lst_msg_id
-            total_fetch = lst_msg_id - current
-            if total_messages <= 0:
+            total_fetch = lst_msg_id - start
+            if lst_msg_id - current <= 0:
                 await msg.edit(
                     "🚫 No Messages To Index.",
                     reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('Close', callback_data='close_data')]])
                 )
                 return
-            batches = ceil(total_messages / BATCH_SIZE)
+            batches = ceil((lst_msg_id - current) / BATCH_SIZE)
             batch_times = []
+            clients = await get_index_clients(bot, chat, lst_msg_id)
             await msg.edit(
-                f"📊 Indexing Starting......\n"
+                f"📊 Indexing {'Resuming' if checkpoint else 'Starting'}......\n"
                 f"💬 Total Messages: <code>{total_messages}</code>\n"
                 f"📋 Total Fetch: <code> {total_fetch}</code>\n"
+                f"🤖 Clients: <code>{len(clients)}</code>\n"
                 f"⏰ Elapsed: <code>{get_readable_time(time.time() - start_time)}</code>",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('Cancel', callback_data='index_cancel')]])
+                reply_markup=cancel_markup
             )
-            for batch in range(batches):
-                if temp.CANCEL:
-                    break
-                batch_start = time.time()
-                start_id = current + 1
-                end_id = min(current + BATCH_SIZE, lst_msg_id)
-                message_ids = range(start_id, end_id + 1)
-                try:
-                    messages = await bot.get_messages(chat, list(message_ids))
-                    if not isinstance(messages, list):
-                        messages = [messages]
-                except Exception as e:
-                    errors += len(message_ids)
-                    current += len(message_ids)
-                    continue
-                save_tasks = []
-                for message in messages:
-                    current += 1
-                    try:
-                        if message.empty:
-                            deleted += 1
-                            continue
-                        elif not message.media:
-                            no_media += 1
-                            continue
-                        elif message.media not in [enums.MessageMediaType.VIDEO, enums.MessageMediaType.AUDIO, enums.MessageMediaType.DOCUMENT]:
-                            unsupported += 1
-                            continue
-                        media = getattr(message, message.media.value, None)
-                        if not media:
-                            unsupported += 1
-                            continue
-                        media.file_type = message.media.value
-                        media.caption = message.caption
-                        save_tasks.append(save_file(media))
 
-                    except Exception:
-                        errors += 1
-                        continue
-                results = await asyncio.gather(*save_tasks, return_exceptions=True)
-                for result in results:
-                    if isinstance(result, Exception):
-                        errors += 1
-                    else:
-                        ok, code = result
-                        if ok:
-                            total_files += 1
-                        elif code == 0:
-                            duplicate += 1
-                        elif code == 2:
-                            errors += 1
-                batch_time = time.time() - batch_start
-                batch_times.append(batch_time)
+            # Every client pulls the next window as soon as it is done with its last
+            # one, so a client in FloodWait only holds up the window it is on.
+            windows = asyncio.Queue()
+            for number in range(batches):
+                windows.put_nowait((number, current + 1 + number * BATCH_SIZE))
+            # Windows finish out of order. Their counters wait here until every
+            # window before them is done, so the checkpoint only moves forward
+            # over finished windows and a resume never skips or recounts one.
+            finished = {}
+            portable = {}
+            batch = 0
+            last_edit = 0
+            checkpoint_lock = asyncio.Lock()
+
+            async def progress():
+                nonlocal batch, current, last_edit
+                if batch not in finished:
+                    return
+                saved = stats['saved']
+                while batch in finished:
+                    counts, current = finished.pop(batch)
+                    for key in INDEX_COUNTERS:
+                        stats[key] += counts[key]
+                    batch += 1
+                if stats['saved'] > saved:
+                    invalidate_search_cache()
+                async with checkpoint_lock:
+                    await db.save_index_checkpoint(chat, {
+                        'last_msg_id': lst_msg_id,
+                        'start': start,
+                        'current': current,
+                        **stats,
+                    })
+                if time.time() - last_edit < PROGRESS_INTERVAL:
+                    return
+                last_edit = time.time()
                 elapsed = time.time() - start_time
-                progress = current - temp.CURRENT
-                percentage = (progress / total_fetch) * 100
+                done = current - start
+                percentage = (done / total_fetch) * 100
                 avg_batch_time = sum(batch_times) / len(batch_times) if batch_times else 1
-                eta = (total_fetch - progress) / BATCH_SIZE * avg_batch_time
+                eta = (total_fetch - done) / BATCH_SIZE * avg_batch_time / len(clients)
                 progress_bar = get_progress_bar(int(percentage))
-                await msg.edit(
-                    f"📊 Indexing Progress 📦 Batch {batch + 1}/{batches}\n"
-                    f"{progress_bar} <code>{percentage:.1f}%</code>\n\n"
-                    f"Total Messages: <code>{total_messages}</code>\n"
-                    f"Total Fetched: <code>{total_fetch}</code>\n"
-                    f"Fetched: <code>{current}</code>\n"
-                    f"Saved: <code>{total_files}</code>\n"
-                    f"Duplicates: <code>{duplicate}</code>\n"
-                    f"Deleted: <code>{deleted}</code>\n"
-                    f"Non-Media: <code>{no_media + unsupported}</code> (Unsupported: <code>{unsupported}</code>)\n"
-                    f"Errors: <code>{errors}</code>\n"
-                    f"⏱️ Elapsed: <code>{get_readable_time(elapsed)}</code>\n"
-                    f"⏰ ETA: <code>{get_readable_time(eta)}</code>",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('Cancel', callback_data='index_cancel')]])
-                )
+                try:
+                    await msg.edit(
+                        f"📊 Indexing Progress 📦 Batch {batch}/{batches}\n"
+                        f"{progress_bar} <code>{percentage:.1f}%</code>\n\n"
+                        f"Total Messages: <code>{total_messages}</code>\n"
+                        f"Total Fetched: <code>{total_fetch}</code>\n"
+                        f"Fetched: <code>{current}</code>\n"
+                        f"Saved: <code>{stats['saved']}</code>\n"
+                        f"Duplicates: <code>{stats['duplicate']}</code>\n"
+                        f"Deleted: <code>{stats['deleted']}</code>\n"
+                        f"Non-Media: <code>{stats['no_media'] + stats['unsupported']}</code> (Unsupported: <code>{stats['unsupported']}</code>)\n"
+                        f"Errors: <code>{stats['errors']}</code>\n"
+                        f"⏱️ Elapsed: <code>{get_readable_time(elapsed)}</code>\n"
+                        f"⏰ ETA: <code>{get_readable_time(eta)}</code>",
+                        reply_markup=cancel_markup
+                    )
+                except FloodWait as e:
+                    last_edit += e.value
+                except Exception as e:
+                    logger.warning(f"Could not update indexing progress of {chat}: {e}")
+
+            async def worker(client):
+                while not index_cancel.get(chat):
+                    try:
+                        number, start_id = windows.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    message_ids = list(range(start_id, min(start_id + BATCH_SIZE - 1, lst_msg_id) + 1))
+                    window_start = time.time()
+                    counts = await index_window(bot, client, chat, message_ids, portable)
+                    batch_times.append(time.time() - window_start)
+                    finished[number] = (counts, message_ids[-1])
+                    await progress()
+
+            workers = [asyncio.create_task(worker(client)) for client in clients]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
             elapsed = time.time() - start_time
+            if index_cancel.get(chat):
+                title = "⛔ Indexing Cancelled!"
+                reply_markup = resume_markup
+            else:
+                title = "✅ Indexing Completed!"
+                reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton('Close', callback_data='close_data')]])
+                await db.delete_index_checkpoint(chat)
             await msg.edit(
-                f"✅ Indexing Completed!\n"
+                f"{title}\n"
                 f"Total Messages: <code>{total_messages}</code>\n"
                 f"Total Fetched: <code>{total_fetch}</code>\n"
                 f"Fetched: <code>{current}</code>\n"
-                f"Saved: <code>{total_files}</code>\n"
-                f"Duplicates: <code>{duplicate}</code>\n"
-                f"Deleted: <code>{deleted}</code>\n"
-                f"Non-Media: <code>{no_media + unsupported}</code> (Unsupported: <code>{unsupported}</code>)\n"
-                f"Errors: <code>{errors}</code>\n"
+                f"Saved: <code>{stats['saved']}</code>\n"
+                f"Duplicates: <code>{stats['duplicate']}</code>\n"
+                f"Deleted: <code>{stats['deleted']}</code>\n"
+                f"Non-Media: <code>{stats['no_media'] + stats['unsupported']}</code> (Unsupported: <code>{stats['unsupported']}</code>)\n"
+                f"Errors: <code>{stats['errors']}</code>\n"
                 f"⏱️ Elapsed: <code>{get_readable_time(elapsed)}</code>",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('Close', callback_data='close_data')]])
+                reply_markup=reply_markup
             )
         except Exception as e:
+            logger.exception(e)
             await msg.edit(
                 f"❌ Error: <code>{e}</code>",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('Close', callback_data='close_data')]])
+                reply_markup=resume_markup
             )
-
+        finally:
+            # Windows saved after the last checkpoint move, e.g. on cancel.
+            invalidate_search_cache()
+            if chat in index_queue:
+                index_queue.remove(chat)
+            index_cancel.pop(chat, None)
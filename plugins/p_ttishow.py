@@ -3,7 +3,8 @@ from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.errors.exceptions.bad_request_400 import MessageTooLong, PeerIdInvalid
 from info import ADMINS,MULTIPLE_DB, LOG_CHANNEL, OWNER_LNK, MELCOW_PHOTO
 from database.users_chats_db import db, db2
-from database.ia_filterdb import Media, Media2, db as db_stats, db2 as db2_stats
+from database.ia_filterdb import router, db as db_stats, search_cache
+from dreamxbotz.util.custom_dl import chunk_cache
 from utils import get_size, temp, get_settings, get_readable_time
 from Script import script
 from pyrogram.errors import ChatAdminRequired
@@ -163,7 +164,7 @@ async def get_stats(bot, message):
         total_users = await db.total_users_count()
         totl_chats = await db.total_chat_count()
         premium = await db.all_premium_users()
-        file1 = await Media.count_documents()
+        file1 = await router.shards[0].model.count_documents()
         DB_SIZE = 512 * 1024 * 1024
         dbstats = await db_stats.command("dbStats")
         db_size = dbstats['dataSize'] + dbstats['indexSize']
@@ -171,17 +172,26 @@ async def get_stats(bot, message):
         uptime = get_readable_time(time() - botStartTime)
         ram = psutil.virtual_memory().percent
         cpu = psutil.cpu_percent()
+        cache = search_cache.stats()
+        cache_stats = f"{cache['hits']} ʜɪᴛ / {cache['misses']} ᴍɪss ({cache['hit_ratio']:.0%})"
+        if chunk_cache:
+            chunks = chunk_cache.stats()
+            chunk_stats = f"{get_size(chunks['bytes'])}, {chunks['hit_ratio']:.0%} ʜɪᴛ"
+        else:
+            chunk_stats = "ᴏꜰꜰ"
         if MULTIPLE_DB == False:
             await msg.edit(script.STATUS_TXT.format(
-                total_users, totl_chats, premium, file1, get_size(db_size), get_size(free), uptime, ram, cpu))                                               
+                total_users, totl_chats, premium, file1, get_size(db_size), get_size(free), uptime, ram, cpu, cache_stats, chunk_stats))                                               
             return
-        file2 = await Media2.count_documents()
-        db2stats = await db2_stats.command("dbStats")
-        db2_size = db2stats['dataSize'] + db2stats['indexSize']
-        free2 = DB_SIZE - db2_size
+        # The second section covers every file database after the first.
+        others = router.shards[1:]
+        file2 = sum(await router.fan_out(lambda model: model.count_documents(), others))
+        others_stats = await asyncio.gather(*[shard.db.command("dbStats") for shard in others])
+        db2_size = sum(stats['dataSize'] + stats['indexSize'] for stats in others_stats)
+        free2 = DB_SIZE * len(others) - db2_size
         await msg.edit(script.MULTI_STATUS_TXT.format(
             total_users, totl_chats, premium, file1, get_size(db_size), get_size(free),
-            file2, get_size(db2_size), get_size(free2), uptime, ram, cpu, (int(file1) + int(file2))
+            file2, get_size(db2_size), get_size(free2), uptime, ram, cpu, cache_stats, chunk_stats, (int(file1) + int(file2))
             ))
     except Exception as e:
        print(f"Error In stats :- {e}")        
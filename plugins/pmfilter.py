@@ -1,10 +1,13 @@
-from utils import get_size, is_subscribed, is_req_subscribed, group_setting_buttons, get_poster, get_posterx, temp, get_settings, save_group_settings, get_cap, imdb, is_check_admin, extract_request_content, log_error, clean_filename, generate_season_variations, clean_search_text
+from utils import get_size, is_subscribed, is_req_subscribed, group_setting_buttons, get_poster, get_posterx, temp, get_settings, save_group_settings, get_cap, imdb, is_check_admin, extract_request_content, log_error, clean_filename, clean_search_text
 import tracemalloc
 from fuzzywuzzy import process
 from dreamxbotz.util.file_properties import get_name, get_hash
+from dreamxbotz.util.rate_limit import stream_user_token
+from dreamxbotz.util.session_store import compact_files
+from database.state_db import state
 from urllib.parse import quote_plus
 import logging
-from database.ia_filterdb import Media, Media2, get_file_details, get_search_results, get_bad_files, get_series_episode_groups
+from database.ia_filterdb import router, get_file_details, get_search_results, get_bad_files, get_facet_counts, facet_total, cursor_page, invalidate_search_cache, get_series_episode_groups, is_series_search, resolve_max_results
 from database.config_db import mdb
 from pyrogram.errors import FloodWait, UserIsBlocked, MessageNotModified, PeerIdInvalid, ChatAdminRequired, UserNotParticipant
 from pyrogram import Client, filters, enums
@@ -30,12 +33,92 @@ tracemalloc.start()
 
 TIMEZONE = "Asia/Kolkata"
 BUTTON = {}
-BUTTONS = {}
-FRESH = {}
+BUTTONS = state.namespace("buttons")
+FRESH = state.namespace("fresh")
 BUTTONS0 = {}
 BUTTONS1 = {}
 BUTTONS2 = {}
 SPELL_CHECK = {}
+PAGE_CURSORS = state.namespace("page_cursors")
+# Active quality/language/season filter per result message, e.g. {"quality": "720p"}.
+FACETS = state.namespace("facets")
+# Facet counts of the search behind a result message, computed with its first page.
+FACET_COUNTS = state.namespace("facet_counts")
+
+
+async def get_session_facets(key, search):
+    """The cached facet counts of a result message, computed once if missing."""
+    counts = await FACET_COUNTS.get(key)
+    if counts is None:
+        counts = await get_facet_counts(search)
+        if counts is not None:
+            await FACET_COUNTS.set(key, counts)
+    return counts
+
+
+def facet_buttons(options, counts, prefix, key):
+    """
+    Two-per-row menu buttons for (label, value, count_key) options. Options
+    without matches are hidden. Without any counts for the facet (files indexed
+    before /migrate_media_info) every option is shown, unlabelled, as before.
+    """
+    buttons = []
+    for label, value, count_key in options:
+        count = counts.get(count_key, 0)
+        if counts and not count:
+            continue
+        text = f"{label} ({count})" if counts else label
+        buttons.append(InlineKeyboardButton(text=text, callback_data=f"{prefix}#{value}#{key}"))
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+
+def episode_group_buttons(groups, key, with_files):
+    """A header button per episode group, opening that episode, followed by its files."""
+    btn = []
+    for group in groups:
+        if group.key is None:
+            header = InlineKeyboardButton(f"📁 {group.label} ({group.count})", callback_data="pages")
+        else:
+            season, episode = group.key
+            header = InlineKeyboardButton(f"📺 {group.label} ({group.count})", callback_data=f"fs#s{season}e{episode}#{key}")
+        btn.append([header])
+        if with_files:
+            btn.extend(
+                [InlineKeyboardButton(text=f"🔗 {get_size(file.file_size)} ≽ " + clean_filename(
+                    file.file_name), callback_data=f'file#{file.file_id}')]
+                for file in group.files
+            )
+    return btn
+
+
+def episode_groups_caption(groups, chat_id):
+    """The text-mode listing of episode groups and their files."""
+    cap = ""
+    for group in groups:
+        cap += f"\n\n<b><u>{group.label}</u> ({group.count})</b>"
+        for file in group.files:
+            cap += f"<b>\n• <a href='https://telegram.me/{temp.U_NAME}?start=file_{chat_id}_{file.file_id}'>[{get_size(file.file_size)}] {clean_filename(file.file_name)}</a></b>"
+    return cap
+
+
+def episode_pagination(req, key, offset, n_offset, page_size, total_groups):
+    """Back / page / next row for episode group pages; offsets count groups."""
+    page = int(offset) // page_size
+    if total_groups is None:
+        page_label = f"{page + 1}"
+    else:
+        page_label = f"{page + 1}/{max(1, math.ceil(total_groups / page_size))}"
+    pagination = []
+    if page > 0:
+        pagination.append(InlineKeyboardButton("⋞ ʙᴀᴄᴋ", callback_data=f"eps_{req}_{key}_{(page - 1) * page_size}"))
+    elif n_offset:
+        pagination.append(InlineKeyboardButton("ᴘᴀɢᴇ", callback_data="pages"))
+    if not n_offset and page == 0:
+        return [InlineKeyboardButton("↭ ɴᴏ ᴍᴏʀᴇ ᴘᴀɢᴇꜱ ᴀᴠᴀɪʟᴀʙʟᴇ ↭", callback_data="pages")]
+    pagination.append(InlineKeyboardButton(page_label, callback_data="pages"))
+    if n_offset:
+        pagination.append(InlineKeyboardButton("ɴᴇxᴛ ⋟", callback_data=f"eps_{req}_{key}_{n_offset}"))
+    return pagination
 
 
 @Client.on_message(filters.group & filters.text & filters.incoming)
@@ -141,31 +224,27 @@ async def refercall(bot, query):
 
 @Client.on_callback_query(filters.regex(r"^next"))
 async def next_page(bot, query):
-    ident, req, key, offset = query.data.split("_")
+    # The offset is an opaque cursor and may itself contain "_".
+    ident, req, key, offset = query.data.split("_", 3)
     curr_time = datetime.now(pytz.timezone('Asia/Kolkata')).time()
     if int(req) not in [query.from_user.id, 0]:
         return await query.answer(script.ALRT_TXT.format(query.from_user.first_name), show_alert=True)
-    try:
-        offset = int(offset)
-    except:
-        offset = 0
-    if BUTTONS.get(key) != None:
-        search = BUTTONS.get(key)
-    else:
-        search = FRESH.get(key)
+    if offset in ("", "None"):
+        offset = "0"
+    search = await BUTTONS.get(key)
+    if search is None:
+        search = await FRESH.get(key)
     if not search:
         await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
         return
-    files, n_offset, total = await get_search_results(query.message.chat.id, search, offset=offset, filter=True)
-    try:
-        n_offset = int(n_offset)
-    except:
-        n_offset = 0
+    facets = await FACETS.get(key)
+    known_total = facet_total(await FACET_COUNTS.get(key), facets)
+    files, n_offset, total = await get_search_results(query.message.chat.id, search, offset=offset, filter=True, facets=facets, total=known_total)
 
     if not files:
         return
-    temp.GETALL[key] = files
-    temp.SHORT[query.from_user.id] = query.message.chat.id
+    await temp.GETALL.set(key, compact_files(files))
+    await temp.SHORT.set(query.from_user.id, query.message.chat.id)
     settings = await get_settings(query.message.chat.id)
     if settings.get('button'):
         btn = [
@@ -212,104 +291,33 @@ async def next_page(bot, query):
                 "ʀᴇᴍᴏᴠᴇ ᴀᴅs", url=f"https://t.me/{temp.U_NAME}?start=premium"),
             InlineKeyboardButton("Sᴇɴᴅ Aʟʟ", callback_data=f"sendfiles#{key}")
         ])
+    try:
+        page_size = 10 if settings['max_btn'] else int(MAX_B_TN)
+    except KeyError:
+        await save_group_settings(query.message.chat.id, 'max_btn', True)
+        page_size = 10
+    page = cursor_page(offset, page_size)
+    # Cursors only point forward, so remember each page's cursor for "back".
+    # Page numbers are kept as str keys so any state backend can store them.
+    cursors = await PAGE_CURSORS.get(key) or {"0": "0"}
+    cursors[str(page)] = offset
+    if n_offset:
+        cursors[str(page + 1)] = n_offset
+    await PAGE_CURSORS.set(key, cursors)
     if ULTRA_FAST_MODE:
-        if 0 < offset <= 10:
-            off_set = 0
-        elif offset == 0:
-            off_set = None
-        else:
-            off_set = offset - 10
-        if n_offset == 0:
-            btn.append(
-                [InlineKeyboardButton("⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"), InlineKeyboardButton(f"{math.ceil(int(offset)/10)+1}", callback_data="pages")]
-            )
-        elif off_set is None:
-            btn.append([InlineKeyboardButton("ᴘᴀɢᴇ", callback_data="pages"), InlineKeyboardButton(f"{math.ceil(int(offset)/10)+1}", callback_data="pages"), InlineKeyboardButton("ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")])
-        else:
-            btn.append(
-                [
-                    InlineKeyboardButton("⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"),
-                    InlineKeyboardButton(f"{math.ceil(int(offset)/10)+1}", callback_data="pages"),
-                    InlineKeyboardButton("ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")
-                ],
-            )
+        page_label = f"{page + 1}"
     else:
-        try:
-            if settings['max_btn']:
-                if 0 < offset <= 10:
-                    off_set = 0
-                elif offset == 0:
-                    off_set = None
-                else:
-                    off_set = offset - 10
-                if n_offset == 0:
-                    btn.append([InlineKeyboardButton("⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"), InlineKeyboardButton(
-                        f"{math.ceil(int(offset)/10)+1} / {math.ceil(total/10)}", callback_data="pages")])
-                elif off_set is None:
-                    btn.append([InlineKeyboardButton("ᴘᴀɢᴇ", callback_data="pages"), InlineKeyboardButton(
-                        f"{math.ceil(int(offset)/10)+1} / {math.ceil(total/10)}", callback_data="pages"), InlineKeyboardButton("ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")])
-                else:
-                    btn.append(
-                        [
-                            InlineKeyboardButton(
-                                "⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"),
-                            InlineKeyboardButton(
-                                f"{math.ceil(int(offset)/10)+1} / {math.ceil(total/10)}", callback_data="pages"),
-                            InlineKeyboardButton(
-                                "ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")
-                        ],
-                    )
-            else:
-                if 0 < offset <= int(MAX_B_TN):
-                    off_set = 0
-                elif offset == 0:
-                    off_set = None
-                else:
-                    off_set = offset - int(MAX_B_TN)
-                if n_offset == 0:
-                    btn.append([InlineKeyboardButton("⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"), InlineKeyboardButton(
-                        f"{math.ceil(int(offset)/int(MAX_B_TN))+1} / {math.ceil(total/int(MAX_B_TN))}", callback_data="pages")])
-                elif off_set is None:
-                    btn.append([InlineKeyboardButton("ᴘᴀɢᴇ", callback_data="pages"), InlineKeyboardButton(
-                        f"{math.ceil(int(offset)/int(MAX_B_TN))+1} / {math.ceil(total/int(MAX_B_TN))}", callback_data="pages"), InlineKeyboardButton("ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")])
-                else:
-                    btn.append(
-                        [
-                            InlineKeyboardButton(
-                                "⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"),
-                            InlineKeyboardButton(
-                                f"{math.ceil(int(offset)/int(MAX_B_TN))+1} / {math.ceil(total/int(MAX_B_TN))}", callback_data="pages"),
-                            InlineKeyboardButton(
-                                "ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")
-                        ],
-                    )
-        except KeyError:
-            await save_group_settings(query.message.chat.id, 'max_btn', True)
-            if 0 < offset <= 10:
-                off_set = 0
-            elif offset == 0:
-                off_set = None
-            else:
-                off_set = offset - 10
-            if n_offset == 0:
-                btn.append(
-                    [InlineKeyboardButton("⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"), InlineKeyboardButton(
-                        f"{math.ceil(int(offset)/10)+1} / {math.ceil(total/10)}", callback_data="pages")]
-                )
-            elif off_set is None:
-                btn.append([InlineKeyboardButton("ᴘᴀɢᴇ", callback_data="pages"), InlineKeyboardButton(
-                    f"{math.ceil(int(offset)/10)+1} / {math.ceil(total/10)}", callback_data="pages"), InlineKeyboardButton("ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")])
-            else:
-                btn.append(
-                    [
-                        InlineKeyboardButton(
-                            "⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{off_set}"),
-                        InlineKeyboardButton(
-                            f"{math.ceil(int(offset)/10)+1} / {math.ceil(total/10)}", callback_data="pages"),
-                        InlineKeyboardButton(
-                            "ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}")
-                    ],
-                )
+        page_label = f"{page + 1} / {math.ceil(total / page_size)}"
+    pagination = []
+    if page > 0:
+        pagination.append(InlineKeyboardButton("⋞ ʙᴀᴄᴋ", callback_data=f"next_{req}_{key}_{cursors.get(str(page - 1), '0')}"))
+    elif n_offset:
+        pagination.append(InlineKeyboardButton("ᴘᴀɢᴇ", callback_data="pages"))
+    pagination.append(InlineKeyboardButton(page_label, callback_data="pages"))
+    if n_offset:
+        pagination.append(InlineKeyboardButton("ɴᴇxᴛ ⋟", callback_data=f"next_{req}_{key}_{n_offset}"))
+    btn.append(pagination)
+    offset = page * page_size
     if not settings["button"]:
         cur_time = datetime.now(pytz.timezone('Asia/Kolkata')).time()
         time_difference = timedelta(hours=cur_time.hour, minutes=cur_time.minute, seconds=(cur_time.second+(cur_time.microsecond/1000000))) - \
@@ -391,19 +399,14 @@ async def qualities_cb_handler(client: Client, query: CallbackQuery):
         pass
 
     _, key = query.data.split("#")
-    search = FRESH.get(key)
-    search = search.replace(' ', '_')
+    search = await FRESH.get(key)
+    if not search:
+        return await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
+    counts = await get_session_facets(key, search) or {}
 
-    btn = []
-    for i in range(0, len(QUALITIES), 2):
-        q1 = QUALITIES[i]
-        row = [InlineKeyboardButton(
-            text=q1, callback_data=f"fq#{q1.lower()}#{key}")]
-        if i + 1 < len(QUALITIES):
-            q2 = QUALITIES[i + 1]
-            row.append(InlineKeyboardButton(
-                text=q2, callback_data=f"fq#{q2.lower()}#{key}"))
-        btn.append(row)
+    btn = facet_buttons(
+        [(q, q.lower(), q.lower()) for q in QUALITIES], counts.get("quality") or {}, "fq", key
+    )
 
     btn.insert(0, [
         InlineKeyboardButton(text="⇊ ꜱᴇʟᴇᴄᴛ ǫᴜᴀʟɪᴛʏ ⇊", callback_data="ident")
@@ -420,13 +423,10 @@ async def qualities_cb_handler(client: Client, query: CallbackQuery):
 async def filter_qualities_cb_handler(client: Client, query: CallbackQuery):
     _, qual, key = query.data.split("#")
     curr_time = datetime.now(pytz.timezone('Asia/Kolkata')).time()
-    search = FRESH.get(key)
+    search = await FRESH.get(key)
+    if not search:
+        return await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
     search = search.replace("_", " ")
-    baal = qual in search
-    if baal:
-        search = search.replace(qual, "")
-    else:
-        search = search
     req = query.from_user.id
     chat_id = query.message.chat.id
     message = query.message
@@ -435,14 +435,19 @@ async def filter_qualities_cb_handler(client: Client, query: CallbackQuery):
             return await query.answer(f"⚠️ ʜᴇʟʟᴏ {query.from_user.first_name},\nᴛʜɪꜱ ɪꜱ ɴᴏᴛ ʏᴏᴜʀ ᴍᴏᴠɪᴇ ʀᴇǫᴜᴇꜱᴛ,\nʀᴇǫᴜᴇꜱᴛ ʏᴏᴜʀ'ꜱ...", show_alert=True,)
     except:
         pass
-    if qual != "homepage":
-        search = f"{search} {qual}"
-    BUTTONS[key] = search
-    files, offset, total_results = await get_search_results(chat_id, search, offset=0, filter=True)
+    facets = {} if qual == "homepage" else {"quality": qual}
+    # Served from the counts cached with the search; an empty facet needs no query.
+    known_total = facet_total(await FACET_COUNTS.get(key), facets)
+    if known_total == 0:
+        return await query.answer("🚫 ɴᴏ ꜰɪʟᴇꜱ ᴡᴇʀᴇ ꜰᴏᴜɴᴅ 🚫", show_alert=1)
+    await BUTTONS.set(key, search)
+    await FACETS.set(key, facets)
+    await PAGE_CURSORS.pop(key)
+    files, offset, total_results = await get_search_results(chat_id, search, offset=0, filter=True, facets=facets, total=known_total)
     if not files:
         await query.answer("🚫 ɴᴏ ꜰɪʟᴇꜱ ᴡᴇʀᴇ ꜰᴏᴜɴᴅ 🚫", show_alert=1)
         return
-    temp.GETALL[key] = files
+    await temp.GETALL.set(key, compact_files(files))
     settings = await get_settings(message.chat.id)
     if settings.get('button'):
         btn = [
@@ -551,21 +556,14 @@ async def languages_cb_handler(client: Client, query: CallbackQuery):
         pass
 
     _, key = query.data.split("#")
-    search = FRESH.get(key)
-    search = search.replace(' ', '_')
-
-    items = list(LANGUAGES.items())
-    btn = []
+    search = await FRESH.get(key)
+    if not search:
+        return await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
+    counts = await get_session_facets(key, search) or {}
 
-    for i in range(0, len(items), 2):
-        name1, code1 = items[i]
-        row = [InlineKeyboardButton(
-            text=name1, callback_data=f"fl#{code1}#{key}")]
-        if i + 1 < len(items):
-            name2, code2 = items[i + 1]
-            row.append(InlineKeyboardButton(
-                text=name2, callback_data=f"fl#{code2}#{key}"))
-        btn.append(row)
+    btn = facet_buttons(
+        [(name, code, code) for name, code in LANGUAGES.items()], counts.get("languages") or {}, "fl", key
+    )
 
     btn.insert(0, [InlineKeyboardButton(
         text="⇊ ꜱᴇʟᴇᴄᴛ ʟᴀɴɢᴜᴀɢᴇ ⇊", callback_data="ident")])
@@ -579,13 +577,10 @@ async def languages_cb_handler(client: Client, query: CallbackQuery):
 async def filter_languages_cb_handler(client: Client, query: CallbackQuery):
     _, lang, key = query.data.split("#")
     curr_time = datetime.now(pytz.timezone('Asia/Kolkata')).time()
-    search = FRESH.get(key)
+    search = await FRESH.get(key)
+    if not search:
+        return await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
     search = search.replace("_", " ")
-    baal = lang in search
-    if baal:
-        search = search.replace(lang, "")
-    else:
-        search = search
     req = query.from_user.id
     chat_id = query.message.chat.id
     message = query.message
@@ -594,14 +589,19 @@ async def filter_languages_cb_handler(client: Client, query: CallbackQuery):
             return await query.answer(f"⚠️ ʜᴇʟʟᴏ {query.from_user.first_name},\nᴛʜɪꜱ ɪꜱ ɴᴏᴛ ʏᴏᴜʀ ᴍᴏᴠɪᴇ ʀᴇǫᴜᴇꜱᴛ,\nʀᴇǫᴜᴇꜱᴛ ʏᴏᴜʀ'ꜱ...", show_alert=True,)
     except:
         pass
-    if lang != "homepage":
-        search = f"{search} {lang}"
-    BUTTONS[key] = search
-    files, offset, total_results = await get_search_results(chat_id, search, offset=0, filter=True)
+    facets = {} if lang == "homepage" else {"languages": lang}
+    # Served from the counts cached with the search; an empty facet needs no query.
+    known_total = facet_total(await FACET_COUNTS.get(key), facets)
+    if known_total == 0:
+        return await query.answer("🚫 ɴᴏ ꜰɪʟᴇꜱ ᴡᴇʀᴇ ꜰᴏᴜɴᴅ 🚫", show_alert=1)
+    await BUTTONS.set(key, search)
+    await FACETS.set(key, facets)
+    await PAGE_CURSORS.pop(key)
+    files, offset, total_results = await get_search_results(chat_id, search, offset=0, filter=True, facets=facets, total=known_total)
     if not files:
         await query.answer("🚫 ɴᴏ ꜰɪʟᴇꜱ ᴡᴇʀᴇ ꜰᴏᴜɴᴅ 🚫", show_alert=1)
         return
-    temp.GETALL[key] = files
+    await temp.GETALL.set(key, compact_files(files))
     settings = await get_settings(message.chat.id)
     if settings.get('button'):
         btn = [
@@ -702,17 +702,15 @@ async def seasons_cb_handler(client: Client, query: CallbackQuery):
     except Exception:
         pass
     _, key = query.data.split("#")
-    search = FRESH.get(key).replace(" ", "_")
+    search = await FRESH.get(key)
+    if not search:
+        return await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
+    counts = await get_session_facets(key, search) or {}
     req = query.from_user.id
     offset = 0
-    btn: list[list[InlineKeyboardButton]] = []
-    for i in range(0, len(SEASONS) - 1, 2):
-        btn.append([
-            InlineKeyboardButton(
-                f"Sᴇᴀꜱᴏɴ {SEASONS[i][1:]}", callback_data=f"fs#{SEASONS[i].lower()}#{key}"),
-            InlineKeyboardButton(
-                f"Sᴇᴀꜱᴏɴ {SEASONS[i+1][1:]}", callback_data=f"fs#{SEASONS[i+1].lower()}#{key}")
-        ])
+    btn: list[list[InlineKeyboardButton]] = facet_buttons(
+        [(f"Sᴇᴀꜱᴏɴ {s[1:]}", s.lower(), str(int(s[1:]))) for s in SEASONS], counts.get("season") or {}, "fs", key
+    )
 
     btn.insert(
         0,
@@ -727,17 +725,26 @@ async def seasons_cb_handler(client: Client, query: CallbackQuery):
 @Client.on_callback_query(filters.regex(r"^fs#"))
 async def filter_seasons_cb_handler(client: Client, query: CallbackQuery):
     _, season_tag, key = query.data.split("#")
-    search = FRESH.get(key).replace("_", " ")
+    search = await FRESH.get(key)
+    if not search:
+        return await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
+    search = search.replace("_", " ")
     season_tag = season_tag.lower()
     if season_tag == "homepage":
-        search_final = search
-        query_input = search_final
+        facets = {}
     else:
-        season_number = int(season_tag[1:])
-        query_input = generate_season_variations(search, season_number)
-        search_final = query_input[0] if query_input else search
+        # "s2" from the season menu, "s2e5" from an episode group header.
+        season, _, episode = season_tag[1:].partition("e")
+        facets = {"season": int(season)}
+        if episode:
+            facets["episode"] = int(episode)
+    known_total = facet_total(await FACET_COUNTS.get(key), facets)
+    if known_total == 0:
+        return await query.answer("🚫 ɴᴏ ꜰɪʟᴇꜱ ꜰᴏᴜɴᴅ 🚫", show_alert=True)
 
-    BUTTONS[key] = search_final
+    await BUTTONS.set(key, search)
+    await FACETS.set(key, facets)
+    await PAGE_CURSORS.pop(key)
     try:
         if int(query.from_user.id) not in [query.message.reply_to_message.from_user.id, 0]:
             return await query.answer("⚠️ Not your request", show_alert=True)
@@ -746,12 +753,13 @@ async def filter_seasons_cb_handler(client: Client, query: CallbackQuery):
 
     chat_id = query.message.chat.id
     req = query.from_user.id
-    files, n_offset, total_results = await get_search_results(chat_id, query_input, offset=0, filter=True)
+    files, n_offset, total_results = await get_search_results(chat_id, search, offset=0, filter=True, facets=facets, total=known_total)
     if not files:
-        BUTTONS[key] = None
+        await BUTTONS.set(key, None)
+        await FACETS.pop(key)
         return await query.answer("🚫 ɴᴏ ꜰɪʟᴇꜱ ꜰᴏᴜɴᴅ 🚫", show_alert=True)
 
-    temp.GETALL[key] = files
+    await temp.GETALL.set(key, compact_files(files))
     settings = await get_settings(chat_id)
     btn: list[list[InlineKeyboardButton]] = []
     if settings.get("button"):
@@ -816,7 +824,7 @@ async def filter_seasons_cb_handler(client: Client, query: CallbackQuery):
             seconds=curr_time.second + curr_time.microsecond / 1_000_000,
         )
         remaining_seconds = f"{time_difference.total_seconds():.2f}"
-        dreamx_title = clean_search_text(search_final)
+        dreamx_title = clean_search_text(search)
         cap = await get_cap(settings, remaining_seconds, files, query, total_results, dreamx_title, offset=1)
         try:
             await query.message.edit_text(
@@ -834,6 +842,52 @@ async def filter_seasons_cb_handler(client: Client, query: CallbackQuery):
     await query.answer()
 
 
+@Client.on_callback_query(filters.regex(r"^eps_"))
+async def episode_page(bot, query):
+    ident, req, key, offset = query.data.split("_", 3)
+    if int(req) not in [query.from_user.id, 0]:
+        return await query.answer(script.ALRT_TXT.format(query.from_user.first_name), show_alert=True)
+    search = await FRESH.get(key)
+    if not search:
+        return await query.answer(script.OLD_ALRT_TXT.format(query.from_user.first_name), show_alert=True)
+    chat_id = query.message.chat.id
+    page_size = await resolve_max_results(chat_id)
+    groups, n_offset, total_groups = await get_series_episode_groups(chat_id, search, offset=offset, max_results=page_size)
+    if not groups:
+        return await query.answer("🚫 ɴᴏ ꜰɪʟᴇꜱ ꜰᴏᴜɴᴅ 🚫", show_alert=True)
+
+    files = [file for group in groups for file in group.files]
+    await temp.GETALL.set(key, compact_files(files))
+    await temp.SHORT.set(query.from_user.id, chat_id)
+    settings = await get_settings(chat_id)
+    btn = [
+        [
+            InlineKeyboardButton("ʀᴇᴍᴏᴠᴇ ᴀᴅs", url=f"https://t.me/{temp.U_NAME}?start=premium"),
+            InlineKeyboardButton("Sᴇɴᴅ Aʟʟ", callback_data=f"sendfiles#{key}"),
+        ],
+        [
+            InlineKeyboardButton("Qᴜᴀʟɪᴛʏ", callback_data=f"qualities#{key}"),
+            InlineKeyboardButton("Lᴀɴɢᴜᴀɢᴇ", callback_data=f"languages#{key}"),
+            InlineKeyboardButton("Sᴇᴀꜱᴏɴ", callback_data=f"seasons#{key}"),
+        ],
+    ]
+    btn.extend(episode_group_buttons(groups, key, settings.get("button")))
+    btn.append(episode_pagination(req, key, offset, n_offset, page_size, total_groups))
+    try:
+        if settings.get("button"):
+            await query.edit_message_reply_markup(InlineKeyboardMarkup(btn))
+        else:
+            cap = await temp.IMDB_CAP.get(query.from_user.id) or f"<b>🏷 ᴛɪᴛʟᴇ : <code>{clean_search_text(search)}</code>\n\n<u>Your Requested Files Are Here</u></b>"
+            cap += episode_groups_caption(groups, chat_id)
+            if query.message.caption:
+                await query.message.edit_caption(caption=cap, reply_markup=InlineKeyboardMarkup(btn), parse_mode=enums.ParseMode.HTML)
+            else:
+                await query.message.edit_text(text=cap, reply_markup=InlineKeyboardMarkup(btn), disable_web_page_preview=True, parse_mode=enums.ParseMode.HTML)
+    except MessageNotModified:
+        pass
+    await query.answer()
+
+
 @Client.on_callback_query()
 async def cb_handler(client: Client, query: CallbackQuery):
     DreamxData = query.data
@@ -924,9 +978,8 @@ async def cb_handler(client: Client, query: CallbackQuery):
         await query.answer(url=f"href='https://telegram.me/{temp.U_NAME}?start=file_{query.message.chat.id}_{file.file_id}")
 
     elif query.data.startswith("autofilter_delete"):
-        await Media.collection.drop()
-        if MULTIPLE_DB:    
-            await Media2.collection.drop()
+        await router.fan_out(lambda model: model.collection.drop())
+        invalidate_search_cache()
         await query.answer("Eᴠᴇʀʏᴛʜɪɴɢ's Gᴏɴᴇ")
         await query.message.edit('ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ ᴀʟʟ ɪɴᴅᴇxᴇᴅ ꜰɪʟᴇꜱ ✅')
 
@@ -968,27 +1021,31 @@ async def cb_handler(client: Client, query: CallbackQuery):
         deleted = 0
         async with lock:
             try:
+                # Every file was read from one db; each db deletes its own files
+                # in batches by _id, all dbs in parallel.
+                ids_by_model = {}
                 for file in files:
-                    file_ids = file.file_id
-                    file_name = file.file_name
-                    result = await Media.collection.delete_one({
-                        '_id': file_ids,
-                    })
-                    if not result.deleted_count and MULTIPLE_DB:
-                        result = await Media2.collection.delete_one({
-                            '_id': file_ids,
-                        })
-                    if result.deleted_count:
-                        logger.info(
-                            f'ꜰɪʟᴇ ꜰᴏᴜɴᴅ ꜰᴏʀ ʏᴏᴜʀ ǫᴜᴇʀʏ {keyword}! ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ {file_name} ꜰʀᴏᴍ ᴅᴀᴛᴀʙᴀꜱᴇ.')
-                    deleted += 1
-                    if deleted % 20 == 0:
-                        await query.message.edit_text(f"<b>ᴘʀᴏᴄᴇꜱꜱ ꜱᴛᴀʀᴛᴇᴅ ꜰᴏʀ ᴅᴇʟᴇᴛɪɴɢ ꜰɪʟᴇꜱ ꜰʀᴏᴍ ᴅʙ. ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ {str(deleted)} ꜰɪʟᴇꜱ ꜰʀᴏᴍ ᴅʙ ꜰᴏʀ ʏᴏᴜʀ ǫᴜᴇʀʏ {keyword} !\n\nᴘʟᴇᴀꜱᴇ ᴡᴀɪᴛ...</b>")
+                    ids_by_model.setdefault(type(file), []).append(file.pk)
+
+                async def delete_from(model, ids):
+                    nonlocal deleted
+                    for i in range(0, len(ids), 500):
+                        result = await model.collection.delete_many({'_id': {'$in': ids[i:i + 500]}})
+                        deleted += result.deleted_count
+                        logger.info(f'ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ {result.deleted_count} ꜰɪʟᴇꜱ ꜰᴏʀ ʏᴏᴜʀ ǫᴜᴇʀʏ {keyword} ꜰʀᴏᴍ ᴅᴀᴛᴀʙᴀꜱᴇ.')
+                        try:
+                            await query.message.edit_text(f"<b>ᴘʀᴏᴄᴇꜱꜱ ꜱᴛᴀʀᴛᴇᴅ ꜰᴏʀ ᴅᴇʟᴇᴛɪɴɢ ꜰɪʟᴇꜱ ꜰʀᴏᴍ ᴅʙ. ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ {str(deleted)} ꜰɪʟᴇꜱ ꜰʀᴏᴍ ᴅʙ ꜰᴏʀ ʏᴏᴜʀ ǫᴜᴇʀʏ {keyword} !\n\nᴘʟᴇᴀꜱᴇ ᴡᴀɪᴛ...</b>")
+                        except MessageNotModified:
+                            pass
+
+                await asyncio.gather(*[delete_from(model, ids) for model, ids in ids_by_model.items()])
             except Exception as e:
                 print(f"Error In killfiledq -{e}")
                 await query.message.edit_text(f'Error: {e}')
             else:
                 await query.message.edit_text(f"<b>ᴘʀᴏᴄᴇꜱꜱ ᴄᴏᴍᴘʟᴇᴛᴇᴅ ꜰᴏʀ ꜰɪʟᴇ ᴅᴇʟᴇᴛᴀᴛɪᴏɴ !\n\nꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴅᴇʟᴇᴛᴇᴅ {str(deleted)} ꜰɪʟᴇꜱ ꜰʀᴏᴍ ᴅʙ ꜰᴏʀ ʏᴏᴜʀ ǫᴜᴇʀʏ {keyword}.</b>")
+            finally:
+                invalidate_search_cache()
 
     elif query.data.startswith("opnsetgrp"):
         ident, grp_id = query.data.split("#")
@@ -1395,8 +1452,9 @@ async def cb_handler(client: Client, query: CallbackQuery):
             username = query.from_user.mention
             log_msg = await client.send_cached_media(chat_id=BIN_CHANNEL, file_id=file_id,)
             fileName = {quote_plus(get_name(log_msg))}
-            dreamx_stream = f"{URL}watch/{str(log_msg.id)}/{quote_plus(get_name(log_msg))}?hash={get_hash(log_msg)}"
-            dreamx_download = f"{URL}{str(log_msg.id)}/{quote_plus(get_name(log_msg))}?hash={get_hash(log_msg)}"
+            user_token = stream_user_token(user_id, log_msg.id)
+            dreamx_stream = f"{URL}watch/{str(log_msg.id)}/{quote_plus(get_name(log_msg))}?hash={get_hash(log_msg)}&u={user_token}"
+            dreamx_download = f"{URL}{str(log_msg.id)}/{quote_plus(get_name(log_msg))}?hash={get_hash(log_msg)}&u={user_token}"
             await query.answer(MSG_ALRT)
             await asyncio.sleep(1)
             await log_msg.reply_text(
@@ -1785,7 +1843,18 @@ async def auto_filter(client, msg, spoll=False):
                 search = search.replace("-", " ")
                 search = search.replace(":", "")
 
-                files, offset, total_results = await get_series_episode_groups(message.chat.id, search, offset=0, filter=True)
+                # The menu counts are computed alongside the first page and kept with the session.
+                (files, offset, total_results), facet_counts = await asyncio.gather(
+                    get_search_results(message.chat.id, search, offset=0, filter=True),
+                    get_facet_counts(search),
+                )
+                # Mostly episodes: show them grouped, paged by episode_page.
+                episode_groups = None
+                if files and is_series_search(facet_counts):
+                    groups, group_offset, total_groups = await get_series_episode_groups(message.chat.id, search)
+                    if groups:
+                        episode_groups, offset = groups, group_offset
+                        files = [file for group in groups for file in group.files]
 
                 settings = await get_settings(message.chat.id)
                 if not files:
@@ -1815,14 +1884,22 @@ async def auto_filter(client, msg, spoll=False):
             # spoll branch
             message = msg.message.reply_to_message
             search, files, offset, total_results = spoll
+            facet_counts = None
+            episode_groups = None
             m = await message.reply_text(f'🔎 sᴇᴀʀᴄʜɪɴɢ {search}', reply_to_message_id=message.id)
             settings = await get_settings(message.chat.id)
             await msg.message.delete()
 
         key = f"{message.chat.id}-{message.id}"
-        FRESH[key] = search
-        temp.GETALL[key] = files
-        temp.SHORT[message.from_user.id] = message.chat.id
+        await FRESH.set(key, search)
+        await FACETS.pop(key)
+        if facet_counts is not None:
+            await FACET_COUNTS.set(key, facet_counts)
+        else:
+            await FACET_COUNTS.pop(key)
+        await PAGE_CURSORS.pop(key)
+        await temp.GETALL.set(key, compact_files(files))
+        await temp.SHORT.set(message.from_user.id, message.chat.id)
 
         if settings.get('button'):
             btn = [
@@ -1870,7 +1947,11 @@ async def auto_filter(client, msg, spoll=False):
                                "Sᴇɴᴅ Aʟʟ", callback_data=f"sendfiles#{key}")
                        ])
 
-        if offset != "":
+        if episode_groups:
+            req = message.from_user.id if message.from_user else 0
+            btn.extend(episode_group_buttons(episode_groups, key, settings.get('button')))
+            btn.append(episode_pagination(req, key, 0, offset, await resolve_max_results(message.chat.id), total_groups))
+        elif offset != "":
             req = message.from_user.id if message.from_user else 0
             if ULTRA_FAST_MODE:
                 btn.append(
@@ -1947,33 +2028,42 @@ async def auto_filter(client, msg, spoll=False):
                 url=imdb['url'],
                 **locals()
             )
-            temp.IMDB_CAP[message.from_user.id] = cap
+            await temp.IMDB_CAP.set(message.from_user.id, cap)
             if not settings.get('button'):
                 cap += "\n\n<b><u>Your Requested Files Are Here</u></b>\n\n"
-                for idx, file in enumerate(files, start=1):
-                    cap += f"<b>\n{idx}. <a href='https://telegram.me/{temp.U_NAME}?start=file_{message.chat.id}_{file.file_id}'>[{get_size(file.file_size)}] {clean_filename(file.file_name)}\n</a></b>"
+                if episode_groups:
+                    cap += episode_groups_caption(episode_groups, message.chat.id)
+                else:
+                    for idx, file in enumerate(files, start=1):
+                        cap += f"<b>\n{idx}. <a href='https://telegram.me/{temp.U_NAME}?start=file_{message.chat.id}_{file.file_id}'>[{get_size(file.file_size)}] {clean_filename(file.file_name)}\n</a></b>"
         else:
-            temp.IMDB_CAP[message.from_user.id] = None
+            await temp.IMDB_CAP.set(message.from_user.id, None)
             if ULTRA_FAST_MODE:
                 if settings.get('button'):
                     cap = f"<b>🏷 ᴛɪᴛʟᴇ : <code>{search}</code>\n⏰ ʀᴇsᴜʟᴛ ɪɴ : <code>{remaining_seconds} Sᴇᴄᴏɴᴅs</code>\n\n📝 ʀᴇǫᴜᴇsᴛᴇᴅ ʙʏ : {message.from_user.mention}\n⚜️ ᴘᴏᴡᴇʀᴇᴅ ʙʏ : ⚡ {message.chat.title or temp.B_LINK or 'ᴅʀᴇᴀᴍxʙᴏᴛᴢ'} \n\n<u>Your Requested Files Are Here</u> \n\n</b>"
                 else:
                     cap = f"<b>🏷 ᴛɪᴛʟᴇ : <code>{search}</code>\n⏰ ʀᴇsᴜʟᴛ ɪɴ : <code>{remaining_seconds} Sᴇᴄᴏɴᴅs</code>\n\n📝 ʀᴇǫᴜᴇsᴛᴇᴅ ʙʏ : {message.from_user.mention}\n⚜️ ᴘᴏᴡᴇʀᴇᴅ ʙʏ : ⚡ {message.chat.title or temp.B_LINK or 'ᴅʀᴇᴀᴍxʙᴏᴛᴢ'} \n\n<u>Your Requested Files Are Here</u> \n\n</b>"
-                    for idx, file in enumerate(files, start=1):
-                        cap += f"<b>\n{idx}. <a href='https://telegram.me/{temp.U_NAME}?start=file_{message.chat.id}_{file.file_id}'>[{get_size(file.file_size)}] {clean_filename(file.file_name)}\n</a></b>"
+                    if episode_groups:
+                        cap += episode_groups_caption(episode_groups, message.chat.id)
+                    else:
+                        for idx, file in enumerate(files, start=1):
+                            cap += f"<b>\n{idx}. <a href='https://telegram.me/{temp.U_NAME}?start=file_{message.chat.id}_{file.file_id}'>[{get_size(file.file_size)}] {clean_filename(file.file_name)}\n</a></b>"
             else:
                 if settings.get('button'):
                     cap = f"<b>🏷 ᴛɪᴛʟᴇ : <code>{search}</code>\n🧱 ᴛᴏᴛᴀʟ ꜰɪʟᴇꜱ : <code>{total_results}</code>\n⏰ ʀᴇsᴜʟᴛ ɪɴ : <code>{remaining_seconds} Sᴇᴄᴏɴᴅs</code>\n\n📝 ʀᴇǫᴜᴇsᴛᴇᴅ ʙʏ : {message.from_user.mention}\n⚜️ ᴘᴏᴡᴇʀᴇᴅ ʙʏ : ⚡ {message.chat.title or temp.B_LINK or 'ᴅʀᴇᴀᴍxʙᴏᴛᴢ'} \n\n<u>Your Requested Files Are Here</u> \n\n</b>"
                 else:
                     cap = f"<b>🏷 ᴛɪᴛʟᴇ : <code>{search}</code>\n🧱 ᴛᴏᴛᴀʟ ꜰɪʟᴇꜱ : <code>{total_results}</code>\n⏰ ʀᴇsᴜʟᴛ ɪɴ : <code>{remaining_seconds} Sᴇᴄᴏɴᴅs</code>\n\n📝 ʀᴇǫᴜᴇsᴛᴇᴅ ʙʏ : {message.from_user.mention}\n⚜️ ᴘᴏᴡᴇʀᴇᴅ ʙʏ : ⚡ {message.chat.title or temp.B_LINK or 'ᴅʀᴇᴀᴍxʙᴏᴛᴢ'} \n\n<u>Your Requested Files Are Here</u> \n\n</b>"
 
-                    for idx, file in enumerate(files, start=1):
-                        # Example: handle both dict/document or string
-                        file_id = getattr(file, "file_id", None) or file.get("file_id", file) if isinstance(file, dict) else file
-                        file_name = getattr(file, "file_name", None) or file.get("file_name", "Unknown") if isinstance(file, dict) else "Unknown"
-                        file_size = getattr(file, "file_size", None) or file.get("file_size", 0) if isinstance(file, dict) else 0
+                    if episode_groups:
+                        cap += episode_groups_caption(episode_groups, message.chat.id)
+                    else:
+                        for idx, file in enumerate(files, start=1):
+                            # Example: handle both dict/document or string
+                            file_id = getattr(file, "file_id", None) or file.get("file_id", file) if isinstance(file, dict) else file
+                            file_name = getattr(file, "file_name", None) or file.get("file_name", "Unknown") if isinstance(file, dict) else "Unknown"
+                            file_size = getattr(file, "file_size", None) or file.get("file_size", 0) if isinstance(file, dict) else 0
 
-                        cap += f"<b>\n{idx}. <a href='https://telegram.me/{temp.U_NAME}?start=file_{message.chat.id}_{file_id}'>[{get_size(file_size)}] {clean_filename(file_name)}\n</a></b>"
+                            cap += f"<b>\n{idx}. <a href='https://telegram.me/{temp.U_NAME}?start=file_{message.chat.id}_{file_id}'>[{get_size(file_size)}] {clean_filename(file_name)}\n</a></b>"
 
                        
                             
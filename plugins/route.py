@@ -5,11 +5,20 @@ import logging
 import secrets
 import time
 import mimetypes
+from datetime import timezone
+from email.utils import format_datetime
 from aiohttp.http_exceptions import BadStatusLine
 from dreamxbotz.Bot import multi_clients, work_loads, dreamxbotz
-from dreamxbotz.server.exceptions import FIleNotFound, InvalidHash
+from dreamxbotz.server.exceptions import FIleNotFound, InvalidHash, NoClientAvailable
 from dreamxbotz.zzint import StartTime, __version__
-from dreamxbotz.util.custom_dl import ByteStreamer
+from dreamxbotz.util.custom_dl import ByteStreamer, stream_parts, chunk_cache, file_id_cache, file_info_cache
+from dreamxbotz.util.metrics import bytes_served, getfile_latency, http_responses, media_session_replacements, gauge
+from dreamxbotz.util.media_sessions import media_pools
+from dreamxbotz.util.scheduler import scheduler
+from dreamxbotz.util.rate_limit import stream_limiter, stream_user
+from dreamxbotz.util.ttl_cache import TTLCache
+from database.users_chats_db import db
+from pyrogram.errors import FloodWait
 from dreamxbotz.util.time_format import get_readable_time
 from dreamxbotz.util.render_template import render_page
 from info import *
@@ -25,6 +34,36 @@ async def favicon_route_handler(request):
 async def root_route_handler(request):
     return web.json_response("dreamxbotz")
 
+@routes.get("/metrics")
+async def metrics_handler(request):
+    if not METRICS_TOKEN:
+        # Off unless a token is set, the stream host is public.
+        raise web.HTTPNotFound()
+    if not secrets.compare_digest(request.rel_url.query.get("token", ""), METRICS_TOKEN):
+        raise web.HTTPForbidden()
+    sessions = {
+        (index, dc_id): len(dc_sessions)
+        for index, client in multi_clients.items() if client in media_pools
+        for dc_id, dc_sessions in media_pools[client].sessions.items()
+    }
+    file_cache = file_id_cache.stats()
+    info_cache = file_info_cache.stats()
+    lines = gauge("dreamx_active_streams", "Streams being served per client.",
+                  {(index,): load for index, load in work_loads.items()}, ("client",))
+    lines += gauge("dreamx_media_sessions", "Open media sessions per client and DC.", sessions, ("client", "dc"))
+    lines += gauge("dreamx_file_id_cache_entries", "Cached file properties.", {(): file_cache["size"]})
+    lines += gauge("dreamx_file_id_cache_hit_ratio", "File properties served from cache.", {(): file_cache["hit_ratio"]})
+    lines += gauge("dreamx_file_info_cache_entries", "Cached bot independent file properties.", {(): info_cache["size"]})
+    lines += gauge("dreamx_file_info_cache_hit_ratio", "Bot independent file properties served from cache.", {(): info_cache["hit_ratio"]})
+    if chunk_cache is not None:
+        chunks = chunk_cache.stats()
+        lines += gauge("dreamx_chunk_cache_bytes", "Bytes held in the chunk cache.", {(): chunks["bytes"]})
+        lines += gauge("dreamx_chunk_cache_hit_ratio", "Chunk reads served from disk or a shared fetch.", {(): chunks["hit_ratio"]})
+    lines += bytes_served.render() + getfile_latency.render() + http_responses.render()
+    lines += media_session_replacements.render()
+    return web.Response(text="\n".join(lines) + "\n", content_type="text/plain", charset="utf-8",
+                        headers={"Cache-Control": "no-store"})
+
 @routes.get(r"/watch/{path:\S+}", allow_head=True)
 async def stream_handler(request: web.Request):
     try:
@@ -36,17 +75,61 @@ async def stream_handler(request: web.Request):
         else:
             id = int(re.search(r"(\d+)(?:\/\S+)?", path).group(1))
             secure_hash = request.rel_url.query.get("hash")
-        return web.Response(text=await render_page(id, secure_hash), content_type='text/html')
+        return web.Response(text=await render_page(id, secure_hash, user=request.rel_url.query.get("u")), content_type='text/html')
     except InvalidHash as e:
         raise web.HTTPForbidden(text=e.message)
     except FIleNotFound as e:
         raise web.HTTPNotFound(text=e.message)
+    except NoClientAvailable as e:
+        raise web.HTTPServiceUnavailable(text=e.message, headers={"Retry-After": "10"})
     except (AttributeError, BadStatusLine, ConnectionResetError):
         pass
     except Exception as e:
         logging.critical(e.with_traceback(None))
         raise web.HTTPInternalServerError(text=str(e))
 
+@routes.get(r"/segments/{id:\d+}")
+async def segments_handler(request: web.Request):
+    """Lists the segment URLs of a file for players and proxies that fetch them."""
+    if not SEGMENT_SIZE_MB:
+        raise web.HTTPNotFound()
+    id = int(request.match_info["id"])
+    secure_hash = request.rel_url.query.get("hash")
+    try:
+        index, tg_connect, file_id = await get_file(request, id, secure_hash)
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    except NoClientAvailable as e:
+        raise web.HTTPServiceUnavailable(text=e.message, headers={"Retry-After": "10"})
+    segment_size = SEGMENT_SIZE_MB * 1024 * 1024
+    return web.json_response({
+        "file_name": file_id.file_name,
+        "file_size": file_id.file_size,
+        "mime_type": file_id.mime_type,
+        "segment_size": segment_size,
+        "segments": math.ceil(file_id.file_size / segment_size),
+        "segment_url": f"{URL}segment/{id}/{{n}}?hash={secure_hash}",
+    })
+
+@routes.get(r"/segment/{id:\d+}/{segment:\d+}", allow_head=True)
+async def segment_handler(request: web.Request):
+    if not SEGMENT_SIZE_MB:
+        raise web.HTTPNotFound()
+    try:
+        id = int(request.match_info["id"])
+        segment = int(request.match_info["segment"])
+        return await segment_streamer(request, id, segment, request.rel_url.query.get("hash"))
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    except NoClientAvailable as e:
+        raise web.HTTPServiceUnavailable(text=e.message, headers={"Retry-After": "10"})
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+
 @routes.get(r"/{path:\S+}", allow_head=True)
 async def stream_handler(request: web.Request):
     try:
@@ -63,6 +146,8 @@ async def stream_handler(request: web.Request):
         raise web.HTTPForbidden(text=e.message)
     except FIleNotFound as e:
         raise web.HTTPNotFound(text=e.message)
+    except NoClientAvailable as e:
+        raise web.HTTPServiceUnavailable(text=e.message, headers={"Retry-After": "10"})
     except (AttributeError, BadStatusLine, ConnectionResetError):
         pass
     except Exception as e:
@@ -70,34 +155,143 @@ async def stream_handler(request: web.Request):
         raise web.HTTPInternalServerError(text=str(e))
 
 class_cache = {}
+# Premium status per user id, so range requests do not each query the database.
+premium_cache = TTLCache(4096, 300)
 
-async def media_streamer(request: web.Request, id: int, secure_hash: str):
-    range_header = request.headers.get("Range", 0)
-    
-    index = min(work_loads, key=work_loads.get)
-    faster_client = multi_clients[index]
-    
-    if MULTI_CLIENT:
-        logging.info(f"Client {index} is now serving {request.remote}")
+def http_date(date) -> str:
+    """RFC 7231 date for a (naive local or aware) datetime, "" when unknown."""
+    if not date:
+        return ""
+    return format_datetime(date.astimezone(timezone.utc), usegmt=True)
 
-    if faster_client in class_cache:
-        tg_connect = class_cache[faster_client]
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match check, which uses the weak comparison."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+PER_ADDRESS_LIMITS = any((STREAM_MAX_PER_IP, STREAM_RATE_KBPS, PREMIUM_STREAM_MAX_PER_IP, PREMIUM_STREAM_RATE_KBPS))
+untrusted_proxy_warned = False
+
+def client_address(request: web.Request) -> str:
+    global untrusted_proxy_warned
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded and STREAM_TRUST_PROXY:
+        return forwarded.split(",")[0].strip()
+    if forwarded and PER_ADDRESS_LIMITS and not untrusted_proxy_warned:
+        untrusted_proxy_warned = True
+        logging.warning("Requests come through a proxy but STREAM_TRUST_PROXY is off, "
+                        "so the per-address stream limits apply to all viewers together.")
+    return request.remote
+
+def get_streamer(index: int) -> ByteStreamer:
+    client = multi_clients[index]
+    if client in class_cache:
         logging.debug(f"Using cached ByteStreamer object for client {index}")
-    else:
-        logging.debug(f"Creating new ByteStreamer object for client {index}")
-        tg_connect = ByteStreamer(faster_client)
-        class_cache[faster_client] = tg_connect
-    logging.debug("before calling get_file_properties")
-    file_id = await tg_connect.get_file_properties(id)
+        return class_cache[client]
+    logging.debug(f"Creating new ByteStreamer object for client {index}")
+    tg_connect = ByteStreamer(client)
+    class_cache[client] = tg_connect
+    return tg_connect
+
+async def get_parallel_sources(id: int, index: int, tg_connect: ByteStreamer, file_id):
+    """The serving client plus the least loaded other clients under MAX_CLIENT_LOAD."""
+    sources = [(tg_connect, file_id, index)]
+    for other in scheduler.rank(work_loads, scheduler.request_for(id)):
+        if len(sources) >= PARALLEL_STREAM_CLIENTS:
+            break
+        if other == index or (MAX_CLIENT_LOAD and work_loads[other] >= MAX_CLIENT_LOAD):
+            continue
+        try:
+            # Each client needs its own FileId, the access hash is bound to the bot.
+            streamer = get_streamer(other)
+            sources.append((streamer, await streamer.get_file_properties(id), other))
+        except Exception as e:
+            logging.debug(f"Client {other} skipped for parallel parts: {e}")
+    return sources
+
+def part_range(from_bytes: int, until_bytes: int, chunk_size: int):
+    """The aligned parts covering from_bytes..until_bytes, both inclusive.
+    returns (offset, first_part_cut, last_part_cut, part_count) for stream_parts."""
+    offset = from_bytes - (from_bytes % chunk_size)
+    first_part_cut = from_bytes - offset
+    last_part_cut = until_bytes % chunk_size + 1
+    part_count = until_bytes // chunk_size - offset // chunk_size + 1
+    return offset, first_part_cut, last_part_cut, part_count
+
+async def get_file(request: web.Request, id: int, secure_hash: str):
+    """Picks the client for a request and loads the file's properties through it."""
+    info = file_info_cache.get(id)
+    if info is not None and info.unique_id[:6] != secure_hash:
+        # Known from any client's lookup, so a bad link costs no fetch.
+        raise InvalidHash
+    candidates = scheduler.rank(work_loads, scheduler.request_for(id))
+    if not candidates:
+        # No client has started yet.
+        raise NoClientAvailable
+    for attempt, index in enumerate(candidates):
+        tg_connect = get_streamer(index)
+        logging.debug("before calling get_file_properties")
+        try:
+            file_id = await tg_connect.get_file_properties(id)
+            break
+        except FloodWait as e:
+            # Let another client take the request while this one waits.
+            scheduler.failed(index, e)
+            if attempt == len(candidates) - 1:
+                raise
     logging.debug("after calling get_file_properties")
+    scheduler.remember(id, file_id.dc_id, file_id.file_size)
+
+    if MULTI_CLIENT:
+        logging.info(f"Client {index} is now serving {request.remote}")
     
     if file_id.unique_id[:6] != secure_hash:
         logging.debug(f"Invalid hash for message with ID {id}")
         raise InvalidHash
+    return index, tg_connect, file_id
+
+async def admit(request: web.Request, id: int):
+    """A rate limiter ticket for the request, None when the viewer is over a cap."""
+    user_id = stream_user(request.rel_url.query.get("u"), id)
+    premium = bool(user_id) and await premium_cache.get_or_load(user_id, lambda: db.has_premium_access(user_id))
+    return stream_limiter.acquire(client_address(request), id, premium)
+
+async def stream_body(id: int, index: int, tg_connect: ByteStreamer, file_id, from_bytes: int, until_bytes: int, ticket):
+    """The generator sending from_bytes..until_bytes, split over several clients for large ranges."""
+    chunk_size = 1024 * 1024
+    offset, first_part_cut, last_part_cut, part_count = part_range(from_bytes, until_bytes, chunk_size)
+    if PARALLEL_STREAM_CLIENTS > 1 and until_bytes - from_bytes + 1 >= PARALLEL_STREAM_MIN_MB * 1024 * 1024:
+        sources = await get_parallel_sources(id, index, tg_connect, file_id)
+        return stream_parts(sources, offset, first_part_cut, last_part_cut, part_count, chunk_size, ticket)
+    return tg_connect.yield_file(
+        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size, ticket
+    )
+
+async def media_streamer(request: web.Request, id: int, secure_hash: str):
+    range_header = request.headers.get("Range", 0)
+    
+    index, tg_connect, file_id = await get_file(request, id, secure_hash)
     
     file_size = file_id.file_size
+    # The file behind a message never changes, so file_unique_id is a strong validator.
+    etag = f'"{file_id.unique_id}"'
+    last_modified = http_date(getattr(file_id, "date", None))
+    validators = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if last_modified:
+        validators["Last-Modified"] = last_modified
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=validators)
 
-    if range_header:
+    if_range = request.headers.get("If-Range")
+    if range_header and if_range and if_range.strip() not in (etag, last_modified):
+        # The client's copy is stale, send the whole file instead of the range.
+        range_header = 0
+        from_bytes, until_bytes = 0, file_size - 1
+    elif range_header:
         from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
         from_bytes = int(from_bytes)
         until_bytes = int(until_bytes) if until_bytes else file_size - 1
@@ -112,18 +306,8 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
             headers={"Content-Range": f"bytes */{file_size}"},
         )
 
-    chunk_size = 1024 * 1024
     until_bytes = min(until_bytes, file_size - 1)
-
-    offset = from_bytes - (from_bytes % chunk_size)
-    first_part_cut = from_bytes - offset
-    last_part_cut = until_bytes % chunk_size + 1
-
     req_length = until_bytes - from_bytes + 1
-    part_count = math.ceil(until_bytes / chunk_size) - math.floor(offset / chunk_size)
-    body = tg_connect.yield_file(
-        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
-    )
 
     mime_type = file_id.mime_type
     file_name = file_id.file_name
@@ -137,19 +321,54 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
                 file_name = f"{secrets.token_hex(2)}.unknown"
     else:
         if file_name:
-            mime_type = mimetypes.guess_type(file_id.file_name)
+            mime_type = mimetypes.guess_type(file_id.file_name)[0] or "application/octet-stream"
         else:
             mime_type = "application/octet-stream"
             file_name = f"{secrets.token_hex(2)}.unknown"
 
-    return web.Response(
-        status=206 if range_header else 200,
-        body=body,
-        headers={
-            "Content-Type": f"{mime_type}",
-            "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
-            "Content-Length": str(req_length),
-            "Content-Disposition": f'{disposition}; filename="{file_name}"',
-            "Accept-Ranges": "bytes",
-        },
-    )
\ No newline at end of file
+    headers = {
+        "Content-Type": f"{mime_type}",
+        "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
+        "Content-Length": str(req_length),
+        "Content-Disposition": f'{disposition}; filename="{file_name}"',
+        **validators,
+    }
+    status = 206 if range_header else 200
+    if request.method == "HEAD":
+        # Answered from the cached properties, no media session is opened.
+        return web.Response(status=status, headers=headers)
+
+    ticket = await admit(request, id)
+    if ticket is None:
+        return web.Response(status=429, text="429: Too many streams", headers={"Retry-After": "10"})
+
+    body = await stream_body(id, index, tg_connect, file_id, from_bytes, until_bytes, ticket)
+    return web.Response(status=status, body=body, headers=headers)
+
+async def segment_streamer(request: web.Request, id: int, segment: int, secure_hash: str):
+    """Serves segment n of a file, bytes n*SEGMENT_SIZE_MB MB onwards, as a plain
+    200 response that caches and proxies can keep for good."""
+    index, tg_connect, file_id = await get_file(request, id, secure_hash)
+    segment_size = SEGMENT_SIZE_MB * 1024 * 1024
+    from_bytes = segment * segment_size
+    if from_bytes >= file_id.file_size:
+        raise web.HTTPNotFound(text="Segment not found")
+    until_bytes = min(from_bytes + segment_size, file_id.file_size) - 1
+
+    headers = {
+        "Content-Type": "application/octet-stream",
+        "Content-Length": str(until_bytes - from_bytes + 1),
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{file_id.unique_id}-{segment_size}-{segment}"',
+    }
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        del headers["Content-Length"]
+        return web.Response(status=304, headers=headers)
+    if request.method == "HEAD":
+        return web.Response(headers=headers)
+
+    ticket = await admit(request, id)
+    if ticket is None:
+        return web.Response(status=429, text="429: Too many streams", headers={"Retry-After": "10"})
+    body = await stream_body(id, index, tg_connect, file_id, from_bytes, until_bytes, ticket)
+    return web.Response(body=body, headers=headers)
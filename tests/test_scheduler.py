@@ -0,0 +1,47 @@
+import unittest
+
+from dreamxbotz.util.scheduler import LeastLoadedPolicy, Policy, SimClient, WeightedPolicy, simulate
+
+MB = 1024 * 1024
+
+
+class SimulateTest(unittest.TestCase):
+
+    def test_weighted_moves_streams_to_the_faster_client(self):
+        clients = [SimClient(1 * MB, (1,)), SimClient(8 * MB, (1,))]
+        streams = [(n * 0.5, 8 * MB, 1) for n in range(8)]
+        least_loaded = simulate(LeastLoadedPolicy(), clients, streams)
+        weighted = simulate(WeightedPolicy(), clients, streams)
+
+        # Stream counts alone keep alternating onto the slow client.
+        self.assertEqual(least_loaded.placements, [0, 1, 0, 1, 1, 0, 1, 1])
+        # Once the rates are observed only the first stream stays on it.
+        self.assertEqual(weighted.placements, [0, 1, 1, 1, 1, 1, 1, 1])
+        self.assertLess(weighted.finished, least_loaded.finished / 2)
+        self.assertLess(weighted.mean_completion, least_loaded.mean_completion)
+        self.assertGreater(weighted.throughput, least_loaded.throughput)
+
+    def test_weighted_prefers_a_client_with_a_session_on_the_dc(self):
+        clients = [SimClient(4 * MB, (1,)), SimClient(4 * MB, (2,))]
+        streams = [(0, 4 * MB, 2)]
+        least_loaded = simulate(LeastLoadedPolicy(), clients, streams)
+        weighted = simulate(WeightedPolicy(), clients, streams)
+
+        self.assertEqual(least_loaded.placements, [0])
+        self.assertEqual(weighted.placements, [1])
+        # The session delay is what the least loaded placement pays for.
+        self.assertAlmostEqual(least_loaded.finished - weighted.finished, 1.0, places=6)
+
+    def test_flooded_clients_are_skipped(self):
+        clients = [SimClient(4 * MB, (1,), flood_until=10), SimClient(4 * MB, (1,))]
+        streams = [(0, 4 * MB, 1), (0, 4 * MB, 1)]
+        for policy in (LeastLoadedPolicy(), WeightedPolicy()):
+            self.assertEqual(simulate(policy, clients, streams).placements, [1, 1])
+
+    def test_policies_must_score(self):
+        with self.assertRaises(TypeError):
+            Policy()
+
+
+if __name__ == "__main__":
+    unittest.main()
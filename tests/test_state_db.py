@@ -0,0 +1,47 @@
+import unittest
+
+from database.state_db import MemoryStateBackend, StateBackend
+
+
+class MemoryStateBackendTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.stores = {}
+        # Two "replicas" over one shared store, like two bots on one networked backend.
+        self.first = MemoryStateBackend(max_entries=100, max_bytes=0, ttl=60, stores=self.stores)
+        self.second = MemoryStateBackend(max_entries=100, max_bytes=0, ttl=60, stores=self.stores)
+
+    async def test_namespaces_are_shared_between_replicas(self):
+        fresh = self.first.namespace("fresh")
+        verifications = self.first.namespace("verifications", ttl=30)
+        await fresh.set("-100123-42", "avengers endgame")
+        await verifications.set("7", {"verified": True, "at": "2026-10-17"})
+
+        self.assertEqual(await self.second.namespace("fresh").get("-100123-42"), "avengers endgame")
+        self.assertEqual(
+            await self.second.namespace("verifications").get("7"),
+            {"verified": True, "at": "2026-10-17"},
+        )
+
+        await self.second.namespace("fresh").pop("-100123-42")
+        self.assertIsNone(await fresh.get("-100123-42"))
+        self.assertEqual(await fresh.get("-100123-42", "gone"), "gone")
+
+    async def test_namespaces_do_not_collide(self):
+        await self.first.namespace("fresh").set("key", "search")
+        await self.first.namespace("verifications").set("key", "user")
+        self.assertEqual(await self.second.namespace("fresh").get("key"), "search")
+        self.assertEqual(await self.second.namespace("verifications").get("key"), "user")
+
+    async def test_expired_values_are_dropped(self):
+        expiring = self.first.namespace("verifications", ttl=-1)
+        await expiring.set("7", True)
+        self.assertIsNone(await self.second.namespace("verifications").get("7"))
+
+    def test_backends_must_implement_storage(self):
+        with self.assertRaises(TypeError):
+            StateBackend()
+
+
+if __name__ == "__main__":
+    unittest.main()
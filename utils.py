@@ -16,6 +16,7 @@ import requests
 from shortzy import Shortzy
 
 from plugins.Dreamxfutures.Imdbposter import get_movie_detailsx
+from database.state_db import state
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -44,11 +45,11 @@ class temp(object):
     U_NAME = None
     B_NAME = None
     B_LINK = None
-    SETTINGS = {}
-    GETALL = {}
-    SHORT = {}
-    IMDB_CAP = {}
-    VERIFICATIONS = {}
+    SETTINGS = state.namespace("settings")
+    GETALL = state.namespace("getall")
+    SHORT = state.namespace("short")
+    IMDB_CAP = state.namespace("imdb_cap")
+    VERIFICATIONS = state.namespace("verifications")
     TEMP_INVITE_LINKS = {}
 
 async def is_req_subscribed(bot, user_id, rqfsub_channels):
@@ -389,16 +390,16 @@ async def get_shortlink(link, grp_id, is_second_shortener=False, is_third_shorte
     return link
 
 async def get_settings(group_id):
-    settings = temp.SETTINGS.get(group_id)
+    settings = await temp.SETTINGS.get(group_id)
     if not settings:
         settings = await db.get_settings(group_id)
-        temp.SETTINGS.update({group_id: settings})
+        await temp.SETTINGS.set(group_id, settings)
     return settings
     
 async def save_group_settings(group_id, key, value):
     current = await get_settings(group_id)
     current.update({key: value})
-    temp.SETTINGS.update({group_id: current})
+    await temp.SETTINGS.set(group_id, current)
     await db.update_settings(group_id, current)
 
 def clean_filename(file_name):
@@ -817,7 +818,7 @@ def clean_search_text(search_raw: str) -> str:
 async def get_cap(settings, remaining_seconds, files, query, total_results, search, offset=0):
     try:
         if settings["imdb"]:
-            IMDB_CAP = temp.IMDB_CAP.get(query.from_user.id)
+            IMDB_CAP = await temp.IMDB_CAP.get(query.from_user.id)
             if IMDB_CAP:
                 cap = IMDB_CAP
                 cap += "\n\n<u>Your Requested Files Are Here</u>\n\n</b>"